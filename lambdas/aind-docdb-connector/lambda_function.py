@@ -1,81 +1,436 @@
+import base64
+import datetime
 import json
+import os
+import uuid
+from functools import lru_cache
 
 from aind_data_access_api.document_db import MetadataDbClient
 
 DOCDB_HOST = "api.allenneuraldynamics.org"
 DOCDB_DATABASE = "metadata_index"
 DOCDB_COLLECTION = "data_assets"
-  
 
-docdb_api_client = MetadataDbClient(DOCDB_HOST, DOCDB_DATABASE, DOCDB_COLLECTION)
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+DEFAULT_PROJECTION = {
+    "_id": 1,
+    "name": 1,
+    "location": 1,
+    "created": 1,
+    "last_modified": 1,
+    "data_description": 1,
+}
+# the agent should NOT write to docdb, so pipelines that write are rejected
+WRITE_STAGES = ("$out", "$merge")
+
+# bedrock agents reject action responses over 25KB, and lambda responses over
+# 6MB fail outright, so response bodies are kept under a byte budget
+RESPONSE_MAX_BYTES = int(os.getenv("RESPONSE_MAX_BYTES", 20 * 1024))
+LAMBDA_MAX_BYTES = 5 * 1024 * 1024
+# room left in the budget for the envelope around the encoded items
+ENVELOPE_BYTES = 512
+# results that don't fit can be written to s3://SPILL_BUCKET/SPILL_PREFIX/,
+# spilling is refused when no bucket is set since the lambda's local storage
+# can't be read by the agent
+SPILL_BUCKET = os.getenv("SPILL_BUCKET")
+SPILL_PREFIX = os.getenv("SPILL_PREFIX", "docdb-connector")
+
+# most common values kept per field, and ids sampled, by the footprint action
+FOOTPRINT_TOP_VALUES = 20
+FOOTPRINT_SAMPLE_SIZE = 10
+# matches the sample is drawn from, so grouping their ids stays bounded
+FOOTPRINT_SAMPLE_SCAN = 1000
+
+
+@lru_cache(maxsize=None)
+def get_docdb_api_client():
+    """Creates the docdb client on first use and reuses it when warm"""
+    return MetadataDbClient(DOCDB_HOST, DOCDB_DATABASE, DOCDB_COLLECTION)
+
+
 # enum of possible actions
 class Actions:
     COUNT = "count"
     FILTER = "filter"
     AGGREGATE = "aggregation"
+    FOOTPRINT = "footprint"
+
+
+class BadRequest(ValueError):
+    """Raised when the event has invalid parameters"""
+
+
+def get_param(event, name, default=None):
+    """Gets an event parameter, decoding it if the agent sent JSON text"""
+    value = event.get(name)
+    if value is None or value == "":
+        return default
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            raise BadRequest(f"Parameter {name} is not valid JSON: {value}")
+    return value
+
+
+def encode_cursor(position):
+    """Encodes where the next page starts, {"after": last _id} or
+    {"skip": offset}, as an opaque continuation cursor"""
+    return base64.urlsafe_b64encode(dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decodes a continuation cursor back into where the next page starts"""
+    if not cursor:
+        return {"skip": 0}
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if "after" in position:
+            return {"after": position["after"]}
+        return {"skip": int(position["skip"])}
+    except (ValueError, KeyError, TypeError):
+        raise BadRequest(f"Invalid cursor: {cursor}")
+
+
+def page_query(filter, sort, position):
+    """Builds the filter, sort and skip of the page starting at a cursor
+    position. Without a sort, pages are read in _id order and continue after
+    the last _id seen, so they stay consistent and cheap however deep the
+    agent pages. An explicit sort is paged by offset, with _id breaking ties
+    so the order is stable
+    """
+    if sort is None:
+        if "after" in position:
+            return (
+                {"$and": [filter, {"_id": {"$gt": position["after"]}}]},
+                {"_id": 1},
+                0,
+            )
+        # projections without _id page by offset
+        return filter, {"_id": 1}, position["skip"]
+    if "after" in position:
+        raise BadRequest("cursor does not match the sort")
+    return filter, {**sort, "_id": sort.get("_id", 1)}, position["skip"]
+
+
+class JSONBody(str):
+    """A response body that is already encoded as JSON"""
+
+
+def json_default(value):
+    """Encodes the non-JSON types in records (datetimes, ObjectIds, ...)"""
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+def dumps(value):
+    """Compact JSON encoding that tolerates datetimes in records"""
+    return json.dumps(value, default=json_default, separators=(",", ":"))
+
+
+def encode_bounded(items, max_bytes):
+    """Encodes items one at a time, stopping before the total would pass
+    max_bytes. Returns the encoded items"""
+    chunks = []
+    used = 0
+    for item in items:
+        chunk = dumps(item)
+        size = len(chunk.encode("utf-8")) + 1
+        if used + size > max_bytes:
+            break
+        chunks.append(chunk)
+        used += size
+    return chunks
+
+
+def spill(items):
+    """Writes items that did not fit in the response as JSON lines to S3.
+    Returns a compact summary of where they went"""
+    import boto3
+
+    data = "\n".join(dumps(item) for item in items).encode("utf-8")
+    key = f"{SPILL_PREFIX}/{uuid.uuid4()}.jsonl"
+    boto3.client("s3").put_object(Bucket=SPILL_BUCKET, Key=key, Body=data)
+    return {
+        "uri": f"s3://{SPILL_BUCKET}/{key}",
+        "records": len(items),
+        "bytes": len(data),
+    }
+
+
+def get_budget(event):
+    """Gets the response byte budget, which the event can raise to the limit"""
+    max_bytes = get_param(event, "max_bytes", RESPONSE_MAX_BYTES)
+    if not isinstance(max_bytes, int) or max_bytes <= ENVELOPE_BYTES:
+        raise BadRequest(f"max_bytes must be an integer over {ENVELOPE_BYTES}")
+    return min(max_bytes, LAMBDA_MAX_BYTES)
+
+
+def bounded_body(key, items, event, extra_fields=None):
+    """Encodes items under the event's byte budget, spilling the rest if
+    asked to. extra_fields is called with how many items made it into the
+    body or the spill file, and returns more fields to add to the body"""
+    chunks = encode_bounded(items, get_budget(event) - ENVELOPE_BYTES)
+    consumed = len(chunks)
+    truncated = consumed < len(items)
+    spilled = None
+    if truncated and get_param(event, "spill", False):
+        if not SPILL_BUCKET:
+            raise BadRequest(
+                f"Response truncated after {consumed} of {len(items)} items "
+                "and spilling is not available (SPILL_BUCKET is not set), "
+                "page with the cursor instead"
+            )
+        spilled = spill(items[consumed:])
+        consumed = len(items)
+    elif truncated and not chunks:
+        # a single oversized item: send a stub so paging still makes progress
+        item = items[0]
+        stub = (
+            {
+                "_id": item.get("_id"),
+                "name": item.get("name"),
+                "omitted_bytes": len(dumps(item)),
+            }
+            if isinstance(item, dict)
+            else {"omitted_bytes": len(dumps(item))}
+        )
+        chunks = [dumps(stub)]
+        consumed = 1
+    fields = extra_fields(consumed) if extra_fields else {}
+    fields.update(truncated=truncated, spill=spilled)
+    body = "{" + f'"{key}":[' + ",".join(chunks) + "]," + dumps(fields)[1:]
+    return JSONBody(body)
+
 
 def count_documents(event, context):
-    '''Gets count of all documents'''
-    count = docdb_api_client._count_records()
+    """Gets count of documents, optionally matching a filter"""
+    filter = get_param(event, "filter")
+    count = get_docdb_api_client()._count_records(filter_query=filter)
     print(f"Found {count} records")
     return count
 
 
 def filter_documents(event, context):
-    '''Gets documents that match filter'''
-    # TODO: implement parsing from request
-    # filter = event.get("filter")
+    """Gets one page of documents that match the event's filter
 
-    # temporary filter/ projections
-    filter = {
-        "data_description.project_name": "Thalamus in the Middle"
-    }
-    projection = {
-        "_id": 1,
-        "name": 1,
-        "location": 1,
-        "created": 1,
-        "last_modified": 1,
-        "data_description": 1
+    expects the event to have any of:
+    {
+      "filter": {...},     # mongodb filter, defaults to all records
+      "projection": {...}, # defaults to DEFAULT_PROJECTION
+      "sort": {...},       # e.g. {"created": -1}, defaults to _id order
+      "limit": 100,        # page size, capped at MAX_LIMIT
+      "cursor": "..."      # next_cursor from the previous page
     }
-    limit = 100
-    records = docdb_api_client.retrieve_docdb_records(
-        filter_query=filter,
+    """
+    filter = get_param(event, "filter", {})
+    projection = get_param(event, "projection", DEFAULT_PROJECTION)
+    sort = get_param(event, "sort")
+    limit = get_param(event, "limit", DEFAULT_LIMIT)
+    if not isinstance(filter, dict) or not isinstance(projection, dict):
+        raise BadRequest("filter and projection must be objects")
+    if sort is not None and not isinstance(sort, dict):
+        raise BadRequest("sort must be an object")
+    if not isinstance(limit, int) or limit < 1:
+        raise BadRequest("limit must be a positive integer")
+    limit = min(limit, MAX_LIMIT)
+    keyset = sort is None
+    query, sort, skip = page_query(
+        filter, sort, decode_cursor(event.get("cursor"))
+    )
+
+    # ask for one extra record to know if there is another page
+    records = get_docdb_api_client()._get_records(
+        filter_query=query,
         projection=projection,
-        limit=limit
+        sort=sort,
+        limit=limit + 1,
+        skip=skip,
     )
+    has_more = len(records) > limit
+    records = records[:limit]
     print(f"Found {len(records)} records from filter")
-    return records
+
+    def next_cursor(consumed):
+        """Records that didn't fit in the budget (and weren't spilled) are
+        picked up again by the next cursor"""
+        if not (has_more or consumed < len(records)):
+            return {"next_cursor": None}
+        last = records[consumed - 1] if consumed else {}
+        if keyset and "_id" in last:
+            return {"next_cursor": encode_cursor({"after": last["_id"]})}
+        return {"next_cursor": encode_cursor({"skip": skip + consumed})}
+
+    return bounded_body("records", records, event, extra_fields=next_cursor)
+
 
 def aggregate_documents(event, context):
-    '''Gets first page of OPEN PRs'''
-    raise NotImplementedError("Aggregation not implemented yet")
+    """Runs one page of an aggregation pipeline server-side
+
+    expects the event to have:
+    {
+      "pipeline": [...],   # list of read-only aggregation stages, end it with
+                           # a $sort for the pages to be consistent
+      "limit": 100,        # page size, capped at MAX_LIMIT
+      "cursor": "..."      # next_cursor from the previous page
+    }
+    """
+    pipeline = get_param(event, "pipeline")
+    limit = get_param(event, "limit", DEFAULT_LIMIT)
+    if not isinstance(pipeline, list) or not pipeline:
+        raise BadRequest("pipeline must be a non-empty list of stages")
+    for stage in pipeline:
+        if not isinstance(stage, dict) or any(
+            key in WRITE_STAGES for key in stage
+        ):
+            raise BadRequest(f"Unsupported aggregation stage: {stage}")
+    if not isinstance(limit, int) or limit < 1:
+        raise BadRequest("limit must be a positive integer")
+    limit = min(limit, MAX_LIMIT)
+    position = decode_cursor(event.get("cursor"))
+    if "after" in position:
+        raise BadRequest("cursor does not belong to an aggregation")
+    skip = position["skip"]
+
+    # ask for one extra result to know if there is another page
+    results = get_docdb_api_client().aggregate_docdb_records(
+        pipeline=pipeline + [{"$skip": skip}, {"$limit": limit + 1}]
+    )
+    has_more = len(results) > limit
+    results = results[:limit]
+    print(f"Aggregation returned {len(results)} results")
+
+    def next_cursor(consumed):
+        """Results that didn't fit in the budget (and weren't spilled) are
+        picked up again by the next cursor"""
+        if has_more or consumed < len(results):
+            return {"next_cursor": encode_cursor({"skip": skip + consumed})}
+        return {"next_cursor": None}
+
+    return bounded_body("results", results, event, extra_fields=next_cursor)
+
+
+def footprint_documents(event, context):
+    """Measures how many records a filter affects in one $facet aggregation
+
+    expects the event to have:
+    {
+      "filter": {...},                 # records affected by the issue
+      "fields": ["subject.subject_id"] # optional, dotted fields to group by
+    }
+    and returns the total count, the most common values of each field and a
+    sample of _ids stratified by the first field. The lambda can't import the
+    package, so this mirrors lc_tools.build_footprint_pipeline and
+    parse_footprint, and tests/test_docdb_connector.py checks they agree
+    """
+    filter_query = get_param(event, "filter", {})
+    # agents may send the fields as a JSON list or as comma-separated names
+    fields = event.get("fields") or []
+    if isinstance(fields, str):
+        fields = (
+            get_param(event, "fields")
+            if fields.lstrip().startswith("[")
+            else [
+                field.strip() for field in fields.split(",") if field.strip()
+            ]
+        )
+    if not isinstance(filter_query, dict):
+        raise BadRequest("filter must be an object")
+    if not isinstance(fields, list) or not all(
+        isinstance(field, str) for field in fields
+    ):
+        raise BadRequest("fields must be a list of dotted field names")
+
+    # dotted field names aren't valid facet names, so facets are positional
+    facets = {"count": [{"$count": "count"}]}
+    for i, field in enumerate(fields):
+        facets[f"field_{i}"] = [
+            {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1, "_id": 1}},
+            {"$limit": FOOTPRINT_TOP_VALUES},
+        ]
+    if fields:
+        # only the first matches are grouped, so $push doesn't
+        # collect every _id
+        facets["sample"] = [
+            {"$limit": FOOTPRINT_SAMPLE_SCAN},
+            {
+                "$group": {
+                    "_id": f"${fields[0]}",
+                    "count": {"$sum": 1},
+                    "ids": {"$push": "$_id"},
+                }
+            },
+            {"$sort": {"count": -1, "_id": 1}},
+            {"$limit": FOOTPRINT_SAMPLE_SIZE},
+            {"$project": {"ids": {"$slice": ["$ids", FOOTPRINT_SAMPLE_SIZE]}}},
+        ]
+    else:
+        facets["sample"] = [
+            {"$limit": FOOTPRINT_SAMPLE_SIZE},
+            {"$project": {"ids": ["$_id"]}},
+        ]
+    results = get_docdb_api_client().aggregate_docdb_records(
+        pipeline=[{"$match": filter_query}, {"$facet": facets}]
+    )
+    result = results[0] if results else {}
+
+    # take ids round-robin, so the sample isn't all from the largest value
+    groups = [group.get("ids", []) for group in result.get("sample", [])]
+    sample_ids = [
+        group[i]
+        for i in range(max(map(len, groups), default=0))
+        for group in groups
+        if i < len(group)
+    ]
+    count = result.get("count") or [{"count": 0}]
+    footprint = {
+        "count": count[0]["count"],
+        "histograms": {
+            field: [
+                {"value": bucket["_id"], "count": bucket["count"]}
+                for bucket in result.get(f"field_{i}", [])
+            ]
+            for i, field in enumerate(fields)
+        },
+        "sample_ids": sample_ids[:FOOTPRINT_SAMPLE_SIZE],
+    }
+    print(f"Footprint of {footprint['count']} records")
+    return footprint
+
 
 def lambda_handler(event, context):
-    ''
+    """"""
     print(f"Received lambda event: {event}")
     print(f"Received lambda context: {context}")
 
     # expect event to have format:
     # {
     #   "action": "count" # type of action to perform
+    #   ...               # action parameters, see the action's function
     # }
     action = event.get("action")
-    if action == Actions.COUNT:
-        response = count_documents(event, context)
-    elif action == Actions.FILTER:
-        response = filter_documents(event, context)
-    elif action == Actions.AGGREGATE:
-        response = aggregate_documents(event, context)
-    else:
-        print(f"Unknown action: {action}")
-        return {
-            "statusCode": 400,
-            "body": json.dumps(f"Unknown action: {action}")
-        }
+    try:
+        if action == Actions.COUNT:
+            response = count_documents(event, context)
+        elif action == Actions.FILTER:
+            response = filter_documents(event, context)
+        elif action == Actions.AGGREGATE:
+            response = aggregate_documents(event, context)
+        elif action == Actions.FOOTPRINT:
+            response = footprint_documents(event, context)
+        else:
+            raise BadRequest(f"Unknown action: {action}")
+    except BadRequest as e:
+        print(str(e))
+        return {"statusCode": 400, "body": json.dumps(str(e))}
     return {
-        'statusCode': 200,
-        'body': json.dumps(response)
+        "statusCode": 200,
+        "body": (
+            response if isinstance(response, JSONBody) else dumps(response)
+        ),
     }
 
 
@@ -83,4 +438,4 @@ def lambda_handler(event, context):
 # if __name__ == "__main__":
 #     count_documents(None, None)
 #     filter_documents(None, None)
-#     aggregate_documents(None, None)
\ No newline at end of file
+#     aggregate_documents(None, None)
@@ -1,28 +1,178 @@
-from datetime import datetime
 import json
-import requests
-
-from github import Github
-from github import Auth
 import os
-from pprint import pprint
-import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from urllib.parse import parse_qs, urlparse
+
+import requests
 
 # loadenv
 from dotenv import load_dotenv
+from github import Auth, Github, GithubRetry, InputGitTreeElement
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 load_dotenv()
 
 # https://github.com/AllenNeuralDynamics/aind-scicomp-nautilex
 REPO_NAME = "AllenNeuralDynamics/aind-scicomp-nautilex"
+GITHUB_API_URL = "https://api.github.com"
+PER_PAGE = 100
+PAGE_WORKERS = 4
+# (connect, read) timeout of raw REST calls, in seconds
+REQUEST_TIMEOUT = (10, 30)
+
+# bytes of response bodies kept for conditional requests
+RESPONSE_CACHE_MAX_BYTES = int(
+    os.getenv("RESPONSE_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+)
+
+
+class ResponseCache:
+    """LRU cache of github responses, bounded by the size of their bodies and
+    kept for the life of the container so warm invocations can make
+    conditional requests"""
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        # key -> (size, (etag, last modified, links, body)), oldest first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Gets the (etag, last modified, links, body) of a key, or None"""
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key][1]
+
+    def put(self, key, entry, size):
+        """Caches an entry, evicting least recently used ones past max_bytes"""
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[0]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (size, entry)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (oldest_size, _) = self._entries.popitem(last=False)
+                self.bytes -= oldest_size
+
+
+response_cache = ResponseCache()
+
+
+@lru_cache(maxsize=None)
+def get_github():
+    """Creates the github instance on first use and reuses it when warm"""
+    # auth
+    token = os.getenv("GITHUB_TOKEN", "...")
+    auth = Auth.Token(token)
+    # pooled keep-alive connections, retried with backoff on 5xx and
+    # (secondary) rate limits, honouring Retry-After and X-RateLimit-Reset
+    return Github(
+        auth=auth, retry=GithubRetry(total=5, backoff_factor=1), pool_size=10
+    )
+
+
+@lru_cache(maxsize=None)
+def get_repo():
+    """Gets the repo on first use and reuses it on warm invocations"""
+    return get_github().get_repo(REPO_NAME)
+
+
+@lru_cache(maxsize=None)
+def get_session():
+    """Creates a keep-alive session for raw REST calls on first use, retried
+    with backoff like the Github instance"""
+    session = requests.Session()
+    session.headers.update(
+        {
+            "Authorization": f"Bearer {os.getenv('GITHUB_TOKEN', '...')}",
+            "Accept": "application/vnd.github.v3+json",
+        }
+    )
+    retry = Retry(
+        total=5,
+        backoff_factor=1,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+        respect_retry_after_header=True,
+    )
+    session.mount(
+        "https://", HTTPAdapter(max_retries=retry, pool_maxsize=PAGE_WORKERS)
+    )
+    return session
+
+
+def conditional_get(path, params=None):
+    """Gets a github api path, serving 304 Not Modified replies from the cache.
+    Returns the body and the Link header as {rel: url}"""
+    url = f"{GITHUB_API_URL}/{path}"
+    key = (url, tuple(sorted((params or {}).items())))
+    cached = response_cache.get(key)
+    headers = {}
+    if cached:
+        etag, last_modified, _, _ = cached
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    response = get_session().get(
+        url, params=params, headers=headers, timeout=REQUEST_TIMEOUT
+    )
+    if response.status_code == 304 and cached:
+        return cached[3], cached[2]
+    response.raise_for_status()
+    body = response.json()
+    links = {rel: link["url"] for rel, link in response.links.items()}
+    response_cache.put(
+        key,
+        (
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+            links,
+            body,
+        ),
+        len(response.content),
+    )
+    return body, links
+
 
-# auth
-token = os.getenv('GITHUB_TOKEN', '...')
-auth = Auth.Token(token)
+def paginated_get(path, params=None):
+    """Gets every page of a github listing, fetching the pages after the first
+    concurrently when the first page links to the last one"""
+    params = {**(params or {}), "per_page": PER_PAGE}
+
+    def fetch(page):
+        """Gets one page of the listing"""
+        return conditional_get(path, params={**params, "page": page})
+
+    first_page, links = fetch(1)
+    # copy so extending it doesn't change the cached first page
+    items = list(first_page)
+    last = parse_qs(urlparse(links.get("last", "")).query).get("page")
+    if last:
+        with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as executor:
+            for page_items, _ in executor.map(
+                fetch, range(2, int(last[0]) + 1)
+            ):
+                items.extend(page_items)
+        return items
+    # some listings only link to the next page, follow it serially
+    page = 1
+    while "next" in links:
+        page += 1
+        page_items, links = fetch(page)
+        items.extend(page_items)
+    return items
 
-# github instance
-github = Github(auth=auth)
-repo = github.get_repo(REPO_NAME)
-  
 
 # enum of possible actions
 class Actions:
@@ -33,139 +183,168 @@ class Actions:
     GET_ONE_PULL_REQUEST = "get_one_pull_request"
     CREATE_PULL_REQUEST = "create_pull_request"
 
+
 def get_issues(event, context):
-    '''Gets first page of issues'''
-    issues = repo.get_issues(state="open")
-    first_page = issues.get_page(0)
-    return json.dumps([issue.raw_data for issue in first_page])
+    """Gets all open issues"""
+    issues = paginated_get(
+        f"repos/{REPO_NAME}/issues", params={"state": "open"}
+    )
+    return json.dumps(issues)
+
 
 def get_one_issue(event, context):
-    '''Gets one issue given an issue number'''
+    """Gets one issue given an issue number"""
     # get issue number from event parameters'
-    issue_number = int(event['parameters'][0]['value'])
-    issue = repo.get_issue(issue_number)
-    return json.dumps(issue.raw_data)
+    issue_number = int(event["parameters"][0]["value"])
+    issue, _ = conditional_get(f"repos/{REPO_NAME}/issues/{issue_number}")
+    return json.dumps(issue)
+
 
 def get_branches(event, context):
-    '''Gets first page of branches'''
-    branches = repo.get_branches()
-    first_page = branches.get_page(0)
-    return json.dumps([branch.raw_data for branch in first_page])
+    """Gets all branches"""
+    branches = paginated_get(f"repos/{REPO_NAME}/branches")
+    return json.dumps(branches)
+
 
 def get_pull_requests(event, context):
-    '''Gets first page of OPEN PRs'''
-    pulls = repo.get_pulls(state="open")
-    first_page = pulls.get_page(0)
-    return json.dumps([pr.raw_data for pr in first_page])
+    """Gets all OPEN PRs"""
+    pulls = paginated_get(f"repos/{REPO_NAME}/pulls", params={"state": "open"})
+    return json.dumps(pulls)
+
 
 def get_one_pull_request(event, context):
-    '''Gets one PR given a PR number'''
+    """Gets one PR given a PR number"""
     # get pr number from event parameters'
-    pr_number = int(event['parameters'][0]['value'])
-    pr = repo.get_issue(pr_number)
+    pr_number = int(event["parameters"][0]["value"])
+    pr = get_repo().get_issue(pr_number)
     return json.dumps(pr.raw_data)
 
+
 # create PR with title and body
 def create_pull_request(event, context):
-    '''Creates a PR with code from event body'''
+    """Creates a PR with code from event body"""
+    repo = get_repo()
     # get issue number from input parameters
-    issue_number = int(event['parameters'][0]['value'])
+    issue_number = int(event["parameters"][0]["value"])
     # get source issue
     issue = repo.get_issue(issue_number)
     issue_title = issue.title
     # get the code content from the event body
     # code = event['requestBody']['code']
     code = "print('Hello World')"
-    # create a new branch
     # datetime stamp
     datetime_stamp = datetime.now().strftime("%Y%m%d%H%M%S")
     branch_name = f"autofix-issue-{issue_number}-{datetime_stamp}"
-    repo.create_git_ref(ref=f"refs/heads/{branch_name}", sha=repo.get_branch("main").commit.sha)
-    # create a new folder at root/scripts/{issue_number}-{datetime_stamp}
+    # files go in a new folder at root/scripts/{issue_number}-{datetime_stamp}
     folder_name = f"scripts/{issue_number}-{datetime_stamp}"
-    repo.create_file(path=f"{folder_name}/run.py", message=f"feat: add script for issue {issue_number}", content=code, branch=branch_name)
+    files = {f"{folder_name}/run.py": code}
+    # build one tree and commit for all files on top of the default branch,
+    # then point a new branch at it
+    default_branch = repo.default_branch
+    head = repo.get_branch(default_branch).commit.commit
+    tree = repo.create_git_tree(
+        [
+            InputGitTreeElement(path, "100644", "blob", content=content)
+            for path, content in files.items()
+        ],
+        base_tree=head.tree,
+    )
+    commit = repo.create_git_commit(
+        f"feat: add script for issue {issue_number}", tree, [head]
+    )
+    repo.create_git_ref(ref=f"refs/heads/{branch_name}", sha=commit.sha)
     # create a PR
-    pr = repo.create_pull(title=f"Fix: {issue_title} ({datetime_stamp})", body=f"Auto-fix for issue {issue_number}", head=branch_name, base="main")
+    pr = repo.create_pull(
+        title=f"Fix: {issue_title} ({datetime_stamp})",
+        body=f"Auto-fix for issue {issue_number}",
+        head=branch_name,
+        base=default_branch,
+    )
     # return the PR data
     return json.dumps(pr.raw_data)
 
+
+# (api path, whether it is a prefix, action) per HTTP method, checked in order
+ROUTES = {
+    "GET": [
+        ("/issues", False, Actions.GET_ISSUES),
+        # /issue/{issueNumber}
+        ("/issue/", True, Actions.GET_ONE_ISSUE),
+        ("/branches", False, Actions.GET_BRANCHES),
+        ("/pull-requests", False, Actions.GET_PULL_REQUESTS),
+        # /pull-request/{pullRequestNumber}
+        ("/pull-request/", True, Actions.GET_ONE_PULL_REQUEST),
+    ],
+    "POST": [
+        # /pull-request/{issueNumber}
+        ("/pull-request", True, Actions.CREATE_PULL_REQUEST),
+    ],
+}
+
+ACTION_HANDLERS = {
+    Actions.GET_ISSUES: get_issues,
+    Actions.GET_ONE_ISSUE: get_one_issue,
+    Actions.GET_BRANCHES: get_branches,
+    Actions.GET_PULL_REQUESTS: get_pull_requests,
+    Actions.GET_ONE_PULL_REQUEST: get_one_pull_request,
+    Actions.CREATE_PULL_REQUEST: create_pull_request,
+}
+
+
+def get_action(httpMethod, apiPath):
+    """Finds the action for a method and API path, None if there isn't one"""
+    for path, prefix, action in ROUTES[httpMethod]:
+        if apiPath == path or (prefix and apiPath.startswith(path)):
+            return action
+    return None
+
+
 def lambda_handler(event, context):
-    '''Main lambda handler'''
+    """Main lambda handler"""
     print(f"Received lambda event: {event}")
     print(f"Received lambda context: {context}")
 
     # this lambda can only can be triggered by a Bedrock Agent
     # agent = event['agent']
-    actionGroup = event['actionGroup']
-    apiPath = event['apiPath']
-    httpMethod =  event['httpMethod']
+    actionGroup = event["actionGroup"]
+    apiPath = event["apiPath"]
+    httpMethod = event["httpMethod"]
     # parameters = event.get('parameters', [])
     # requestBody = event.get('requestBody', {})
 
-
     # Extract action from httpMethod and apiPath
-    action = None
-    if httpMethod == "GET":
-        # /issues
-        if apiPath == "/issues":
-            action = Actions.GET_ISSUES
-        # /issue/{issueNumber}
-        elif apiPath.startswith("/issue/"):
-            action = Actions.GET_ONE_ISSUE
-        # /branches
-        elif apiPath == "/branches":
-            action = Actions.GET_BRANCHES
-        # /pull-requests
-        elif apiPath == "/pull-requests":
-            action = Actions.GET_PULL_REQUESTS
-        # /pull-request/{pullRequestNumber}
-        elif apiPath.startswith("/pull-request/"):
-            action = Actions.GET_ONE_PULL_REQUEST
-    elif httpMethod == "POST":
-        # /pull-request/{issueNumber}
-        if apiPath.startswith("/pull-request"):
-            action = Actions.CREATE_PULL_REQUEST
-    else:
+    if httpMethod not in ROUTES:
         print(f"Unsupported HTTP method: {httpMethod}")
         return {
             "statusCode": 400,
-            "body": json.dumps(f"Unsupported HTTP method: {httpMethod}")
+            "body": json.dumps(f"Unsupported HTTP method: {httpMethod}"),
         }
-    
+    action = get_action(httpMethod, apiPath)
+
     # Perform action
-    if action == Actions.GET_ISSUES:
-        response = get_issues(event, context)
-    elif action == Actions.GET_ONE_ISSUE:
-        response = get_one_issue(event, context)
-    elif action == Actions.GET_BRANCHES:
-        response = get_branches(event, context)
-    elif action == Actions.GET_PULL_REQUESTS:
-        response = get_pull_requests(event, context)
-    elif action == Actions.CREATE_PULL_REQUEST:
-        response = create_pull_request(event, context)
-    else:
+    if action is None:
         print(f"Unknown action: {apiPath}")
         return {
             "statusCode": 400,
-            "body": json.dumps(f"Unknown action: {apiPath}")
+            "body": json.dumps(f"Unknown action: {apiPath}"),
         }
+    response = ACTION_HANDLERS[action](event, context)
 
     # this response format is requred for Bedrock agent!
-    responseBody =  {
-        "application/json": {
-            "body": response # "The API {} was called successfully!".format(apiPath)
-        }
-    }
+    responseBody = {"application/json": {"body": response}}
 
     action_response = {
-        'actionGroup': actionGroup,
-        'apiPath': apiPath,
-        'httpMethod': httpMethod,
-        'httpStatusCode': 200,
-        'responseBody': responseBody
+        "actionGroup": actionGroup,
+        "apiPath": apiPath,
+        "httpMethod": httpMethod,
+        "httpStatusCode": 200,
+        "responseBody": responseBody,
     }
 
-    api_response = {'response': action_response, 'messageVersion': event['messageVersion']}
+    api_response = {
+        "response": action_response,
+        "messageVersion": event["messageVersion"],
+    }
     print("Response: {}".format(api_response))
 
     return api_response
@@ -175,4 +354,4 @@ def lambda_handler(event, context):
 # if __name__ == "__main__":
 #     get_issues(None, None)
 #     get_branches(None, None)
-#     get_pull_requests(None, None)
\ No newline at end of file
+#     get_pull_requests(None, None)
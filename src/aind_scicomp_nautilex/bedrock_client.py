@@ -0,0 +1,189 @@
+"""Process-wide Bedrock runtime client, with retries and rate limiting"""
+
+import os
+import threading
+import time
+from typing import Any, Dict
+
+import boto3
+from botocore.config import Config
+
+from aind_scicomp_nautilex.providers import lazy_resource
+from aind_scicomp_nautilex.tracing import record
+
+BEDROCK_REGION = os.getenv("BEDROCK_REGION", "us-west-2")
+# Enough connections for every issue in flight plus the retries of a few
+BEDROCK_MAX_POOL = int(os.getenv("BEDROCK_MAX_POOL", "32"))
+BEDROCK_MAX_ATTEMPTS = int(os.getenv("BEDROCK_MAX_ATTEMPTS", "8"))
+# Streams bound the wait between chunks, plain calls the whole response
+BEDROCK_READ_TIMEOUT = float(os.getenv("BEDROCK_READ_TIMEOUT", "300"))
+# Account quotas for the model, in requests and tokens per minute
+BEDROCK_RPM = float(os.getenv("BEDROCK_RPM", "50"))
+BEDROCK_TPM = float(os.getenv("BEDROCK_TPM", "200000"))
+
+# Rough size of a token, to charge a request before its usage is known
+CHARS_PER_TOKEN = 4
+_LIMITED_OPERATIONS = ("InvokeModel", "InvokeModelWithResponseStream")
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at a per-minute rate.
+
+    The level may go negative when a request turns out to have used more
+    than it was charged, which delays the following requests.
+    """
+
+    def __init__(self, per_minute: float):
+        """
+        Create a full bucket.
+
+        Args:
+            per_minute: Refill rate, also the capacity of the bucket
+        """
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self._level = per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        """Add the tokens accrued since the last update."""
+        now = time.monotonic()
+        self._level = min(
+            self.capacity, self._level + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def acquire(self, amount: float) -> float:
+        """
+        Take tokens, waiting until the bucket holds enough.
+
+        Requests larger than the capacity only wait for a full bucket.
+
+        Args:
+            amount: Tokens to take
+
+        Returns:
+            Seconds spent waiting
+        """
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._level >= amount:
+                    self._level -= amount
+                    return waited
+                delay = (amount - self._level) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def charge(self, amount: float) -> None:
+        """Take (or give back, if negative) tokens without waiting."""
+        with self._lock:
+            self._refill()
+            self._level = min(self.capacity, self._level - amount)
+
+
+class RateLimiter:
+    """Requests- and tokens-per-minute limits of a Bedrock account."""
+
+    def __init__(self, rpm: float = BEDROCK_RPM, tpm: float = BEDROCK_TPM):
+        """
+        Create the limiter.
+
+        Args:
+            rpm: Requests per minute
+            tpm: Input plus output tokens per minute
+        """
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.waited = 0.0
+
+    def acquire(self, estimated_tokens: float) -> None:
+        """Wait for room for one request of about this many tokens."""
+        waited = self.requests.acquire(1) + self.tokens.acquire(
+            estimated_tokens
+        )
+        self.waited += waited
+
+    def settle(self, estimated_tokens: float, actual_tokens: float) -> None:
+        """Correct the charge of a request once its usage is known."""
+        self.tokens.charge(actual_tokens - estimated_tokens)
+
+
+def _before_call(
+    limiter: RateLimiter, params: Dict, context: Dict, **kwargs
+) -> None:
+    """Wait for the limiter before a model call, charging its input size."""
+    body = params.get("body") or b""
+    estimate = len(body) / CHARS_PER_TOKEN
+    context["nautilex_estimated_tokens"] = estimate
+    limiter.acquire(estimate)
+    record(bytes=len(body))
+
+
+def _after_call(
+    limiter: RateLimiter, parsed: Dict, context: Dict, **kwargs
+) -> None:
+    """Charge and trace the actual usage, reported in InvokeModel headers."""
+    headers = parsed.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+    if "x-amzn-bedrock-input-token-count" not in headers:
+        return
+    input_tokens = int(headers["x-amzn-bedrock-input-token-count"])
+    output_tokens = int(headers.get("x-amzn-bedrock-output-token-count", 0))
+    limiter.settle(
+        context.get("nautilex_estimated_tokens", 0),
+        input_tokens + output_tokens,
+    )
+    record(
+        bytes=int(headers.get("content-length", 0)),
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        cached_tokens=int(
+            headers.get("x-amzn-bedrock-cache-read-input-token-count", 0)
+        ),
+    )
+
+
+@lazy_resource
+def get_rate_limiter() -> RateLimiter:
+    """Rate limiter shared by every Bedrock call of the process."""
+    return RateLimiter()
+
+
+@lazy_resource
+def get_bedrock_client() -> Any:
+    """
+    bedrock-runtime client shared by the explorer and the solver.
+
+    Throttled and failed calls are retried in adaptive mode, which also
+    slows the client down while Bedrock keeps throttling. Every model call
+    first waits for the RPM/TPM rate limiter, so concurrent issues queue up
+    locally instead of being throttled. Streamed responses don't report
+    their usage in the headers, callers charge their output tokens with
+    ``get_rate_limiter().tokens.charge``.
+
+    Returns:
+        The boto3 client
+    """
+    config = Config(
+        region_name=BEDROCK_REGION,
+        connect_timeout=20,
+        read_timeout=BEDROCK_READ_TIMEOUT,
+        max_pool_connections=BEDROCK_MAX_POOL,
+        retries={"mode": "adaptive", "max_attempts": BEDROCK_MAX_ATTEMPTS},
+    )
+    client = boto3.client("bedrock-runtime", config=config)
+    limiter = get_rate_limiter()
+    for operation in _LIMITED_OPERATIONS:
+        client.meta.events.register(
+            f"before-call.bedrock-runtime.{operation}",
+            lambda limiter=limiter, **kwargs: _before_call(limiter, **kwargs),
+        )
+        client.meta.events.register(
+            f"after-call.bedrock-runtime.{operation}",
+            lambda limiter=limiter, **kwargs: _after_call(limiter, **kwargs),
+        )
+    return client
@@ -0,0 +1,200 @@
+"""Streaming Bedrock responses, extracting a code block as it arrives"""
+
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+FENCE = "```"
+
+
+@dataclass
+class StreamStats:
+    """Timing and token counts of one streamed response."""
+
+    started: float
+    first_token: Optional[float] = None
+    finished: Optional[float] = None
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+    bytes_received: int = 0
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        """Seconds from sending the request to the first text delta."""
+        return (
+            None
+            if self.first_token is None
+            else self.first_token - self.started
+        )
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        """Output tokens per second, from the first token to the end."""
+        if (
+            self.first_token is None
+            or self.finished is None
+            or self.finished <= self.first_token
+        ):
+            return None
+        return self.output_tokens / (self.finished - self.first_token)
+
+    def summary(self) -> str:
+        """One line for the logs."""
+        ttft = self.time_to_first_token
+        rate = self.tokens_per_second
+        return (
+            f"ttft {'-' if ttft is None else f'{ttft:.2f}s'}, "
+            f"{self.output_tokens} output tokens at "
+            f"{'-' if rate is None else f'{rate:.1f}'} tok/s, "
+            f"{self.input_tokens} input tokens "
+            f"({self.cache_read_tokens} cached)"
+        )
+
+
+class CodeBlockExtractor:
+    """
+    Pulls the first fenced code block out of text fed in chunk by chunk.
+
+    Text is consumed a line at a time, since a fence can be split across
+    chunks. If the reply has no fence at all, as the solver prompt asks,
+    the whole reply is the code once the stream ends.
+    """
+
+    def __init__(self):
+        """Start before any text has arrived."""
+        self._pending = ""
+        self._lines: List[str] = []
+        self._opened = False
+        self._prose: List[str] = []
+        self.code: Optional[str] = None
+
+    @property
+    def closed(self) -> bool:
+        """Whether the code block is complete."""
+        return self.code is not None
+
+    def feed(self, text: str) -> Optional[str]:
+        """
+        Consume a chunk of the reply.
+
+        Args:
+            text: Next text delta
+
+        Returns:
+            The code, without fences, on the chunk that closes the block,
+            None otherwise
+        """
+        if self.closed:
+            return None
+        self._pending += text
+        *lines, self._pending = self._pending.split("\n")
+        for line in lines:
+            if self._line(line):
+                return self.code
+        return None
+
+    def _line(self, line: str) -> bool:
+        """Consume one complete line, returning whether it closed the block."""
+        if line.strip().startswith(FENCE):
+            if self._opened:
+                self.code = "\n".join(self._lines).strip("\n") + "\n"
+                return True
+            # Anything before the opening fence is prose, not code
+            self._opened = True
+            return False
+        (self._lines if self._opened else self._prose).append(line)
+        return False
+
+    def finish(self) -> Optional[str]:
+        """
+        Flush the end of the stream.
+
+        Returns:
+            The code if it wasn't returned by feed already (an unclosed
+            fence, or no fence at all), None otherwise
+        """
+        if self.closed:
+            return None
+        if self._pending:
+            if self._line(self._pending):
+                self._pending = ""
+                return self.code
+            self._pending = ""
+        lines = self._lines if self._opened else self._prose
+        self.code = "\n".join(lines).strip("\n") + "\n"
+        return self.code
+
+
+def stream_message(
+    client: Any,
+    model_id: str,
+    body: Dict,
+    on_code: Optional[Callable[[str], None]] = None,
+    on_first_token: Optional[Callable[[StreamStats], None]] = None,
+) -> Tuple[str, str, StreamStats]:
+    """
+    Call invoke_model_with_response_stream and consume the reply.
+
+    Args:
+        client: bedrock-runtime client
+        model_id: Bedrock model id
+        body: Anthropic messages request body
+        on_code: Called with the code block as soon as it closes, while the
+            rest of the reply is still streaming
+        on_first_token: Called once the first text arrives
+
+    Returns:
+        (full reply text, extracted code, stats)
+    """
+    stats = StreamStats(started=time.monotonic())
+    response = client.invoke_model_with_response_stream(
+        modelId=model_id, body=json.dumps(body)
+    )
+    extractor = CodeBlockExtractor()
+    parts = []
+
+    def emit(code: Optional[str]) -> None:
+        """Hand a completed code block to the callback."""
+        if code is not None and on_code is not None:
+            on_code(code)
+
+    for event in response["body"]:
+        if "chunk" not in event:
+            # Errors such as throttlingException arrive as their own events
+            error = next(iter(event.items()), (None, None))
+            raise RuntimeError(
+                f"Bedrock stream failed with {error[0]}: {error[1]}"
+            )
+        stats.bytes_received += len(event["chunk"]["bytes"])
+        payload = json.loads(event["chunk"]["bytes"])
+        kind = payload.get("type")
+        if kind == "message_start":
+            usage = payload["message"].get("usage", {})
+            stats.input_tokens = usage.get("input_tokens", 0)
+            stats.cache_read_tokens = (
+                usage.get("cache_read_input_tokens", 0) or 0
+            )
+            stats.cache_write_tokens = (
+                usage.get("cache_creation_input_tokens", 0) or 0
+            )
+        elif (
+            kind == "content_block_delta"
+            and payload["delta"].get("type") == "text_delta"
+        ):
+            text = payload["delta"]["text"]
+            if stats.first_token is None:
+                stats.first_token = time.monotonic()
+                if on_first_token is not None:
+                    on_first_token(stats)
+            parts.append(text)
+            emit(extractor.feed(text))
+        elif kind == "message_delta":
+            stats.output_tokens = payload.get("usage", {}).get(
+                "output_tokens", stats.output_tokens
+            )
+    emit(extractor.finish())
+    stats.finished = time.monotonic()
+    return "".join(parts), extractor.code or "", stats
@@ -0,0 +1,114 @@
+"""Measure import-time cold start of each entry point against a budget"""
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, Optional, Tuple
+
+LAMBDAS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "lambdas"
+)
+
+# Seconds allowed for a fresh interpreter to import each entry point. Imports
+# must not create clients, call the network or read the schema context.
+COLD_START_BUDGETS: Dict[str, float] = {
+    "aind_scicomp_nautilex.get_context": 0.2,
+    "aind_scicomp_nautilex.lc_tools": 1.5,
+    "aind_scicomp_nautilex.issue_solver": 1.5,
+    "aind_scicomp_nautilex.issue_explorer": 3.0,
+    "lambdas/aind-docdb-connector": 1.0,
+    "lambdas/aind-github-connector": 1.0,
+}
+
+_TIMER = (
+    "import sys, time; sys.path.insert(0, {path!r}); "
+    "start = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def measure_import(entry_point: str, lambdas_dir: str = LAMBDAS_DIR) -> float:
+    """
+    Import an entry point in a fresh interpreter and time it.
+
+    Args:
+        entry_point: Dotted module name, or "lambdas/<name>" for a lambda
+        lambdas_dir: Folder containing the lambda function folders
+
+    Returns:
+        Import time in seconds
+    """
+    if entry_point.startswith("lambdas/"):
+        path = os.path.join(lambdas_dir, entry_point.split("/", 1)[1])
+        module = "lambda_function"
+    else:
+        path = ""
+        module = entry_point
+    result = subprocess.run(
+        [sys.executable, "-c", _TIMER.format(path=path, module=module)],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def check_budgets(
+    budgets: Optional[Dict[str, float]] = None,
+) -> Dict[str, Tuple[Optional[float], float]]:
+    """
+    Measure every entry point and compare it to its budget.
+
+    Args:
+        budgets: Entry point to budget in seconds, COLD_START_BUDGETS by
+            default
+
+    Returns:
+        Entry point to (measured seconds or None if the import failed, budget)
+    """
+    results = {}
+    for entry_point, budget in (budgets or COLD_START_BUDGETS).items():
+        try:
+            results[entry_point] = (measure_import(entry_point), budget)
+        except subprocess.CalledProcessError as e:
+            print(
+                f"Failed to import {entry_point}: "
+                f"{e.stderr.strip().splitlines()[-1]}"
+            )
+            results[entry_point] = (None, budget)
+    return results
+
+
+def main(argv=None):
+    """Print a cold-start report, exiting non-zero if over any budget."""
+    parser = argparse.ArgumentParser(
+        description=(
+            "Check entry point import times against their cold-start budgets"
+        )
+    )
+    parser.add_argument(
+        "entry_points", nargs="*", help="Entry points to check, all by default"
+    )
+    args = parser.parse_args(argv)
+
+    budgets = COLD_START_BUDGETS
+    if args.entry_points:
+        budgets = {
+            name: COLD_START_BUDGETS.get(name, 1.0)
+            for name in args.entry_points
+        }
+
+    over_budget = False
+    for entry_point, (seconds, budget) in check_budgets(budgets).items():
+        if seconds is None or seconds > budget:
+            over_budget = True
+        measured = "failed" if seconds is None else f"{seconds:.3f}s"
+        status = "OK" if seconds is not None and seconds <= budget else "OVER"
+        print(f"{entry_point:<40} {measured:>8} / {budget:.1f}s  {status}")
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
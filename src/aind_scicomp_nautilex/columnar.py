@@ -0,0 +1,473 @@
+"""Compile MongoDB filters into predicates over columnar batches of records"""
+
+import re
+import threading
+from collections import defaultdict
+from functools import reduce
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aind_scicomp_nautilex.mongo_filter import compile_regex, match_values
+
+# A predicate maps a batch to a bitmask with bit i set when record i matches.
+# Python ints are arbitrary-precision bitsets, so &, | and ~ combine the
+# results of whole clauses at once instead of record by record.
+Predicate = Callable[["ColumnarBatch"], int]
+
+_COMPARISONS = {
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+}
+# Operators answered from a column's distinct values. Anything else, such as
+# $elemMatch or $size, is checked record by record with mongo_filter.
+_COLUMN_OPERATORS = {
+    "$eq",
+    "$ne",
+    "$in",
+    "$nin",
+    "$exists",
+    "$regex",
+    "$not",
+    "$options",
+    *_COMPARISONS,
+}
+_ROW_OPERATORS = {"$elemMatch", "$size", "$all"}
+
+
+_TAGS = {
+    str: "str",
+    int: "number",
+    float: "number",
+    bool: "bool",
+    type(None): "null",
+}
+
+
+def _tag(value: Any) -> Optional[str]:
+    """
+    Type tag a value is keyed under in a column, None if it can't be a key.
+
+    Booleans get their own tag since MongoDB never treats them as equal to
+    numbers, while ints and floats share one.
+    """
+    tag = _TAGS.get(type(value))
+    if tag is None and not isinstance(value, (dict, list, re.Pattern)):
+        tag = type(value).__name__
+    return tag
+
+
+def _mask(positions: Iterable[int], size: int) -> int:
+    """Build a bitmask with the given bits set."""
+    bits = bytearray((size + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, "little")
+
+
+def explode(records: List[Dict], path: str) -> Tuple[List[int], List[Any]]:
+    """
+    Resolve a dotted path across a whole batch, one path part at a time.
+
+    Gives the same values as mongo_filter.resolve_path for every record, but
+    walks each level of the batch in a single loop instead of recursing
+    into each record. Positions and values are kept in two parallel lists
+    rather than as pairs, so no container is allocated per value.
+
+    Args:
+        records: Records of the batch
+        path: Dotted path
+
+    Returns:
+        Record positions and the values found there, in record order
+    """
+    positions = list(range(len(records)))
+    values = records
+    for part in path.split("."):
+        index = int(part) if part.isdigit() else None
+        found_positions, found_values = [], []
+        add_position, add_value = found_positions.append, found_values.append
+        for position, value in zip(positions, values):
+            if isinstance(value, dict):
+                if part in value:
+                    add_position(position)
+                    add_value(value[part])
+            elif isinstance(value, list):
+                if index is not None and index < len(value):
+                    add_position(position)
+                    add_value(value[index])
+                for item in value:
+                    if isinstance(item, dict) and part in item:
+                        add_position(position)
+                        add_value(item[part])
+        positions, values = found_positions, found_values
+    return positions, values
+
+
+class Column:
+    """
+    One dotted path across a batch, exploded into its values.
+
+    Arrays along the path are exploded, so a record contributes every value
+    the path reaches, e.g. each tile's channel name for
+    ``acquisition.tiles.channel.channel_name``. Values are grouped by type
+    tag and then by value, pointing at the records holding them.
+    """
+
+    def __init__(self, records: List[Dict], path: str):
+        """
+        Build the column.
+
+        Args:
+            records: Records of the batch
+            path: Dotted path
+        """
+        self.size = len(records)
+        self.exploded = explode(records, path)
+        self.positions: Dict[str, Dict[Any, List[int]]] = defaultdict(
+            lambda: defaultdict(list)
+        )
+        for position, value in zip(*self.exploded):
+            # Like MongoDB, an array matches through its elements as well
+            for item in (value if isinstance(value, list) else (value,)):
+                tag = _tag(item)
+                if tag is not None:
+                    self.positions[tag][item].append(position)
+        all_records = (1 << self.size) - 1
+        self.missing = all_records & ~_mask(self.exploded[0], self.size)
+        self._values: Optional[List[List[Any]]] = None
+
+    @property
+    def values(self) -> List[List[Any]]:
+        """Values of each record, as resolve_path would return them."""
+        if self._values is None:
+            values = [[] for _ in range(self.size)]
+            for position, value in zip(*self.exploded):
+                values[position].append(value)
+            self._values = values
+        return self._values
+
+    def where(
+        self, test: Callable[[Any], bool], tag: Optional[str] = None
+    ) -> int:
+        """
+        Mask of the records holding at least one value that passes a test.
+
+        The test runs once per distinct value rather than once per record.
+
+        Args:
+            test: Function of a value
+            tag: Only test values with this type tag, e.g. "str"
+
+        Returns:
+            Bitmask of matching records
+        """
+        groups = (
+            [self.positions.get(tag, {})]
+            if tag
+            else list(self.positions.values())
+        )
+        return _mask(
+            (
+                position
+                for group in groups
+                for value, positions in group.items()
+                if test(value)
+                for position in positions
+            ),
+            self.size,
+        )
+
+    def equal(self, target: Any) -> Optional[int]:
+        """Mask for {path: target}, None if target can't be a key."""
+        if isinstance(target, re.Pattern):
+            return self.where(
+                lambda value: bool(target.search(value)), tag="str"
+            )
+        tag = _tag(target)
+        if tag is None:
+            return None
+        mask = _mask(self.positions.get(tag, {}).get(target, ()), self.size)
+        return mask | self.missing if target is None else mask
+
+    def rows(self, condition: Any) -> int:
+        """Mask for any condition, checked record by record."""
+        return _mask(
+            (
+                position
+                for position, values in enumerate(self.values)
+                if match_values(values, condition)
+            ),
+            self.size,
+        )
+
+
+class ColumnarBatch:
+    """
+    A batch of records whose paths are turned into columns on first use.
+
+    Each column is built in a single pass over the batch and then shared by
+    every filter evaluated against it, so checking many filters (e.g. scoring
+    several generated queries) costs one pass per path, not per filter.
+    """
+
+    def __init__(self, records: Iterable[Dict]):
+        """Wrap records, left unmodified."""
+        self.records = list(records)
+        self.size = len(self.records)
+        self.all = (1 << self.size) - 1
+        self._lock = threading.Lock()
+        self._columns: Dict[str, Column] = {}
+
+    def column(self, path: str) -> Column:
+        """The column for a dotted path, built on first use."""
+        if path not in self._columns:
+            with self._lock:
+                if path not in self._columns:
+                    self._columns[path] = Column(self.records, path)
+        return self._columns[path]
+
+    def positions(self, mask: int) -> List[int]:
+        """Positions of the records set in a mask."""
+        bits = bin(mask)[:1:-1]
+        positions = []
+        position = bits.find("1")
+        while position != -1:
+            positions.append(position)
+            position = bits.find("1", position + 1)
+        return positions
+
+    def select(self, mask: int) -> List[Dict]:
+        """Records set in a mask."""
+        return [self.records[position] for position in self.positions(mask)]
+
+    @staticmethod
+    def count(mask: int) -> int:
+        """Number of records set in a mask."""
+        return mask.bit_count()
+
+
+def _compile_in(path: str, argument: Any, condition: Dict) -> Predicate:
+    """Compile {"$in": [...]} as the union of its equalities."""
+    if not isinstance(argument, list):
+        raise ValueError(f"$in needs a list, got {argument!r}")
+    targets = [_compile_equal(path, target) for target in argument]
+    return lambda batch: reduce(
+        lambda mask, target: mask | target(batch), targets, 0
+    )
+
+
+def _compile_negation(operator: str) -> Callable[[str, Any, Dict], Predicate]:
+    """Build the compiler of $ne/$nin from the operator they negate."""
+
+    def compile_negation(
+        path: str, argument: Any, condition: Dict
+    ) -> Predicate:
+        """Compile the complement of the negated operator."""
+        matched = _COMPILERS[operator](path, argument, condition)
+        return lambda batch: batch.all & ~matched(batch)
+
+    return compile_negation
+
+
+def _compile_comparison(
+    operator: str,
+) -> Callable[[str, Any, Dict], Predicate]:
+    """Build the compiler of $gt/$gte/$lt/$lte."""
+    compare = _COMPARISONS[operator]
+
+    def compile_comparison(
+        path: str, argument: Any, condition: Dict
+    ) -> Predicate:
+        """Compare values of the argument's type, or check document rows."""
+        if argument is None:
+            return lambda batch: 0
+        tag = _tag(argument)
+        if tag is None:
+            return lambda batch: batch.column(path).rows({operator: argument})
+        return lambda batch: batch.column(path).where(
+            lambda value: compare(value, argument), tag=tag
+        )
+
+    return compile_comparison
+
+
+def _compile_exists(path: str, argument: Any, condition: Dict) -> Predicate:
+    """Compile {"$exists": bool} from the column's missing records."""
+    if argument:
+        return lambda batch: batch.all & ~batch.column(path).missing
+    return lambda batch: batch.column(path).missing
+
+
+def _compile_regex(path: str, argument: Any, condition: Dict) -> Predicate:
+    """Compile {"$regex": ..., "$options": ...}."""
+    pattern = (
+        argument
+        if isinstance(argument, re.Pattern)
+        else compile_regex(argument, condition.get("$options", ""))
+    )
+    return _compile_equal(path, pattern)
+
+
+def _compile_not(path: str, argument: Any, condition: Dict) -> Predicate:
+    """Compile {"$not": condition}, where a pattern stands for a $regex."""
+    if isinstance(argument, (str, re.Pattern)):
+        argument = {"$regex": argument}
+    matched = _compile_condition(path, argument)
+    return lambda batch: batch.all & ~matched(batch)
+
+
+_COMPILERS: Dict[str, Callable[[str, Any, Dict], Predicate]] = {
+    "$eq": lambda path, argument, condition: _compile_equal(path, argument),
+    "$in": _compile_in,
+    "$ne": _compile_negation("$eq"),
+    "$nin": _compile_negation("$in"),
+    **{operator: _compile_comparison(operator) for operator in _COMPARISONS},
+    "$exists": _compile_exists,
+    "$regex": _compile_regex,
+    "$not": _compile_not,
+}
+
+
+def _compile_operator(
+    path: str, operator: str, argument: Any, condition: Dict
+) -> Predicate:
+    """Compile one operator of a path's condition, already checked."""
+    if operator in _ROW_OPERATORS:
+        return lambda batch: batch.column(path).rows({operator: argument})
+    return _COMPILERS[operator](path, argument, condition)
+
+
+def _compile_equal(path: str, target: Any) -> Predicate:
+    """Compile {path: target}, using rows for documents and arrays."""
+
+    def equal(batch: ColumnarBatch) -> int:
+        """Mask of the records where the path equals target."""
+        column = batch.column(path)
+        mask = column.equal(target)
+        return column.rows(target) if mask is None else mask
+
+    return equal
+
+
+def _compile_condition(path: str, condition: Any) -> Predicate:
+    """Compile the literal or operator condition on one path."""
+    if not (
+        isinstance(condition, dict)
+        and condition
+        and all(str(key).startswith("$") for key in condition)
+    ):
+        return _compile_equal(path, condition)
+    unsupported = set(condition) - _COLUMN_OPERATORS - _ROW_OPERATORS
+    if unsupported:
+        raise ValueError(
+            f"Unsupported query operator: {sorted(unsupported)[0]}"
+        )
+    predicates = [
+        _compile_operator(path, operator, argument, condition)
+        for operator, argument in condition.items()
+        if operator != "$options"
+    ]
+    return lambda batch: reduce(
+        lambda mask, predicate: mask & predicate(batch), predicates, batch.all
+    )
+
+
+def compile_filter(query: Optional[Dict]) -> Predicate:
+    """
+    Compile a MongoDB filter into a predicate over a ColumnarBatch.
+
+    Equality, $in/$nin, $ne, $regex, $exists, comparisons and $not are
+    answered from each column's distinct values and combined as bitmasks
+    with $and/$or/$nor. $elemMatch, $size, $all and comparisons against
+    documents fall back to checking each record of the column. Results are
+    the same as mongo_filter.matches.
+
+    Args:
+        query: MongoDB filter, e.g. one generated by the issue explorer
+
+    Returns:
+        Function of a batch returning the bitmask of matching records
+
+    Raises:
+        ValueError: If the filter uses an operator that isn't supported
+    """
+    predicates = []
+    for key, condition in (query or {}).items():
+        if key in ("$and", "$or", "$nor"):
+            clauses = [compile_filter(clause) for clause in condition]
+            if key == "$and":
+                predicates.append(
+                    lambda batch, clauses=clauses: reduce(
+                        lambda mask, clause: mask & clause(batch),
+                        clauses,
+                        batch.all,
+                    )
+                )
+            else:
+
+                def either(batch, clauses=clauses):
+                    """Mask of the rows matching any of the clauses."""
+                    return reduce(
+                        lambda mask, clause: mask | clause(batch), clauses, 0
+                    )
+
+                predicates.append(
+                    either
+                    if key == "$or"
+                    else lambda batch, either=either: batch.all
+                    & ~either(batch)
+                )
+        elif key.startswith("$"):
+            raise ValueError(f"Unsupported query operator: {key}")
+        else:
+            predicates.append(_compile_condition(key, condition))
+
+    def predicate(batch: ColumnarBatch) -> int:
+        """Bitmask of the records in the batch that match the filter."""
+        mask = batch.all
+        for clause in predicates:
+            if not mask:
+                break
+            mask &= clause(batch)
+        return mask
+
+    return predicate
+
+
+def filter_records(query: Optional[Dict], records) -> List[Dict]:
+    """
+    Select the records matching a MongoDB filter.
+
+    Args:
+        query: MongoDB filter
+        records: Records, or a ColumnarBatch to reuse its columns
+
+    Returns:
+        The matching records, in order
+    """
+    batch = (
+        records
+        if isinstance(records, ColumnarBatch)
+        else ColumnarBatch(records)
+    )
+    return batch.select(compile_filter(query)(batch))
+
+
+def count_matches(query: Optional[Dict], records) -> int:
+    """
+    Count the records matching a MongoDB filter.
+
+    Args:
+        query: MongoDB filter
+        records: Records, or a ColumnarBatch to reuse its columns
+
+    Returns:
+        Number of matching records
+    """
+    batch = (
+        records
+        if isinstance(records, ColumnarBatch)
+        else ColumnarBatch(records)
+    )
+    return batch.count(compile_filter(query)(batch))
@@ -0,0 +1,579 @@
+"""Dry runs of generated migration scripts against records, before any PR"""
+
+import ast
+import copy
+import multiprocessing
+import os
+import re
+import signal
+import socket
+import sys
+import types
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Seconds a single call of the migration callback may take
+RECORD_TIMEOUT = 5.0
+# Records pulled from DocDB when the script's query can be worked out
+DRY_RUN_RECORD_LIMIT = 2000
+MAX_DIFF_PATHS = 20
+MAX_REPR = 80
+
+# Keyword the Migrator takes the callback as
+CALLBACK_KEYWORD = "migration_callback"
+# Module the generated scripts import the Migrator from
+MIGRATOR_PACKAGE = "aind_data_migration_utils"
+MIGRATOR_MODULE = f"{MIGRATOR_PACKAGE}.migrate"
+
+
+@dataclass
+class MigrationScript:
+    """What the dry run needs to know about a generated run.py."""
+
+    source: str
+    callback_name: Optional[str] = None
+    query: Optional[Dict] = None
+    files: Optional[List[str]] = None
+    syntax_error: Optional[str] = None
+
+
+@dataclass
+class RecordResult:
+    """Outcome of running the callback on one record."""
+
+    record_id: Any
+    status: str  # "changed", "unchanged", "error", "timeout" or "network"
+    error: Optional[str] = None
+    diff: List[Tuple[str, str]] = field(default_factory=list)
+
+
+@dataclass
+class DryRunReport:
+    """Summary of a dry run over a set of records."""
+
+    script: MigrationScript
+    results: List[RecordResult] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+
+    def count(self, status: str) -> int:
+        """Number of records with the given status."""
+        return sum(1 for result in self.results if result.status == status)
+
+    @property
+    def noop_rate(self) -> float:
+        """Fraction of records the callback left unchanged."""
+        if not self.results:
+            return 0.0
+        return self.count("unchanged") / len(self.results)
+
+    @property
+    def exercised(self) -> int:
+        """Number of records the callback ran to the end on."""
+        return self.count("changed") + self.count("unchanged")
+
+    @property
+    def ok(self) -> bool:
+        """
+        Whether the script can go up for review as it is.
+
+        A dry run that exercised no records (e.g. the query isn't a literal,
+        or the callback needs the network) can't fail, it is reported as a
+        warning instead.
+        """
+        if self.script.syntax_error or self.script.callback_name is None:
+            return False
+        if self.count("error") or self.count("timeout"):
+            return False
+        # Changing none of the records it ran on means the callback
+        # missed the issue
+        return not self.exercised or self.count("changed") > 0
+
+    def changed_paths(self) -> Counter:
+        """Number of changed records per field, with list indices folded."""
+        paths = Counter()
+        for result in self.results:
+            paths.update(
+                {re.sub(r"\[\d+\]", "[]", path) for path, _ in result.diff}
+            )
+        return paths
+
+    def summary(self, max_items: int = 10) -> str:
+        """
+        Describe the dry run for the regeneration prompt and the PR body.
+
+        Args:
+            max_items: Maximum number of fields and errors listed
+
+        Returns:
+            Plain text summary
+        """
+        if self.script.syntax_error:
+            return f"The script does not parse: {self.script.syntax_error}"
+        if self.script.callback_name is None:
+            return (
+                "No migration_callback was found. The script must define a "
+                "function that takes a record dict and returns it repaired, "
+                "and pass it to the Migrator as migration_callback."
+            )
+
+        lines = [
+            f"Dry run of {self.script.callback_name} on "
+            f"{len(self.results)} records: {self.count('changed')} changed, "
+            f"{self.count('unchanged')} unchanged "
+            f"({self.noop_rate:.1%} no-op), {self.count('error')} failed, "
+            f"{self.count('timeout')} timed out."
+        ]
+        if self.count("network"):
+            lines.append(
+                f"{self.count('network')} records needed the network, which "
+                "dry runs don't allow."
+            )
+        warnings = list(self.warnings)
+        if not self.exercised:
+            warnings.append(
+                "No records were exercised, so the callback is untested. "
+                "Check it by hand before running it."
+            )
+        elif not self.count("changed"):
+            lines.append("The callback did not change any record.")
+        lines.extend(self._path_lines(max_items))
+        lines.extend(self._error_lines(max_items))
+        if warnings:
+            lines.append("Warnings:")
+            lines.extend(f"  {warning}" for warning in warnings[:max_items])
+        return "\n".join(lines)
+
+    def _path_lines(self, max_items: int) -> List[str]:
+        """Summary lines listing the most changed fields."""
+        paths = self.changed_paths()
+        if not paths:
+            return []
+        return ["Changed fields:"] + [
+            f"  {path}: {n} records"
+            for path, n in paths.most_common(max_items)
+        ]
+
+    def _error_lines(self, max_items: int) -> List[str]:
+        """Summary lines listing the most common errors."""
+        errors: Dict[str, List[Any]] = {}
+        for result in self.results:
+            if result.error:
+                errors.setdefault(result.error, []).append(result.record_id)
+        if not errors:
+            return []
+        return ["Errors:"] + [
+            f"  {error} ({len(ids)} records, e.g. _id {ids[0]})"
+            for error, ids in sorted(
+                errors.items(), key=lambda item: -len(item[1])
+            )[:max_items]
+        ]
+
+
+def _literal(node: ast.AST, assignments: Dict[str, ast.AST]) -> Any:
+    """Evaluate a literal, following one level of simple assignment."""
+    if isinstance(node, ast.Name) and node.id in assignments:
+        node = assignments[node.id]
+    try:
+        return ast.literal_eval(node)
+    except (ValueError, TypeError, SyntaxError):
+        return None
+
+
+def inspect_script(source: str) -> MigrationScript:
+    """
+    Find the callback, query and core files of a generated run.py.
+
+    The callback is the ``migration_callback`` passed to the Migrator, or a
+    function named ``migration_callback``, or the only top-level function.
+    The query and files are only known when they are literals (or simple
+    variables holding literals).
+
+    Args:
+        source: Contents of the run.py
+
+    Returns:
+        The script's parts, with ``syntax_error`` set if it does not parse
+    """
+    script = MigrationScript(source=source)
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as e:
+        script.syntax_error = f"{e.msg} (line {e.lineno})"
+        return script
+
+    functions = [
+        node.name for node in tree.body if isinstance(node, ast.FunctionDef)
+    ]
+    _find_migrator_call(tree, script)
+    if script.callback_name is None:
+        if CALLBACK_KEYWORD in functions:
+            script.callback_name = CALLBACK_KEYWORD
+        elif len(functions) == 1:
+            script.callback_name = functions[0]
+    return script
+
+
+def _find_migrator_call(tree: ast.Module, script: MigrationScript) -> None:
+    """Fill in the callback, query and files from the Migrator call."""
+    assignments = {}
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.Assign)
+            and len(node.targets) == 1
+            and isinstance(node.targets[0], ast.Name)
+        ):
+            assignments[node.targets[0].id] = node.value
+
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call):
+            continue
+        keywords = {keyword.arg: keyword.value for keyword in node.keywords}
+        callback = keywords.get(CALLBACK_KEYWORD)
+        if isinstance(callback, ast.Name):
+            script.callback_name = callback.id
+            if "query" in keywords:
+                script.query = _literal(keywords["query"], assignments)
+            if "files" in keywords:
+                script.files = _literal(keywords["files"], assignments)
+            return
+
+
+def diff_records(
+    before: Any, after: Any, path: str = ""
+) -> List[Tuple[str, str]]:
+    """
+    List the structural differences between two versions of a record.
+
+    Args:
+        before: Original value
+        after: Value returned by the callback
+        path: Dotted path of the values, empty for the whole record
+
+    Returns:
+        (path, description) pairs, e.g. ("subject.sex", "'M' -> 'Male'")
+    """
+
+    def short(value: Any) -> str:
+        """Truncated repr of a value."""
+        text = repr(value)
+        return text if len(text) <= MAX_REPR else text[: MAX_REPR - 3] + "..."
+
+    if isinstance(before, dict) and isinstance(after, dict):
+        diffs = []
+        for key in before.keys() | after.keys():
+            child = f"{path}.{key}" if path else str(key)
+            if key not in after:
+                diffs.append((child, "removed"))
+            elif key not in before:
+                diffs.append((child, f"added {short(after[key])}"))
+            else:
+                diffs.extend(diff_records(before[key], after[key], child))
+        return sorted(diffs)
+    if (
+        isinstance(before, list)
+        and isinstance(after, list)
+        and len(before) == len(after)
+    ):
+        diffs = []
+        for i, (old, new) in enumerate(zip(before, after)):
+            diffs.extend(diff_records(old, new, f"{path}[{i}]"))
+        return diffs
+    if before == after and type(before) is type(after):
+        return []
+    return [(path, f"{short(before)} -> {short(after)}")]
+
+
+class _Timeout(BaseException):
+    """
+    Raised in a worker when a callback runs over its time limit.
+
+    Not an Exception, so a callback's own ``except Exception:`` can't
+    swallow it and keep running.
+    """
+
+
+class _NetworkDenied(BaseException):
+    """
+    Raised in a worker when a script tries to open a network connection.
+
+    Not an Exception, so client libraries can't retry it or wrap it in
+    their own connection errors.
+    """
+
+
+def _alarm(signum, frame):
+    """Interrupt a callback that ran over its time limit."""
+    raise _Timeout()
+
+
+def _call_with_timeout(func, timeout: Optional[float], *args):
+    """Call a function, raising _Timeout if it takes longer than timeout."""
+    if not timeout or not hasattr(signal, "setitimer"):
+        return func(*args)
+    previous = signal.signal(signal.SIGALRM, _alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _deny(*args, **kwargs):
+    """Refuse a network connection."""
+    raise _NetworkDenied()
+
+
+def _deny_network() -> None:
+    """
+    Cut this worker process off from the network and from AWS credentials.
+
+    AWS clients get placeholder credentials, so clients created at the top
+    of a script still build, and their calls stop at the denied connection.
+    """
+    for name in [name for name in os.environ if name.startswith("AWS_")]:
+        del os.environ[name]
+    os.environ.update(
+        AWS_ACCESS_KEY_ID="dry-run",
+        AWS_SECRET_ACCESS_KEY="dry-run",
+        AWS_DEFAULT_REGION="us-west-2",
+        AWS_CONFIG_FILE=os.devnull,
+        AWS_SHARED_CREDENTIALS_FILE=os.devnull,
+        AWS_EC2_METADATA_DISABLED="true",
+    )
+    socket.socket.connect = _deny
+    socket.socket.connect_ex = _deny
+    socket.create_connection = _deny
+    socket.getaddrinfo = _deny
+
+
+# Set in each worker process by _load_worker
+_worker: Dict[str, Any] = {}
+
+
+class _StubMigrator:
+    """Stands in for the Migrator in dry runs, so scripts can't reach DocDB."""
+
+    def __init__(self, *args, **kwargs):
+        """Accept and ignore the Migrator's arguments."""
+
+    def run(self, *args, **kwargs) -> None:
+        """Do nothing, the dry run calls the callback itself."""
+
+
+def _stub_migrator() -> None:
+    """Replace the Migrator's module here with one holding _StubMigrator."""
+    stub = types.ModuleType(MIGRATOR_MODULE)
+    stub.Migrator = _StubMigrator
+    try:
+        package = __import__(MIGRATOR_PACKAGE)
+    except ImportError:
+        package = types.ModuleType(MIGRATOR_PACKAGE)
+        package.__path__ = []
+        sys.modules[MIGRATOR_PACKAGE] = package
+    package.migrate = stub
+    sys.modules[MIGRATOR_MODULE] = stub
+
+
+def _load_worker(script: MigrationScript, timeout: Optional[float]) -> None:
+    """
+    Load the script's module in a worker process.
+
+    The Migrator's module is replaced by a stub and the network is denied
+    first, so top-level code such as ``Migrator(...).run()`` or S3 calls
+    can't reach DocDB or AWS. Top-level
+    statements then run one at a time under a name other than
+    ``__main__``, which also skips the script's main block. Statements that
+    fail, e.g. imports that aren't installed or files that only exist next
+    to the real script, are recorded as warnings instead of failing every
+    record.
+    """
+    _stub_migrator()
+    _deny_network()
+    namespace = {"__name__": "nautilex_dry_run", "__file__": "run.py"}
+    warnings = []
+    for node in ast.parse(script.source).body:
+        code = compile(
+            ast.Module(body=[node], type_ignores=[]), "run.py", "exec"
+        )
+        try:
+            _call_with_timeout(exec, timeout, code, namespace)
+        except _Timeout:
+            warnings.append(
+                f"Line {node.lineno} timed out after {timeout}s "
+                "and was skipped"
+            )
+        except _NetworkDenied:
+            warnings.append(
+                f"Line {node.lineno} needs the network, which dry runs don't "
+                "allow, and was skipped"
+            )
+        except Exception as e:
+            warnings.append(
+                f"Line {node.lineno} failed and was skipped: "
+                f"{type(e).__name__}: {e}"
+            )
+    _worker.update(
+        callback=namespace.get(script.callback_name),
+        files=script.files,
+        timeout=timeout,
+        warnings=warnings,
+    )
+
+
+def _worker_warnings() -> List[str]:
+    """Warnings from loading the script in this worker."""
+    return _worker["warnings"]
+
+
+def _apply_callback(record: Dict) -> RecordResult:
+    """Run the callback on one record in a worker and compare the result."""
+    record_id = record.get("_id")
+    callback = _worker["callback"]
+    if not callable(callback):
+        return RecordResult(
+            record_id, "error", "The migration callback is not defined"
+        )
+
+    original = copy.deepcopy(record)
+    try:
+        repaired = _call_with_timeout(callback, _worker["timeout"], record)
+    except _Timeout:
+        return RecordResult(
+            record_id, "timeout", f"Timed out after {_worker['timeout']}s"
+        )
+    except _NetworkDenied:
+        return RecordResult(
+            record_id,
+            "network",
+            "Needs the network, which dry runs don't allow",
+        )
+    except Exception as e:
+        return RecordResult(record_id, "error", f"{type(e).__name__}: {e}")
+
+    if not isinstance(repaired, dict):
+        return RecordResult(
+            record_id,
+            "error",
+            f"Callback returned {type(repaired).__name__}, "
+            "expected the record dict",
+        )
+    if repaired.get("_id") != record_id:
+        return RecordResult(
+            record_id, "error", "Callback changed the record's _id"
+        )
+
+    diff = diff_records(original, repaired)
+    files = _worker["files"]
+    if files:
+        outside = sorted(
+            {path.split(".")[0].split("[")[0] for path, _ in diff} - set(files)
+        )
+        if outside:
+            return RecordResult(
+                record_id,
+                "error",
+                f"Callback changed {', '.join(outside)}, which is not in the "
+                f"Migrator files {files}",
+                diff[:MAX_DIFF_PATHS],
+            )
+    return RecordResult(
+        record_id,
+        "changed" if diff else "unchanged",
+        diff=diff[:MAX_DIFF_PATHS],
+    )
+
+
+def dry_run(
+    script: MigrationScript,
+    records: Iterable[Dict],
+    timeout: Optional[float] = RECORD_TIMEOUT,
+    max_workers: Optional[int] = None,
+) -> DryRunReport:
+    """
+    Apply a script's migration callback to records across a process pool.
+
+    Each worker loads the script once and then runs the callback on its
+    share of the records, so thousands of records take seconds. A callback
+    that hangs on one record only costs that record its timeout.
+
+    Args:
+        script: Script from inspect_script
+        records: Records to run the callback on, left unmodified
+        timeout: Seconds allowed per record, None for no limit
+        max_workers: Worker processes, the number of CPUs by default
+
+    Returns:
+        Per-record results with their exceptions and changes
+    """
+    report = DryRunReport(script=script)
+    if script.syntax_error or script.callback_name is None:
+        return report
+
+    records = list(records)
+    if not records:
+        report.warnings.append("No records to run the callback on")
+        return report
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(records))
+    # Large chunks keep pickling overhead low, while leaving a few chunks
+    # per worker so one slow chunk doesn't hold up the rest
+    chunksize = max(1, len(records) // (max_workers * 4))
+    # Spawned workers don't inherit the caller's threads, locks or clients
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_load_worker,
+        initargs=(script, timeout),
+    ) as executor:
+        report.results = list(
+            executor.map(_apply_callback, records, chunksize=chunksize)
+        )
+        report.warnings = executor.submit(_worker_warnings).result()
+    return report
+
+
+def dry_run_source(
+    source: str,
+    records: Optional[Iterable[Dict]] = None,
+    limit: int = DRY_RUN_RECORD_LIMIT,
+    timeout: Optional[float] = RECORD_TIMEOUT,
+    max_workers: Optional[int] = None,
+) -> DryRunReport:
+    """
+    Dry run a generated run.py, pulling its target records if not given.
+
+    Args:
+        source: Contents of the run.py
+        records: Records to run on, by default up to ``limit`` records
+            matching the script's query are pulled from DocDB
+        limit: Maximum number of records pulled from DocDB
+        timeout: Seconds allowed per record, None for no limit
+        max_workers: Worker processes, the number of CPUs by default
+
+    Returns:
+        The dry run report
+    """
+    script = inspect_script(source)
+    warnings = []
+    if records is None and not (
+        script.syntax_error or script.callback_name is None
+    ):
+        if isinstance(script.query, dict):
+            # Imported here so dry runs on given records don't need DocDB
+            from aind_scicomp_nautilex.lc_tools import iter_docdb_records
+
+            records = iter_docdb_records(script.query, limit=limit)
+        else:
+            warnings.append(
+                "The Migrator query isn't a literal, so no records were "
+                "pulled to test against"
+            )
+            records = []
+    report = dry_run(
+        script, records or [], timeout=timeout, max_workers=max_workers
+    )
+    report.warnings = warnings + report.warnings
+    return report
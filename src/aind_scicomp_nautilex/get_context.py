@@ -1,7 +1,19 @@
-import os
+import argparse
 import ast
-import inspect
-from pydantic import BaseModel, Field
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from aind_scicomp_nautilex.storage import cache_path, write_atomic
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_PATH = cache_path("context_cache.json")
+CACHE_VERSION = 1
+# Below this many changed files, process pool startup costs more than it saves
+MIN_PARALLEL_FILES = 16
+
 
 def _extract_fields_from_class_node(node):
     """Helper function to extract fields from a class AST node."""
@@ -12,21 +24,37 @@ def _extract_fields_from_class_node(node):
             field_type = ast.unparse(subnode.annotation)
 
             # Skip the describedBy and schema_version fields for core models
-            if field_name == "describedBy" or field_name == "schema_version" or field_name == "_DESCRIBED_BY_URL":
+            if (
+                field_name == "describedBy"
+                or field_name == "schema_version"
+                or field_name == "_DESCRIBED_BY_URL"
+            ):
                 continue
 
             # Extract field constraints if using Field(...)
             default_value = ""
             if subnode.value and isinstance(subnode.value, ast.Call):
-                if isinstance(subnode.value.func, ast.Name) and subnode.value.func.id == "Field":
+                if (
+                    isinstance(subnode.value.func, ast.Name)
+                    and subnode.value.func.id == "Field"
+                ):
                     args = [ast.unparse(arg) for arg in subnode.value.args]
-                    kwargs = {kw.arg: ast.unparse(kw.value) for kw in subnode.value.keywords}
+                    kwargs = {
+                        kw.arg: ast.unparse(kw.value)
+                        for kw in subnode.value.keywords
+                    }
                     if args or kwargs:
-                        default_value = f" (default={', '.join(args)}, {', '.join(f'{k}={v}' for k, v in kwargs.items())})"
+                        keywords = ", ".join(
+                            f"{k}={v}" for k, v in kwargs.items()
+                        )
+                        default_value = (
+                            f" (default={', '.join(args)}, {keywords})"
+                        )
 
             fields.append(f"{field_name}: {field_type}{default_value}")
     return fields
 
+
 def extract_pydantic_models_from_file(filepath):
     """Extracts all classes from a Python file."""
     with open(filepath, "r", encoding="utf-8") as f:
@@ -50,8 +78,9 @@ def extract_pydantic_models_from_file(filepath):
 
     return models
 
+
 def extract_top_level_pydantic_models_from_file(filepath):
-    """Extracts only top-level classes from a Python file, excluding those starting with underscore."""
+    """Extracts top-level classes from a Python file, except private ones."""
     with open(filepath, "r", encoding="utf-8") as f:
         tree = ast.parse(f.read(), filename=filepath)
 
@@ -59,14 +88,14 @@ def extract_top_level_pydantic_models_from_file(filepath):
     for node in tree.body:
         if isinstance(node, ast.ClassDef):
             # Skip if class name starts with underscore
-            if node.name.startswith('_'):
+            if node.name.startswith("_"):
                 continue
             # Skip if class inherits from anything other than BaseModel
             if node.bases and len(node.bases) == 1:
                 base = node.bases[0]
                 if not (isinstance(base, ast.Name) and base.id == "BaseModel"):
                     continue
-                    
+
             model_name = node.name
             fields = _extract_fields_from_class_node(node)
             if fields:  # Only add classes that have annotated fields
@@ -75,35 +104,219 @@ def extract_top_level_pydantic_models_from_file(filepath):
     return models
 
 
-def flatten_pydantic_models(src_folder, get_all_models: bool):
-    """Recursively find and extract Pydantic models from a folder."""
+def _parse_file(job):
+    """Parse one file in a worker process, returning its path and models."""
+    filepath, get_all_models = job
+    if get_all_models:
+        return filepath, extract_pydantic_models_from_file(filepath)
+    return filepath, extract_top_level_pydantic_models_from_file(filepath)
+
+
+def _file_digest(filepath):
+    """Hash a file's contents so unchanged files can be reused from cache."""
+    with open(filepath, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _find_model_files(src_folder):
+    """List the .py files to extract models from, in a stable order."""
+    filepaths = []
+    for root, dirs, files in os.walk(src_folder):
+        dirs.sort()
+        for file in sorted(files):
+            if (
+                file.endswith(".py")
+                and "__init__" not in file
+                and "utils" not in file
+            ):
+                filepaths.append(os.path.join(root, file))
+    return filepaths
+
+
+def load_cache(cache_path):
+    """Load the per-file model cache, empty if it's missing or unreadable."""
+    if not cache_path or not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get("version") != CACHE_VERSION:
+        return {}
+    return cache.get("files", {})
+
+
+def save_cache(cache_path, cache):
+    """Atomically write the model cache, dropping entries of deleted files."""
+    for key in [
+        key for key in cache if not os.path.exists(key.split(":", 1)[1])
+    ]:
+        del cache[key]
+    write_atomic(
+        cache_path, json.dumps({"version": CACHE_VERSION, "files": cache})
+    )
+
+
+def collect_models(
+    src_folder, get_all_models: bool, cache=None, max_workers=None
+):
+    """Extract models from every file in a folder, re-parsing changed files.
+
+    Cache entries are reused when a file's mtime and size are unchanged, or
+    failing that when its content hash still matches. Stale files are parsed
+    across a process pool when there are enough of them to be worth it.
+    """
+    if cache is None:
+        cache = {}
+    mode = "all" if get_all_models else "top"
+
+    filepaths = _find_model_files(src_folder)
+    results = {}
+    stale = {}
+    for filepath in filepaths:
+        key = f"{mode}:{os.path.abspath(filepath)}"
+        stat = os.stat(filepath)
+        entry = cache.get(key)
+        if (
+            entry
+            and entry["mtime_ns"] == stat.st_mtime_ns
+            and entry["size"] == stat.st_size
+        ):
+            results[filepath] = entry["models"]
+            continue
+        digest = _file_digest(filepath)
+        if entry and entry["sha256"] == digest:
+            entry.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            results[filepath] = entry["models"]
+            continue
+        stale[filepath] = (key, stat, digest)
+
+    jobs = [(filepath, get_all_models) for filepath in stale]
+    if len(jobs) >= MIN_PARALLEL_FILES and max_workers != 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            parsed = list(executor.map(_parse_file, jobs, chunksize=8))
+    else:
+        parsed = [_parse_file(job) for job in jobs]
+
+    for filepath, models in parsed:
+        key, stat, digest = stale[filepath]
+        models = [[name, parent, fields] for name, parent, fields in models]
+        cache[key] = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": digest,
+            "models": models,
+        }
+        results[filepath] = models
+
     all_models = []
-    for root, _, files in os.walk(src_folder):
-        for file in files:
-            if file.endswith(".py") and not "__init__" in file and not "utils" in file:
-                filepath = os.path.join(root, file)
-                if get_all_models:
-                    models = extract_pydantic_models_from_file(filepath)
-                else:
-                    models = extract_top_level_pydantic_models_from_file(filepath)
-                all_models.extend(models)
+    for filepath in filepaths:
+        all_models.extend(tuple(model) for model in results[filepath])
+    return all_models
+
+
+def flatten_pydantic_models(
+    src_folder, get_all_models: bool, cache=None, max_workers=None
+):
+    """Recursively find and extract Pydantic models from a folder."""
+    all_models = collect_models(
+        src_folder, get_all_models, cache=cache, max_workers=max_workers
+    )
 
     # Format output for LLM context
     output = []
     for model_name, parent_class, fields in all_models:
-        output.append(f"Model: {model_name}{'(' + parent_class + ')' if parent_class else ''}\n" + "\n".join(f"  - {field}" for field in fields))
+        if parent_class:
+            model_name = f"{model_name}({parent_class})"
+        output.append(
+            f"Model: {model_name}\n"
+            + "\n".join(f"  - {field}" for field in fields)
+        )
     return "\n\n".join(output)
 
-if __name__ == "__main__":
 
-    src_folder = "/Users/dan/proj/aind/aind-data-schema/src/aind_data_schema/"  # Adjust if your schema folder is located elsewhere
-    schema_context = flatten_pydantic_models(src_folder, True)
-    with open("/Users/dan/proj/aind/aind-scicomp-nautilex/src/aind_scicomp_nautilex/schema_context.txt", "w", encoding="utf-8") as f:
-        f.write(schema_context)  
-    print("Wrote aind-data-schema context")
-
-    src_folder = "/Users/dan/proj/aind/aind-data-schema-models/src/aind_data_schema_models/"  # Adjust if your schema folder is located elsewhere
-    schema_context = flatten_pydantic_models(src_folder, False)
-    with open("/Users/dan/proj/aind/aind-scicomp-nautilex/src/aind_scicomp_nautilex/models_context.txt", "w", encoding="utf-8") as f:
-        f.write(schema_context)  
-    print("Wrote aind-data-schema-models context")
+def build_context(
+    schema_src,
+    models_src,
+    output_dir=PACKAGE_DIR,
+    cache_path=None,
+    max_workers=None,
+):
+    """Build schema_context.txt and models_context.txt, reusing cached parses.
+
+    Returns the paths of the files that were written.
+    """
+    cache = load_cache(cache_path)
+    written = []
+    for src_folder, get_all_models, filename in (
+        (schema_src, True, "schema_context.txt"),
+        (models_src, False, "models_context.txt"),
+    ):
+        if not src_folder:
+            continue
+        context = flatten_pydantic_models(
+            src_folder, get_all_models, cache=cache, max_workers=max_workers
+        )
+        path = os.path.join(output_dir, filename)
+        write_atomic(path, context)
+        written.append(path)
+    if cache_path:
+        save_cache(cache_path, cache)
+    return written
+
+
+def main(argv=None):
+    """Command line entry point for rebuilding the schema context files."""
+    parser = argparse.ArgumentParser(
+        description=(
+            "Build the aind-data-schema context files used in the LLM prompts"
+        )
+    )
+    parser.add_argument(
+        "--schema-src", help="Path to the aind_data_schema package source"
+    )
+    parser.add_argument(
+        "--models-src",
+        help="Path to the aind_data_schema_models package source",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=PACKAGE_DIR,
+        help="Folder to write the context files to",
+    )
+    parser.add_argument(
+        "--cache",
+        default=DEFAULT_CACHE_PATH,
+        help="Per-file parse cache location",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Re-parse every file and don't update the cache",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Number of parser processes"
+    )
+    args = parser.parse_args(argv)
+
+    if not args.schema_src and not args.models_src:
+        parser.error(
+            "at least one of --schema-src or --models-src is required"
+        )
+
+    start = time.perf_counter()
+    written = build_context(
+        args.schema_src,
+        args.models_src,
+        output_dir=args.output_dir,
+        cache_path=None if args.no_cache else args.cache,
+        max_workers=args.workers,
+    )
+    for path in written:
+        print(f"Wrote {path}")
+    print(f"Built context in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,555 @@
+"""Pooled, retrying GitHub REST client shared by the explorer and solver"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from aind_scicomp_nautilex.providers import lazy_resource
+from aind_scicomp_nautilex.storage import cache_path, write_atomic
+from aind_scicomp_nautilex.tracing import record
+
+GITHUB_API_URL = "https://api.github.com"
+REPO_OWNER = "AllenNeuralDynamics"
+REPO_NAME = "aind-scicomp-nautilex"
+
+MAX_RETRIES = 5
+BACKOFF_FACTOR = 1.0
+MAX_BACKOFF = 60.0
+POOL_SIZE = 10
+PER_PAGE = 100
+PAGE_WORKERS = 4
+
+# (connect, read) timeout in seconds applied to requests that don't set one
+DEFAULT_TIMEOUT = (10.0, 60.0)
+# Methods that can be resent after a failure without repeating a side effect.
+# Others (POST, PATCH) are only resent after a rate limit response, which
+# GitHub sends before acting on the request
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+# GitHub asks clients to wait at least a minute after a secondary rate limit
+# response that carries no Retry-After or reset header
+SECONDARY_RATE_LIMIT_WAIT = 60.0
+
+
+class ResponseCache:
+    """
+    On-disk cache of GitHub GET responses keyed by URL.
+
+    Each entry keeps the response body with its ETag and Last-Modified
+    validators so the next request for the same URL can be conditional.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Create the cache.
+
+        Args:
+            directory: Folder to keep one JSON file per cached URL in
+        """
+        self.directory = directory
+
+    def _path(self, url: str) -> str:
+        """File holding the entry for a URL."""
+        return os.path.join(
+            self.directory, hashlib.sha256(url.encode()).hexdigest() + ".json"
+        )
+
+    def load(self, url: str) -> Optional[Dict]:
+        """Load the cached entry for a URL, or None without a usable one."""
+        try:
+            with open(self._path(url), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("url") == url else None
+
+    def store(
+        self,
+        url: str,
+        headers: Dict,
+        body: Any,
+        links: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """Save a response body with its validators and pagination links."""
+        write_atomic(
+            self._path(url),
+            json.dumps(
+                {
+                    "url": url,
+                    "etag": headers.get("ETag"),
+                    "last_modified": headers.get("Last-Modified"),
+                    "links": links or {},
+                    "body": body,
+                }
+            ),
+        )
+
+
+def _parse_links(response: requests.Response) -> Dict[str, str]:
+    """Map each Link header relation (next, last, ...) to its URL."""
+    return {rel: link["url"] for rel, link in response.links.items()}
+
+
+def _page_number(url: Optional[str]) -> Optional[int]:
+    """Read the page number from a pagination link."""
+    if not url:
+        return None
+    pages = parse_qs(urlparse(url).query).get("page")
+    return int(pages[0]) if pages else None
+
+
+class GitHubClient:
+    """
+    Thin GitHub REST client around a persistent, keep-alive requests.Session.
+
+    Auth headers are set once on the session, connections are pooled and
+    reused across calls. Idempotent requests are retried with exponential
+    backoff on 5xx responses, connection errors and (secondary) rate limits
+    while honouring Retry-After and X-RateLimit-Reset. Other requests, such
+    as posting a comment, are only retried on a 429 or on a 403 carrying
+    Retry-After, since a timeout or 5xx doesn't say whether they took effect.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        base_url: str = GITHUB_API_URL,
+        max_retries: int = MAX_RETRIES,
+        backoff_factor: float = BACKOFF_FACTOR,
+        max_backoff: float = MAX_BACKOFF,
+        pool_size: int = POOL_SIZE,
+        cache: Optional[ResponseCache] = None,
+        timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+    ):
+        """
+        Create the client.
+
+        Args:
+            token: GitHub personal access token
+            base_url: GitHub REST API root
+            max_retries: Number of retries after the first attempt
+            backoff_factor: Base delay in seconds, doubled on every retry
+            max_backoff: Upper bound on a single computed backoff delay
+            pool_size: Number of pooled connections kept alive
+            cache: Response cache used by ``get_json`` for conditional requests
+            timeout: Default (connect, read) timeout in seconds
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.cache = cache
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+
+        self.session = requests.Session()
+        self.session.headers.update(
+            {
+                "Authorization": f"Bearer {token}",
+                "Accept": "application/vnd.github.v3+json",
+                "X-GitHub-Api-Version": "2022-11-28",
+            }
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # Time before which no request should be sent because the primary
+        # rate limit is exhausted
+        self._lock = threading.Lock()
+        self._blocked_until = 0.0
+
+    def url(self, path: str) -> str:
+        """Build an absolute URL from an API path, keeping full URLs."""
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _backoff(self, attempt: int) -> float:
+        """Exponential backoff delay for a retry attempt."""
+        return min(self.backoff_factor * (2**attempt), self.max_backoff)
+
+    def _rate_limit_wait(
+        self, response: requests.Response, attempt: int
+    ) -> Optional[float]:
+        """
+        Work out how long to wait before retrying a rate limited response.
+
+        Returns:
+            Seconds to wait, or None if the response is not a rate limit
+        """
+        if response.status_code not in (403, 429):
+            return None
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None:
+            return float(retry_after)
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            reset = float(response.headers.get("X-RateLimit-Reset", 0))
+            return max(reset - time.time(), 0.0) + 1.0
+        if (
+            response.status_code == 429
+            or "secondary rate limit" in response.text.lower()
+        ):
+            return max(SECONDARY_RATE_LIMIT_WAIT, self._backoff(attempt))
+        return None
+
+    def _retry_wait(
+        self, method: str, response: requests.Response, attempt: int
+    ) -> Optional[float]:
+        """
+        Work out how long to wait before resending a failed request.
+
+        Returns:
+            Seconds to wait, or None if the request shouldn't be resent
+        """
+        if method not in IDEMPOTENT_METHODS:
+            if response.status_code == 429 or (
+                response.status_code == 403
+                and "Retry-After" in response.headers
+            ):
+                return self._rate_limit_wait(response, attempt)
+            return None
+        wait = self._rate_limit_wait(response, attempt)
+        if wait is None and response.status_code >= 500:
+            wait = self._backoff(attempt)
+        return wait
+
+    def _record_rate_limit(self, response: requests.Response) -> None:
+        """Block requests until the reset once the primary limit is used up."""
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            reset = float(response.headers.get("X-RateLimit-Reset", 0))
+            with self._lock:
+                self._blocked_until = max(self._blocked_until, reset)
+
+    def _wait_for_rate_limit(self) -> None:
+        """Sleep until the primary rate limit resets, if it is exhausted."""
+        with self._lock:
+            wait = self._blocked_until - time.time()
+        if wait > 0:
+            time.sleep(wait + 1.0)
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        expected: Iterable[int] = (200,),
+        **kwargs,
+    ) -> requests.Response:
+        """
+        Send a request, retrying transient failures.
+
+        Connection errors and 5xx responses are only retried for idempotent
+        methods, see IDEMPOTENT_METHODS.
+
+        Args:
+            method: HTTP method
+            path: API path (e.g. "repos/owner/name/issues") or full URL
+            expected: Status codes that count as success
+            **kwargs: Passed through to requests.Session.request, timeout
+                defaults to the client's
+
+        Returns:
+            The successful response
+
+        Raises:
+            Exception: If the request still fails after all retries
+        """
+        method = method.upper()
+        expected = tuple(expected)
+        url = self.url(path)
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_rate_limit()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if (
+                    attempt == self.max_retries
+                    or method not in IDEMPOTENT_METHODS
+                ):
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+
+            self._record_rate_limit(response)
+            record(
+                bytes=len(response.content) + len(response.request.body or b"")
+            )
+            if response.status_code in expected:
+                return response
+            if attempt == self.max_retries:
+                break
+
+            wait = self._retry_wait(method, response, attempt)
+            if wait is None:
+                break
+            time.sleep(wait)
+
+        raise Exception(
+            f"GitHub {method} {url} failed: {response.status_code}, "
+            f"{response.text}"
+        )
+
+    def get_json_page(
+        self, path: str, params: Optional[Dict] = None, use_cache: bool = True
+    ) -> Tuple[Any, Dict[str, str]]:
+        """
+        GET a JSON resource, revalidating any cached copy with the server.
+
+        Cached responses are sent back with If-None-Match/If-Modified-Since,
+        and a 304 reply, which doesn't count against the rate limit, is
+        served from the cache.
+
+        Args:
+            path: API path or full URL
+            params: Query parameters, part of the cache key
+            use_cache: Set to False to bypass the cache
+
+        Returns:
+            The decoded JSON body and the Link header as {rel: url}
+        """
+        url = self.url(path)
+        if params:
+            url = f"{url}?{urlencode(sorted(params.items()))}"
+        if not use_cache or self.cache is None:
+            response = self.get(url)
+            return response.json(), _parse_links(response)
+
+        entry = self.cache.load(url)
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = self.get(
+            url, headers=headers, expected=(200, 304) if entry else (200,)
+        )
+        if response.status_code == 304:
+            return entry["body"], entry.get("links", {})
+        body = response.json()
+        links = _parse_links(response)
+        self.cache.store(url, response.headers, body, links)
+        return body, links
+
+    def get_json(
+        self, path: str, params: Optional[Dict] = None, use_cache: bool = True
+    ) -> Any:
+        """GET a JSON resource through the cache, see ``get_json_page``."""
+        return self.get_json_page(path, params=params, use_cache=use_cache)[0]
+
+    def iter_paginated(
+        self,
+        path: str,
+        params: Optional[Dict] = None,
+        per_page: int = PER_PAGE,
+        max_workers: int = PAGE_WORKERS,
+        use_cache: bool = True,
+    ) -> Iterator[Any]:
+        """
+        Stream every item of a paginated listing.
+
+        The first page is fetched on its own to read the last page number
+        from its Link header, then the remaining pages are fetched
+        concurrently. Items are yielded in order as soon as each page
+        arrives, so callers can start before the whole listing is in.
+
+        Args:
+            path: API path of the listing
+            params: Extra query parameters, e.g. {"state": "open"}
+            per_page: Page size, 100 is GitHub's maximum
+            max_workers: Maximum number of pages fetched at once
+            use_cache: Set to False to bypass the response cache
+
+        Yields:
+            Items of the listing
+        """
+        params = {**(params or {}), "per_page": per_page}
+
+        def fetch(page: int) -> Tuple[Any, Dict[str, str]]:
+            """Fetch one page of the listing."""
+            return self.get_json_page(
+                path, params={**params, "page": page}, use_cache=use_cache
+            )
+
+        body, links = fetch(1)
+        yield from body
+
+        last_page = _page_number(links.get("last"))
+        if last_page:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for body, _ in executor.map(fetch, range(2, last_page + 1)):
+                    yield from body
+            return
+
+        # Some listings only advertise the next page, follow it serially
+        page = 1
+        while "next" in links:
+            page += 1
+            body, links = fetch(page)
+            yield from body
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        """Send a GET request, see ``request``."""
+        return self.request("GET", path, **kwargs)
+
+    def post(
+        self, path: str, expected: Iterable[int] = (201,), **kwargs
+    ) -> requests.Response:
+        """Send a POST request, see ``request``."""
+        return self.request("POST", path, expected=expected, **kwargs)
+
+    def put(
+        self, path: str, expected: Iterable[int] = (200, 201), **kwargs
+    ) -> requests.Response:
+        """Send a PUT request, see ``request``."""
+        return self.request("PUT", path, expected=expected, **kwargs)
+
+
+@lazy_resource
+def get_github_client() -> GitHubClient:
+    """Create the shared GitHub client on first use."""
+    token = os.getenv("GITHUB_ACCESS_TOKEN")
+    if not token:
+        raise ValueError(
+            "GitHub access token not found in environment variables"
+        )
+    cache = None
+    if os.getenv("GITHUB_RESPONSE_CACHE", "1") != "0":
+        cache = ResponseCache(cache_path("github"))
+    return GitHubClient(token, cache=cache)
+
+
+def get_github_issues(
+    repo_owner: str = REPO_OWNER, repo_name: str = REPO_NAME
+) -> List[Dict]:
+    """
+    Fetch GitHub issues for the specified repository using a personal access
+    token.
+
+    Args:
+        repo_owner: The owner of the repository
+        repo_name: The name of the repository
+
+    Returns:
+        List of dictionaries containing issue information, across all pages
+    """
+    return list(iter_github_issues(repo_owner=repo_owner, repo_name=repo_name))
+
+
+def iter_github_issues(
+    repo_owner: str = REPO_OWNER,
+    repo_name: str = REPO_NAME,
+    params: Optional[Dict] = None,
+) -> Iterator[Dict]:
+    """
+    Stream every open GitHub issue, fetching pages concurrently.
+
+    Args:
+        repo_owner: The owner of the repository
+        repo_name: The name of the repository
+        params: Extra query parameters, e.g. {"since": "2024-01-01T00:00:00Z"}
+
+    Yields:
+        Dictionaries containing issue information
+    """
+    yield from get_github_client().iter_paginated(
+        f"repos/{repo_owner}/{repo_name}/issues", params=params
+    )
+
+
+def get_github_issue(
+    issue_number: int, repo_owner: str = REPO_OWNER, repo_name: str = REPO_NAME
+) -> Dict:
+    """
+    Fetch a single GitHub issue, revalidating any cached copy.
+
+    Args:
+        issue_number: The number of the issue to fetch
+        repo_owner: The owner of the repository
+        repo_name: The name of the repository
+
+    Returns:
+        Dictionary containing the issue information
+    """
+    return get_github_client().get_json(
+        f"repos/{repo_owner}/{repo_name}/issues/{issue_number}"
+    )
+
+
+def get_changed_issues(
+    since: Optional[str] = None,
+    repo_owner: str = REPO_OWNER,
+    repo_name: str = REPO_NAME,
+) -> List[Dict]:
+    """
+    Fetch only the issues that are new or edited.
+
+    With ``since``, GitHub filters to issues updated at or after that time.
+    Without it, the listing is compared to the issues seen by the previous
+    poll, so an unchanged listing (served from 304s) returns an empty list.
+
+    Args:
+        since: ISO 8601 timestamp, e.g. "2024-01-01T00:00:00Z"
+        repo_owner: The owner of the repository
+        repo_name: The name of the repository
+
+    Returns:
+        List of dictionaries for the new or edited issues
+    """
+    if since is not None:
+        return list(
+            iter_github_issues(repo_owner, repo_name, params={"since": since})
+        )
+
+    seen_path = cache_path(
+        "github", f"{repo_owner}-{repo_name}-seen-issues.json"
+    )
+    try:
+        with open(seen_path, "r", encoding="utf-8") as f:
+            seen = json.load(f)
+    except (OSError, ValueError):
+        seen = {}
+
+    issues = get_github_issues(repo_owner, repo_name)
+    write_atomic(
+        seen_path,
+        json.dumps(
+            {str(issue["number"]): issue["updated_at"] for issue in issues}
+        ),
+    )
+    return [
+        issue
+        for issue in issues
+        if seen.get(str(issue["number"])) != issue["updated_at"]
+    ]
+
+
+def post_github_comment(
+    issue_number: int,
+    comment: str,
+    repo_owner: str = REPO_OWNER,
+    repo_name: str = REPO_NAME,
+) -> None:
+    """
+    Post a comment on a GitHub issue.
+
+    Args:
+        issue_number: The number of the issue to comment on
+        comment: The comment text to post
+        repo_owner: The owner of the repository
+        repo_name: The name of the repository
+    """
+    get_github_client().post(
+        f"repos/{repo_owner}/{repo_name}/issues/{issue_number}/comments",
+        json={"body": comment},
+    )
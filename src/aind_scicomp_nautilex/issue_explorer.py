@@ -1,151 +1,128 @@
-import os
-import requests
 import json
-from typing import List, Dict
-import boto3
-from botocore.config import Config
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
-from aind_scicomp_nautilex.lc_tools import query_docdb
-from langchain_aws import ChatBedrock
-import datetime
-
-
-def load_schema_context(file: str) -> str:
-    """Load the AIND data schema context from file."""
-    schema_file = os.path.join(os.path.dirname(__file__), file)
-    with open(schema_file, "r", encoding="utf-8") as f:
-        return f.read()
+from typing import Callable, Dict, List, Optional, Tuple
 
-schema_context = load_schema_context("schema_context.txt")
-models_context = load_schema_context("models_context.txt")
+from langchain_aws import ChatBedrock
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
+from aind_scicomp_nautilex.bedrock_client import get_bedrock_client
+from aind_scicomp_nautilex.github_client import (
+    get_github_issues,
+    post_github_comment,
+)
+from aind_scicomp_nautilex.llm_cache import (
+    LLM_CACHE,
+    generation_key,
+    lookup,
+    store,
+)
+from aind_scicomp_nautilex.pipeline import MAX_IN_FLIGHT, run_pipeline
+from aind_scicomp_nautilex.prompts import (
+    build_system_blocks,
+    get_schema_block,
+    get_schema_index,
+    prompt_caching,
+    pruned_schema_block,
+)
+from aind_scicomp_nautilex.query_cache import cache_key, parse_query
+from aind_scicomp_nautilex.query_validation import (
+    QueryValidator,
+    count_clauses,
+    estimate_selectivity,
+)
+from aind_scicomp_nautilex.sampling import sample_records
+from aind_scicomp_nautilex.sweep_state import SweepState
+from aind_scicomp_nautilex.tracing import Tracer, traced
 
-query1 = '{{"subject.subject_id": "731015"}}'
-query2 = '{{"subject.breeding_info.breeding_group": "Slc17a6-IRES-Cre;Ai230-hyg(ND)"}}'
-query3 = '{{"data_description.modality.abbreviation": {{"$in": ["ecephys"]}}}}'
+query1 = '{"subject.subject_id": "731015"}'
+query2 = '{"subject.breeding_info.breeding_group": "Slc17a6-IRES-Cre;Ai230-hyg(ND)"}'
+query3 = '{"data_description.modality.abbreviation": {"$in": ["ecephys"]}}'
 
-system_prompt=f"""
+# Task instructions only, the schema context is sent ahead of this as a
+# shared system block, cached on models that support it (see
+# prompts.build_system_blocks)
+system_prompt = f"""
 Your task is to explore the issue provided by the user, which has to do with incorrect metadata stored in our document database. We're going to need to figure out the boundaries of the issue, how many records it affects, and make a suggestion for how the issue should be fixed. 
 
-To help you understand how the data is organized I'm going to provide you with the full list of all models in the aind-data-schema and aind-data-schema-models pydantic packages, which are used to create records. This is a metadata schema built in pydantic and stored in a MongoDB database as JSON. Each record has a top-level "metadata" file that contains 7 files inside of it, "acquisition", "data_description", "procedures", "processing", "quality_control", "rig", "session", and "subject".
-
-Here's the aind-data-schema classes:
-{schema_context}
-
-Here are the aind-data-schema-model classes:
-{models_context}
-
 And here are some examples of how you would make database queries for our metadata:
 filter_query = {query1}
 filter_query = {query2}
 filter_query = {query3}
 """
 
-def get_github_issues(repo_owner: str = "AllenNeuralDynamics", 
-                     repo_name: str = "aind-scicomp-nautilex") -> List[Dict]:
-    """
-    Fetch GitHub issues for the specified repository using a personal access token.
-    
-    Args:
-        repo_owner: The owner of the repository
-        repo_name: The name of the repository
-        
-    Returns:
-        List of dictionaries containing issue information
-    """
-    token = os.getenv("GITHUB_ACCESS_TOKEN")
-    if not token:
-        raise ValueError("GitHub access token not found in environment variables")
-        
-    headers = {
-        "Authorization": f"token {token}",
-        "Accept": "application/vnd.github.v3+json"
-    }
-    
-    url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/issues"
-    
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        raise Exception(f"Failed to fetch issues: {response.status_code}, {response.text}")
-        
-    return response.json()
+MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
+# Part of the cache key of every generation, bump it when replies are used
+# differently so cached ones aren't replayed
+PROMPT_VERSION = 1
 
+# Queries are generated at most this many times per issue, each retry being
+# told what was wrong with the previous one (invalid, or matching nothing)
+MAX_QUERY_ATTEMPTS = 3
 
-def post_github_comment(issue_number: int, comment: str,
-                       repo_owner: str = "AllenNeuralDynamics",
-                       repo_name: str = "aind-scicomp-nautilex") -> None:
-    """
-    Post a comment on a GitHub issue.
-    
-    Args:
-        issue_number: The number of the issue to comment on
-        comment: The comment text to post
-        repo_owner: The owner of the repository
-        repo_name: The name of the repository
-    """
-    token = os.getenv("GITHUB_ACCESS_TOKEN")
-    if not token:
-        raise ValueError("GitHub access token not found in environment variables")
-        
-    headers = {
-        "Authorization": f"token {token}",
-        "Accept": "application/vnd.github.v3+json"
-    }
-    
-    url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/issues/{issue_number}/comments"
-    
-    data = {
-        "body": comment
-    }
-    
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code != 201:
-        raise Exception(f"Failed to post comment: {response.status_code}, {response.text}")
-
-
-def explore_issues_with_bedrock(issues: List[Dict], system_prompt: str) -> List[str]:
+QUERY_FEEDBACK = (
+    "{feedback}\n"
+    "\n"
+    "Fix the query and respond with the same JSON object with a single key "
+    "'query', and no other text."
+)
+
+
+class IssueExplorer:
     """
-    Analyze GitHub issues using LangChain and Amazon Bedrock Claude model.
-    
-    Args:
-        issues: List of GitHub issue dictionaries
-        system_prompt: System prompt to send to Claude
-        
-    Returns:
-        List of Claude's responses as strings
+    Stages of exploring an issue, sharing the chains and settings of a sweep.
+
+    Each stage is a method taking the issue and the previous stage's
+    result, as run_pipeline expects.
     """
-    # Initialize Bedrock Claude via LangChain
-    
-    llm = ChatBedrock(
-        model_id="anthropic.claude-3-sonnet-20240229-v1:0",
-        model_kwargs={"max_tokens": 4096},
-        region_name="us-west-2"
-    )
-    
-    # Create prompt templates for each step
-    query_prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt + """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        prune_schema: bool = False,
+        use_cache: bool = LLM_CACHE,
+    ):
+        """
+        Build the chains of every stage.
+
+        Args:
+            system_prompt: System prompt to send to Claude after the shared
+                schema context block
+            prune_schema: Send only the schema models relevant to each issue
+                instead of the full schema shared by every issue
+            use_cache: Replay cached generations, False to always call Bedrock
+        """
+        self.prune_schema = prune_schema
+        self.use_cache = use_cache
+
+        # Initialize Bedrock Claude via LangChain, on the client
+        # shared with the
+        # solver so connections, retries and the rate limit are shared too
+        llm = ChatBedrock(
+            model_id=MODEL_ID,
+            model_kwargs={"max_tokens": 4096},
+            client=get_bedrock_client(),
+        )
+
+        # Create prompt instructions for each step
+        self.query_instructions = system_prompt + """
         Based on the issue description, create a filter query dictionary (for mongodb, without any projections, aggregations, or modifications) that will help identify affected records.
         
         For example, a query to find all records with the funder "PGA" could be done with 
-        {{
-            "data_description.funding_source": {{
-            "$elemMatch": {{
+        {
+            "data_description.funding_source": {
+            "$elemMatch": {
                 "funder": "PGA"
-            }}
-            }}
-        }}
+            }
+            }
+        }
 
         Note that each record stores the model_dump() of the `Metadata` class containing the seven subfiles, therefore you should NOT start your queries with "metadata". Queries in our database should always use the pattern "file.field.subfield" (etc, as necessary). Make sure to generate queries in PYTHON style, i.e. using True and None (not true and null)
 
         Format your response as a JSON object with a single key 'query' containing the MongoDB query dictionary. Do not include any other text in your response.
-        """),
-        ("user", "{issue_content}")
-    ])
-    
-    analysis_prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt + """
+        """
+
+        self.analysis_instructions = system_prompt + """
         Analyze the query results and the original issue to create a comprehensive understanding of what's occuring and how we will fix it. Note that we won't be using MongoDB directly to fix the issue we'll be using a wrapper to do it that we've developed. The wrapper only needs to be provided with the query, which metadata core files are affected, and a callback function that will modify individual records in the database. The callback function will take a dictionary containing the record and return the same dictionary, with the issue repaired.
 
         Include:
@@ -154,71 +131,257 @@ def explore_issues_with_bedrock(issues: List[Dict], system_prompt: str) -> List[
         3. What simple filter query can be used to retrieve the appropriate records
         4. What metadata core file classes are affected
         5. What your suggested callback function would look like
-        4. Any potential risks or considerations"""),
-        ("user", "Issue: {issue_content}\n\nNumber of records: {query_len}\n\nQuery Results (note that these were truncated at five if there were more): {query_results}")
-    ])
-    
-    json_parser = JsonOutputParser()
-    
-    responses = []
-    for issue in issues:
-        print(f"\nProcessing Issue #{issue['number']}: {issue['title']}")
-        
-        # Step 1: Generate query
-        print("\nStep 1: Generating MongoDB query...")
+        4. Any potential risks or considerations"""
+
+        # System messages are passed in as message objects rather
+        # than templates
+        # so the schema block is sent verbatim and stays cacheable
+        query_prompt = ChatPromptTemplate.from_messages(
+            [
+                MessagesPlaceholder("system"),
+                ("user", "{issue_content}"),
+                # Previous attempts and what was wrong with them
+                MessagesPlaceholder("feedback", optional=True),
+            ]
+        )
+
+        analysis_prompt = ChatPromptTemplate.from_messages(
+            [
+                MessagesPlaceholder("system"),
+                (
+                    "user",
+                    "Issue: {issue_content}\n\nNumber of records: "
+                    "{query_len}\n\nQuery Results (note that these were "
+                    "truncated if there were more, and only include the _id, "
+                    "name, location and the fields referenced by the query): "
+                    "{query_results}",
+                ),
+            ]
+        )
+
+        self.query_chain = query_prompt | llm | JsonOutputParser()
+        self.analysis_chain = analysis_prompt | llm
+
+        self.validator = QueryValidator(get_schema_index())
+
+    def stages(self) -> List[Tuple[str, Callable]]:
+        """The named stages, in the order run_pipeline runs them."""
+        return [
+            ("query_generation", self.generate_query),
+            ("db_execution", self.execute_query),
+            ("analysis", self.analyze),
+            ("post", self.post),
+        ]
+
+    def generate_query(self, issue: Dict, _) -> Dict:
+        """Step 1: Generate a query, refining it until it matches records."""
+        print(
+            f"\nIssue #{issue['number']} Step 1: Generating MongoDB query..."
+        )
         issue_content = f"Title: {issue['title']}\nBody: {issue['body']}"
-        query_chain = query_prompt | llm | json_parser
-        query_result = query_chain.invoke({"issue_content": issue_content})
-        print(f"Generated query: {json.dumps(query_result['query'], indent=2)}")
-        
-        # Step 2: Execute query
-        print("\nStep 2: Executing query against database...")
+        schema_block = (
+            pruned_schema_block(issue_content)
+            if self.prune_schema
+            else get_schema_block()
+        )
+        system = [
+            SystemMessage(
+                content=build_system_blocks(
+                    self.query_instructions,
+                    cache=prompt_caching(MODEL_ID),
+                    schema_block=schema_block,
+                )
+            )
+        ]
+        feedback = []
+        for attempt in range(1, MAX_QUERY_ATTEMPTS + 1):
+            key = generation_key(
+                "query_generation",
+                MODEL_ID,
+                PROMPT_VERSION,
+                self.query_instructions,
+                schema_block,
+                issue,
+                [message.content for message in feedback],
+            )
+            hit, query_result = lookup(key, self.use_cache)
+            if not hit:
+                query_result = self.query_chain.invoke(
+                    {
+                        "system": system,
+                        "issue_content": issue_content,
+                        "feedback": feedback,
+                    }
+                )
+            query = parse_query(query_result["query"])
+            print(
+                f"Issue #{issue['number']} generated query: "
+                f"{json.dumps(query, indent=2)}"
+            )
+            # Unknown fields and malformed operators are caught here, before
+            # any DocDB call, and sent back to the model
+            check = self.validator.validate(query)
+            for warning in check.warnings:
+                print(f"Issue #{issue['number']} query warning: {warning}")
+            if check.ok:
+                estimate_selectivity(check)
+                print(
+                    f"Issue #{issue['number']} found {check.count} "
+                    f"matching records "
+                    f"({check.selectivity or 0:.2%} of {check.total})"
+                )
+                if check.count:
+                    store(key, query_result, self.use_cache)
+                    return {
+                        "issue_content": issue_content,
+                        "schema_block": schema_block,
+                        "query": query,
+                        "check": check,
+                    }
+                # Tell the model which clauses match nothing on their own
+                count_clauses(check)
+            print(
+                f"Issue #{issue['number']} query attempt "
+                f"{attempt}/{MAX_QUERY_ATTEMPTS} needs refining:\n"
+                f"{check.feedback()}"
+            )
+            feedback = feedback + [
+                AIMessage(content=json.dumps(query_result, default=str)),
+                HumanMessage(
+                    content=QUERY_FEEDBACK.format(feedback=check.feedback())
+                ),
+            ]
+        raise ValueError(
+            f"No query matching records after {MAX_QUERY_ATTEMPTS} "
+            f"attempts:\n{check.feedback()}"
+        )
 
-        db_results = query_docdb({
-            "query": query_result['query'],
-        })
-        print(f"Found {len(db_results)} matching records")
+    def execute_query(self, issue: Dict, state: Dict) -> Dict:
+        """Step 2: Fetch a projected sample of the matches."""
+        print(
+            f"\nIssue #{issue['number']} Step 2: "
+            "Executing query against database..."
+        )
+        num_records = state["check"].count
+
+        # Fetch a projected sample of the matches, kept under 10KB while
+        # ensuring at least one result
+        state["query_len"] = num_records
+        with traced("truncation"):
+            state["query_results"] = sample_records(state["query"])
+        return state
+
+    def analyze(self, issue: Dict, state: Dict) -> str:
+        """Step 3: Analyze results and generate response."""
+        print(f"\nIssue #{issue['number']} Step 3: Analyzing results...")
+        # Keyed on a digest of the DB results, so new or fixed records
+        # produce a new analysis
+        key = generation_key(
+            "analysis",
+            MODEL_ID,
+            PROMPT_VERSION,
+            self.analysis_instructions,
+            state["schema_block"],
+            issue,
+            state["query_len"],
+            cache_key(state["query_results"]),
+        )
+        hit, analysis = lookup(key, self.use_cache)
+        if hit:
+            print(f"Issue #{issue['number']} analysis replayed from cache")
+            return analysis
+        analysis = self.analysis_chain.invoke(
+            {
+                "system": [
+                    SystemMessage(
+                        content=build_system_blocks(
+                            self.analysis_instructions,
+                            cache=prompt_caching(MODEL_ID),
+                            schema_block=state["schema_block"],
+                        )
+                    )
+                ],
+                "issue_content": state["issue_content"],
+                "query_results": state["query_results"],
+                "query_len": state["query_len"],
+            }
+        ).content
+        store(key, analysis, self.use_cache)
+        print(f"Issue #{issue['number']} analysis complete")
+        return analysis
+
+    def post(self, issue: Dict, analysis: str) -> str:
+        """Step 4: Post response as comment."""
+        print(
+            f"\nIssue #{issue['number']} Step 4: Posting response to GitHub..."
+        )
+        post_github_comment(issue["number"], analysis)
+        print(f"Issue #{issue['number']} response posted successfully")
+        return analysis
+
+
+def explore_issues_with_bedrock(
+    issues: List[Dict],
+    system_prompt: str,
+    max_in_flight: int = MAX_IN_FLIGHT,
+    prune_schema: bool = False,
+    use_cache: bool = LLM_CACHE,
+    checkpoint: Optional[SweepState] = None,
+    tracer: Optional[Tracer] = None,
+) -> List[Optional[str]]:
+    """
+    Analyze GitHub issues using LangChain and Amazon Bedrock Claude model.
+
+    Issues are processed concurrently and independently, so an issue that
+    fails (e.g. no query matching records after MAX_QUERY_ATTEMPTS
+    refinements) does not abort the rest. Accepted queries and analyses
+    are cached, so rerunning a sweep on unchanged issues and DB results
+    replays them instead of calling Bedrock again.
+
+    Args:
+        issues: List of GitHub issue dictionaries
+        system_prompt: System prompt to send to Claude after the shared
+            schema context block
+        max_in_flight: Maximum number of issues processed at once
+        prune_schema: Send only the schema models relevant to each issue
+            instead of the full schema shared by every issue
+        use_cache: Replay cached generations, False to always call Bedrock
+        checkpoint: Journal of completed stages, issues completed for their
+            current title and body are skipped
+        tracer: Tracer of the sweep's stages, a new one writing to
+            TRACE_DIR by default. Its summary table is printed at the end
+
+    Returns:
+        List of Claude's responses as strings, None for issues that failed
+    """
+    if tracer is None:
+        tracer = Tracer("explore")
+
+    explorer = IssueExplorer(
+        system_prompt, prune_schema=prune_schema, use_cache=use_cache
+    )
+    outcomes = run_pipeline(
+        issues,
+        stages=explorer.stages(),
+        max_in_flight=max_in_flight,
+        # GitHub asks for content-creating requests to be made serially
+        stage_limits={"post": 1},
+        checkpoint=checkpoint,
+        tracer=tracer,
+    )
+    print(tracer.summary())
+    return [outcome.result for outcome in outcomes]
 
-        if len(db_results) == 0:
-            raise ValueError("Failed to generate valid query")
-        
-        num_records = len(db_results)
-
-        # Keep results under 1KB while ensuring at least one result
-        total_bytes = 0
-        truncated_results = []
-        for result in db_results:
-            result_bytes = len(str(result).encode('utf-8'))
-            if total_bytes + result_bytes > (1024*10) and len(truncated_results) >= 1:
-                break
-            truncated_results.append(result)
-            total_bytes += result_bytes
-        db_results = truncated_results
-        
-        # Step 3: Analyze results and generate response
-        print("\nStep 3: Analyzing results...")
-        print(f"\n\nFound {num_records} sending records:\n\n{db_results}")
-        analysis_chain = analysis_prompt | llm
-        analysis = analysis_chain.invoke({
-            "issue_content": issue_content,
-            "query_results": db_results,
-            "query_len": num_records,
-        })
-        print("Analysis complete")
-        
-        # Step 4: Post response as comment
-        print("\nStep 4: Posting response to GitHub...")
-        post_github_comment(issue['number'], analysis.content)
-        responses.append(analysis.content)
-        print("Response posted successfully")
-    
-    return responses
 
 if __name__ == "__main__":
     try:
-        # Get and display all issues
-        issues = get_github_issues()
-        issues = [issues[0]]
+        # Get and display all open issues (the endpoint lists PRs too), the
+        # sweep journal skips the ones explored since their last edit
+        issues = [
+            issue
+            for issue in get_github_issues()
+            if "pull_request" not in issue
+        ]
         print("\nFetched GitHub Issues:")
         for issue in issues:
             print(f"Issue #{issue['number']}: {issue['title']}")
@@ -228,9 +391,13 @@ if __name__ == "__main__":
 
         # Explore issues and post results
         print("\nExploring issues and posting results...")
-        explore_issues_with_bedrock(issues, system_prompt=system_prompt)
+        explore_issues_with_bedrock(
+            issues,
+            system_prompt=system_prompt,
+            checkpoint=SweepState("explore"),
+        )
         print("\nCompleted issue exploration and posted responses to GitHub.")
-    
+
     except Exception as e:
         print(f"Error occurred during issue exploration: {str(e)}")
         raise e
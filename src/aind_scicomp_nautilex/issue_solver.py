@@ -1,24 +1,38 @@
-import os
-import requests
-import json
-from typing import List, Dict
-import boto3
-from botocore.config import Config
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-import base64
-
-
-def load_schema_context(file: str) -> str:
-    """Load the AIND data schema context from file."""
-    schema_file = os.path.join(os.path.dirname(__file__), file)
-    with open(schema_file, "r", encoding="utf-8") as f:
-        return f.read()
-
-schema_context = load_schema_context("schema_context.txt")
-models_context = load_schema_context("models_context.txt")
-
-
-system_prompt=f"""
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aind_scicomp_nautilex.bedrock_client import (
+    get_bedrock_client,
+    get_rate_limiter,
+)
+from aind_scicomp_nautilex.bedrock_stream import StreamStats, stream_message
+from aind_scicomp_nautilex.dry_run import DryRunReport, dry_run_source
+from aind_scicomp_nautilex.github_client import get_github_issues
+from aind_scicomp_nautilex.llm_cache import (
+    LLM_CACHE,
+    generation_key,
+    lookup,
+    store,
+)
+from aind_scicomp_nautilex.pipeline import MAX_IN_FLIGHT, run_pipeline
+from aind_scicomp_nautilex.prompts import (
+    build_system_blocks,
+    prompt_caching,
+    pruned_schema_block,
+)
+from aind_scicomp_nautilex.pull_requests import (
+    PR_MAX_IN_FLIGHT,
+    PullRequestBuilder,
+    PullRequestSpec,
+)
+from aind_scicomp_nautilex.sweep_state import SweepState
+from aind_scicomp_nautilex.tracing import Tracer, record
+
+# Task instructions only, the schema context is sent ahead of this as a
+# shared system block, cached on models that support it (see
+# prompts.build_system_blocks)
+system_prompt = """
 Your task is to solve this issue using the aind-data-migration-utils package. You will need to provide a query, a migration_callback, and a set of metadata core files to limit use to. You should return a run.py file (and ONLY the contents of the run.py, no extra context) which will solve the issue. Your run.py file should look something like this example file:
 
 from aind_data_migration_utils.migrate import Migrator
@@ -37,7 +51,8 @@ def repair_processing(record: dict) -> dict:
 
     location = record['location']
 
-    # location looks like s3://codeocean-s3datasetsbucket-1u41qdg42ur9/d48ec453-4cd6-47b7-8ad0-c08176bb42c1
+    # location looks like s3://codeocean-s3datasetsbucket-
+    # 1u41qdg42ur9/d48ec453-4cd6-47b7-8ad0-c08176bb42c1
     # separate the bucket and key prefix
     bucket_name, object_key = location.split('/')[2], '/'.join(location.split('/')[3:])
 
@@ -48,13 +63,13 @@ def repair_processing(record: dict) -> dict:
 
     # Check that the response succeeded
     if response['ResponseMetadata']['HTTPStatusCode'] != 200:
-        raise ValueError(f"Failed to retrieve processing data from {{location}}")
+        raise ValueError(f"Failed to retrieve processing data from {location}")
 
     # # Read and parse JSON content
     json_content = response['Body'].read().decode('utf-8')  # Read and decode bytes
     processing_data = json.loads(json_content)  # Convert JSON string to dictionary
 
-    logging.info(f"Retrieved processing data from {{location}} for record {{record['_id']}}")
+    logging.info(f"Retrieved processing data from {location} for record {record['_id']}")
 
     record["processing"] = processing_data
 
@@ -71,14 +86,14 @@ if __name__ == "__main__":
     # Split into batches of 100 mangled records
     for i in range(0, len(mangled_data), 150):
         mangled_data_batch = mangled_data[i:i + 150]
-        query = {{
-            "_id": {{"$in": mangled_data_batch['record_id'].tolist()}}
-        }}
+        query = {
+            "_id": {"$in": mangled_data_batch['record_id'].tolist()}
+        }
         migrator = Migrator(
             query=query,
             migration_callback=repair_processing,
             files=["processing"],
-            path=f"./{{i}}_repair_processing",
+            path=f"./{i}_repair_processing",
             prod=not args.dev,
         )
 
@@ -89,200 +104,367 @@ if __name__ == "__main__":
         if args.full_run:
             migrator.run(full_run=True, test_mode=args.test)
 
-To help you understand how the data is organized I'm going to provide you with the full list of all models in the aind-data-schema and aind-data-schema-models pydantic packages, which are used to create records. This is a metadata schema built in pydantic and stored in a MongoDB database as JSON. Each record has a top-level "metadata" file that contains 7 files inside of it, "acquisition", "data_description", "procedures", "processing", "quality_control", "rig", "session", and "subject". Not all records use all these fields, and you should be careful to use the files parameter on the Migrator to only select for files that you actually need to make changes to. Be VERY CAREFUL to modify a real field in the metadata when you create your migration_callback function!
-
-Here's the aind-data-schema classes:
-{schema_context}
-
-Here are the aind-data-schema-model classes:
-{models_context}
+Not all records use all these fields, and you should be careful to use the files parameter on the Migrator to only select for files that you actually need to make changes to. Be VERY CAREFUL to modify a real field in the metadata when you create your migration_callback function!
 
 Create the run.py to solve the issue and return the contents of the file. DO NOT provide any other text in your response, you should only return python code.
 """
 
-def get_github_issues(repo_owner: str = "AllenNeuralDynamics", 
-                     repo_name: str = "aind-scicomp-nautilex") -> List[Dict]:
-    """
-    Fetch GitHub issues for the specified repository using a personal access token.
-    
-    Args:
-        repo_owner: The owner of the repository
-        repo_name: The name of the repository
-        
-    Returns:
-        List of dictionaries containing issue information
-    """
-    token = os.getenv("GITHUB_ACCESS_TOKEN")
-    if not token:
-        raise ValueError("GitHub access token not found in environment variables")
-        
-    headers = {
-        "Authorization": f"token {token}",
-        "Accept": "application/vnd.github.v3+json"
-    }
-    
-    url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/issues"
-    
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        raise Exception(f"Failed to fetch issues: {response.status_code}, {response.text}")
-        
-    return response.json()
-
-
-def create_pr_with_script(file_contents: str, issue_number: int,
-                         repo_owner: str = "AllenNeuralDynamics",
-                         repo_name: str = "aind-scicomp-nautilex") -> None:
+MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
+# Part of the cache key of every generation, bump it when replies are used
+# differently so cached ones aren't replayed
+PROMPT_VERSION = 1
+
+# Scripts are generated at most this many times per issue, each retry being
+# told what went wrong in the previous script's dry run
+MAX_SCRIPT_ATTEMPTS = 3
+
+DRY_RUN_FEEDBACK = (
+    "A dry run of your run.py against the affected records found problems:\n"
+    "\n"
+    "{summary}\n"
+    "\n"
+    "Fix the problems and return the complete corrected run.py. DO NOT "
+    "provide any other text in your response, you should only return python "
+    "code."
+)
+
+
+def create_pr_with_script(
+    file_contents: str,
+    issue_number: int,
+    repo_owner: str = "AllenNeuralDynamics",
+    repo_name: str = "aind-scicomp-nautilex",
+    builder: Optional[PullRequestBuilder] = None,
+    dry_run_summary: Optional[str] = None,
+) -> Dict:
     """
     Creates a new branch, adds a timestamped script folder with run.py,
     and opens a PR linked to the issue.
-    
+
+    All files go up in a single commit through the Git Data API.
+
     Args:
         file_contents: Contents to write to run.py
         issue_number: GitHub issue number to link the PR to
         repo_owner: The owner of the repository
         repo_name: The name of the repository
+        builder: PR builder to reuse the default branch lookup of, a new
+            one is created if not given
+        dry_run_summary: Result of the script's dry run, added to the PR
+            description
+
+    Returns:
+        The created pull request
     """
-    token = os.getenv("GITHUB_ACCESS_TOKEN")
-    if not token:
-        raise ValueError("GitHub access token not found in environment variables")
-        
-    # Add debugging to check token and response
-    headers = {
-        "Authorization": f"Bearer {token}",  # Changed from "token" to "Bearer"
-        "Accept": "application/vnd.github.v3+json"
-    }
-
-    # Get default branch
-    url = f"https://api.github.com/repos/{repo_owner}/{repo_name}"
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        print(f"GitHub API Response: {response.text}")  # Add debug logging
-        raise Exception(f"Failed to get repo info: {response.status_code}")
-    default_branch = response.json()["default_branch"]
+    if builder is None:
+        builder = PullRequestBuilder(repo_owner, repo_name)
 
     # Create new branch name with timestamp
     timestamp = datetime.now().isoformat().replace(":", "-")
     branch_name = f"fix/issue-{issue_number}-{timestamp}"
-    
-    # Get default branch SHA
-    url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/git/refs/heads/{default_branch}"
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        raise Exception(f"Failed to get SHA: {response.status_code}")
-    sha = response.json()["object"]["sha"]
-
-    # Create new branch
-    url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/git/refs"
-    data = {
-        "ref": f"refs/heads/{branch_name}",
-        "sha": sha
-    }
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code != 201:
-        raise Exception(f"Failed to create branch: {response.status_code}")
-
-    # Create file
+
     folder_name = f"scripts/{timestamp}"
-    file_path = f"{folder_name}/run.py"
-    url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/contents/{file_path}"
-    
-    data = {
-        "message": f"Add script for issue #{issue_number}",
-        "content": base64.b64encode(file_contents.encode()).decode(),
-        "branch": branch_name
-    }
-    response = requests.put(url, headers=headers, json=data)
-    if response.status_code != 201:
-        raise Exception(f"Failed to create file: {response.status_code}")
-
-    # Create PR
-    url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/pulls"
-    data = {
-        "title": f"Fix for issue #{issue_number}",
-        "body": f"Resolves #{issue_number}",
-        "head": branch_name,
-        "base": default_branch
-    }
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code != 201:
-        raise Exception(f"Failed to create PR: {response.status_code}")
-
-
-def analyze_issues_with_bedrock(issues: List[Dict], system_prompt: str) -> List[str]:
+    files = {f"{folder_name}/run.py": file_contents}
+
+    body = f"Resolves #{issue_number}"
+    if dry_run_summary:
+        body += f"\n\n## Dry run\n\n```\n{dry_run_summary}\n```"
+
+    return builder.create(
+        PullRequestSpec(
+            files=files,
+            branch_name=branch_name,
+            title=f"Fix for issue #{issue_number}",
+            body=body,
+            commit_message=f"Add script for issue #{issue_number}",
+        )
+    )
+
+
+class IssueSolver:
     """
-    Analyze GitHub issues using Amazon Bedrock Claude model.
-    
-    Args:
-        issues: List of GitHub issue dictionaries
-        system_prompt: System prompt to send to Claude
-        
-    Returns:
-        List of Claude's responses as strings
+    Stages of solving an issue, sharing the clients and settings of a sweep.
+
+    Each stage is a method taking the issue and the previous stage's
+    result, as run_pipeline expects. Call close once the sweep is done to
+    cancel the dry runs still queued.
     """
-        
-    # Create bedrock client with increased timeout
-    config = Config(
-        region_name='us-west-2',
-        connect_timeout=20,  # a short time
-        read_timeout=2400,     # a long time
-        retries={'max_attempts': 1}
-    )
-    bedrock = boto3.client('bedrock-runtime', config=config)
-    
-    responses = []
-    
-    for issue in issues:
-        # Combine issue content into a single string
-        issue_content = f"Title: {issue['title']}\nBody: {issue['body']}"
-        
-        # Prepare the prompt
-        combined_prompt = f"{system_prompt}\n\nIssue Content:\n{issue_content}"
-        
-        # Call Bedrock Claude
+
+    def __init__(
+        self,
+        system_prompt: str,
+        prune_schema: bool = False,
+        use_cache: bool = LLM_CACHE,
+    ):
+        """
+        Create the clients shared by every issue.
+
+        Args:
+            system_prompt: System prompt to send to Claude after the shared
+                schema context block
+            prune_schema: Send only the schema models relevant to each issue
+                instead of the full schema shared by every issue
+            use_cache: Replay cached scripts, False to always call Bedrock
+        """
+        self.system_prompt = system_prompt
+        self.prune_schema = prune_schema
+        self.use_cache = use_cache
+
+        # Shared with the explorer, retried adaptively and rate limited
+        self.bedrock = get_bedrock_client()
+
+        # Built once and shared by every issue so the schema prefix
+        # can be cached
+        self.shared_system_blocks = build_system_blocks(
+            system_prompt, cache=prompt_caching(MODEL_ID)
+        )
+
+        # A dry run already spreads over every CPU, so they run one at a time,
+        # started from the streams as soon as a script is complete
+        self.dry_runs = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="dry-run"
+        )
+
+        # Shared by every PR in this sweep so the default branch is
+        # looked up once
+        self.pr_builder = PullRequestBuilder()
+
+    def stages(self) -> List[Tuple[str, Callable]]:
+        """The named stages, in the order run_pipeline runs them."""
+        return [
+            ("solve", self.generate_script),
+            ("dry_run", self.check_script),
+            ("pr_create", self.open_pr),
+        ]
+
+    def close(self) -> None:
+        """Cancel the dry runs that haven't started."""
+        self.dry_runs.shutdown(wait=False, cancel_futures=True)
+
+    def invoke(
+        self, issue: Dict, system_blocks: List[Dict], messages: List[Dict]
+    ) -> Tuple[str, Future, str]:
+        """
+        Stream one conversation from Bedrock, or replay it from the cache.
+
+        Returns the run.py without any markdown fences, the future of its
+        dry run, started as soon as the code block closed, and the key to
+        cache the script under once it passes.
+        """
+        key = generation_key(
+            "solve",
+            MODEL_ID,
+            PROMPT_VERSION,
+            system_blocks[-1]["text"],
+            system_blocks[0]["text"],
+            issue,
+            messages,
+        )
+        hit, script = lookup(key, self.use_cache)
+        if hit:
+            print(
+                f"Issue #{issue['number']} script replayed from cache, "
+                "starting dry run"
+            )
+            return script, self.dry_runs.submit(dry_run_source, script), key
+
+        # Call Bedrock Claude, only the messages change between calls
         body = {
-            "messages": [
-                {
-                    "role": "user",
-                    "content": combined_prompt
-                }
-            ],
+            "system": system_blocks,
+            "messages": messages,
             "max_tokens": 100000,
             "temperature": 1,
             "top_p": 0.999,
-            "anthropic_version": "bedrock-2023-05-31"
+            "anthropic_version": "bedrock-2023-05-31",
         }
-        
-        response = bedrock.invoke_model(
-            modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-            body=json.dumps(body)
+
+        dry_run: List[Future] = []
+
+        def first_token(stats: StreamStats) -> None:
+            """Report the time to first token, so stalls show early."""
+            print(
+                f"Issue #{issue['number']} first token after "
+                f"{stats.time_to_first_token:.2f}s"
+            )
+
+        def start_dry_run(script: str) -> None:
+            """Queue the dry run, which starts with the syntax check."""
+            print(
+                f"Issue #{issue['number']} script complete "
+                f"({len(script.splitlines())} lines), starting dry run"
+            )
+            dry_run.append(self.dry_runs.submit(dry_run_source, script))
+
+        _, script, stats = stream_message(
+            self.bedrock,
+            MODEL_ID,
+            body,
+            on_code=start_dry_run,
+            on_first_token=first_token,
+        )
+        print(f"Issue #{issue['number']} generation done: {stats.summary()}")
+        # Streams don't report usage in the headers the limiter and tracer read
+        get_rate_limiter().tokens.charge(stats.output_tokens)
+        record(
+            bytes=stats.bytes_received,
+            input_tokens=stats.input_tokens,
+            output_tokens=stats.output_tokens,
+            cached_tokens=stats.cache_read_tokens,
+        )
+        return script, dry_run[0], key
+
+    def generate_script(self, issue: Dict, _) -> Dict:
+        """Generate the run.py contents for one issue."""
+        # Combine issue content into a single string
+        issue_content = f"Title: {issue['title']}\nBody: {issue['body']}"
+
+        if self.prune_schema:
+            system_blocks = build_system_blocks(
+                self.system_prompt,
+                cache=prompt_caching(MODEL_ID),
+                schema_block=pruned_schema_block(issue_content),
+            )
+        else:
+            system_blocks = self.shared_system_blocks
+
+        messages = [
+            {"role": "user", "content": f"Issue Content:\n{issue_content}"}
+        ]
+        script, dry_run, key = self.invoke(issue, system_blocks, messages)
+        return {
+            "system": system_blocks,
+            "messages": messages,
+            "script": script,
+            "dry_run": dry_run,
+            "cache_key": key,
+        }
+
+    def check_script(self, issue: Dict, state: Dict) -> Dict:
+        """Wait for the dry run, regenerating the script with its problems."""
+        for attempt in range(1, MAX_SCRIPT_ATTEMPTS + 1):
+            report: DryRunReport = state["dry_run"].result()
+            # The dry run started during solve, its records count here
+            record(records=len(report.results))
+            summary = report.summary()
+            print(
+                f"Issue #{issue['number']} dry run "
+                f"{attempt}/{MAX_SCRIPT_ATTEMPTS}:\n{summary}"
+            )
+            if report.ok:
+                store(state["cache_key"], state["script"], self.use_cache)
+                state["dry_run_summary"] = summary
+                return state
+            if attempt == MAX_SCRIPT_ATTEMPTS:
+                break
+            # The failed script and its problems go back to the model, after
+            # the cached system blocks and the original issue
+            state["messages"] = state["messages"] + [
+                {"role": "assistant", "content": state["script"]},
+                {
+                    "role": "user",
+                    "content": DRY_RUN_FEEDBACK.format(summary=summary),
+                },
+            ]
+            state["script"], state["dry_run"], state["cache_key"] = (
+                self.invoke(issue, state["system"], state["messages"])
+            )
+        raise ValueError(
+            f"Script failed its dry run {MAX_SCRIPT_ATTEMPTS} "
+            f"times:\n{summary}"
         )
-        
-        response_body = json.loads(response['body'].read())
-        run_py_str = response_body['content'][0]['text']  # Updated response parsing
 
-        create_pr_with_script(run_py_str, issue['number'])
+    def open_pr(self, issue: Dict, state: Dict) -> str:
+        """Open a PR containing the generated script."""
+        create_pr_with_script(
+            state["script"],
+            issue["number"],
+            builder=self.pr_builder,
+            dry_run_summary=state["dry_run_summary"],
+        )
+        return state["script"]
+
+
+def analyze_issues_with_bedrock(
+    issues: List[Dict],
+    system_prompt: str,
+    max_in_flight: int = MAX_IN_FLIGHT,
+    prune_schema: bool = False,
+    use_cache: bool = LLM_CACHE,
+    checkpoint: Optional[SweepState] = None,
+    tracer: Optional[Tracer] = None,
+) -> List[Optional[str]]:
+    """
+    Analyze GitHub issues using Amazon Bedrock Claude model.
+
+    Issues are processed concurrently and independently, so one failing
+    issue does not abort the rest. Responses are streamed and each script
+    is dry run against the records it targets as soon as its code block
+    closes, while the rest of the reply is still arriving. Failing scripts
+    are regenerated with the problems found until they pass or
+    MAX_SCRIPT_ATTEMPTS is reached. Only scripts that pass get a PR.
+    Passing scripts are cached, so rerunning a sweep (e.g. after a failed
+    PR) dry runs the cached script again instead of regenerating it.
+
+    Args:
+        issues: List of GitHub issue dictionaries
+        system_prompt: System prompt to send to Claude after the shared
+            schema context block
+        max_in_flight: Maximum number of issues processed at once
+        prune_schema: Send only the schema models relevant to each issue
+            instead of the full schema shared by every issue
+        use_cache: Replay cached scripts, False to always call Bedrock
+        checkpoint: Journal of completed stages, issues completed for their
+            current title and body are skipped
+        tracer: Tracer of the sweep's stages, a new one writing to
+            TRACE_DIR by default. Its summary table is printed at the end
+
+    Returns:
+        List of Claude's responses as strings, None for issues that failed
+    """
+    if tracer is None:
+        tracer = Tracer("solve")
+
+    solver = IssueSolver(
+        system_prompt, prune_schema=prune_schema, use_cache=use_cache
+    )
+    try:
+        outcomes = run_pipeline(
+            issues,
+            stages=solver.stages(),
+            max_in_flight=max_in_flight,
+            stage_limits={"pr_create": PR_MAX_IN_FLIGHT},
+            checkpoint=checkpoint,
+            tracer=tracer,
+        )
+    finally:
+        solver.close()
+    print(tracer.summary())
+    return [outcome.result for outcome in outcomes]
 
-        responses.append(run_py_str)
-        
-    return responses
 
 if __name__ == "__main__":
     try:
-        issues = get_github_issues()
-        issues = [issues[0]]
+        # Every open issue (the endpoint lists PRs too), the sweep journal
+        # skips the ones that got a PR since their last edit
+        issues = [
+            issue
+            for issue in get_github_issues()
+            if "pull_request" not in issue
+        ]
         for issue in issues:
             print(f"Issue #{issue['number']}: {issue['title']}")
             print(f"State: {issue['state']}")
             print(f"URL: {issue['html_url']}")
             print("-" * 50)
 
-        responses = analyze_issues_with_bedrock(issues, system_prompt=system_prompt)
-        for i, response in enumerate(responses):
-            print(f"\nAnalysis for issue #{i+1}:")
+        responses = analyze_issues_with_bedrock(
+            issues, system_prompt=system_prompt, checkpoint=SweepState("solve")
+        )
+        for issue, response in zip(issues, responses):
+            print(f"\nAnalysis for issue #{issue['number']}:")
             print(response)
             print("-" * 50)
-    
+
     except Exception as e:
         print(f"Error: {str(e)}")
         raise e
@@ -1,21 +1,388 @@
-from langchain_core.tools import tool
-from aind_data_access_api.document_db import MetadataDbClient
-from typing import List
 import os
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from aind_data_access_api.document_db import MetadataDbClient
+from langchain_core.tools import tool
+
+from aind_scicomp_nautilex.providers import lazy_resource
+from aind_scicomp_nautilex.query_cache import (
+    CACHE_MAX_BYTES,
+    CACHE_TTL,
+    QueryCache,
+    cache_key,
+    canonical_pipeline,
+    canonical_query,
+    parse_query,
+)
+from aind_scicomp_nautilex.storage import cache_path
+from aind_scicomp_nautilex.tracing import current_span, record
 
 API_GATEWAY_HOST = os.getenv("API_GATEWAY_HOST", "api.allenneuraldynamics.org")
 DATABASE = os.getenv("DATABASE", "metadata_index")
 COLLECTION = os.getenv("COLLECTION", "data_assets")
-
-client = MetadataDbClient(
-    host=API_GATEWAY_HOST,
-    database=DATABASE,
-    collection=COLLECTION,
+BATCH_SIZE = int(os.getenv("DOCDB_BATCH_SIZE", "100"))
+# Folder of a local snapshot (see snapshot.py) to query instead of DocDB
+DOCDB_SNAPSHOT = os.getenv("NAUTILEX_DOCDB_SNAPSHOT")
+# Results of repeated queries are reused for DOCDB_CACHE_TTL seconds, set
+# DOCDB_CACHE=0 to always query DocDB and DOCDB_CACHE_PERSIST=1 to keep
+# results on disk between sessions
+DOCDB_CACHE = os.getenv("DOCDB_CACHE", "1") != "0"
+DOCDB_CACHE_TTL = float(os.getenv("DOCDB_CACHE_TTL", CACHE_TTL))
+DOCDB_CACHE_MAX_BYTES = int(
+    os.getenv("DOCDB_CACHE_MAX_BYTES", CACHE_MAX_BYTES)
 )
+DOCDB_CACHE_PERSIST = os.getenv("DOCDB_CACHE_PERSIST", "0") == "1"
+# Most common values kept per field in a footprint histogram
+FOOTPRINT_TOP_VALUES = 20
+FOOTPRINT_SAMPLE_SIZE = 10
+# Matches the sample is drawn from, so grouping their _ids stays bounded
+FOOTPRINT_SAMPLE_SCAN = 1000
+# Records returned by the query_docdb tool, the total is reported separately
+QUERY_TOOL_LIMIT = int(os.getenv("QUERY_TOOL_LIMIT", "20"))
+
+
+@lazy_resource
+def get_docdb_client() -> MetadataDbClient:
+    """Create the DocDB client or local snapshot stand-in on first use."""
+    if DOCDB_SNAPSHOT:
+        from aind_scicomp_nautilex.snapshot import Snapshot, SnapshotClient
+
+        return SnapshotClient(Snapshot(DOCDB_SNAPSHOT))
+    return MetadataDbClient(
+        host=API_GATEWAY_HOST,
+        database=DATABASE,
+        collection=COLLECTION,
+    )
+
+
+@lazy_resource
+def get_query_cache() -> QueryCache:
+    """Create the query result cache on first use."""
+    return QueryCache(
+        max_bytes=DOCDB_CACHE_MAX_BYTES,
+        ttl=DOCDB_CACHE_TTL,
+        directory=cache_path("docdb") if DOCDB_CACHE_PERSIST else None,
+    )
+
+
+def cached_query(kind: str, compute: Callable[[], Any], *parts: Any) -> Any:
+    """Run a DocDB call, or reuse its result if an equivalent call was cached
+
+    Parameters
+    ----------
+    kind : str
+        Type of call, e.g. "records" or "count"
+    compute : Callable
+        Function making the call on a cache miss
+    *parts
+        Query, projection and other arguments the result depends on,
+        filters already passed through ``canonical_query``
+
+    Returns
+    -------
+    Any
+        The call's result
+    """
+    if not DOCDB_CACHE:
+        return compute()
+    key = cache_key(
+        kind, DOCDB_SNAPSHOT or API_GATEWAY_HOST, DATABASE, COLLECTION, *parts
+    )
+    return get_query_cache().get_or_compute(key, compute)
+
+
+def _fetched(result: Any) -> Any:
+    """Trace the approximate size of a DocDB result when a stage is traced
+
+    Pages are estimated from their first record rather than serialized, so
+    tracing doesn't add a full ``json.dumps`` of every page.
+    """
+    if current_span() is not None:
+        from aind_scicomp_nautilex.sampling import estimate_size
+
+        if isinstance(result, list):
+            size = estimate_size(result[0]) * len(result) if result else 2
+        else:
+            size = estimate_size(result)
+        record(bytes=size)
+    return result
+
+
+def __getattr__(name: str):
+    """Keep ``lc_tools.client`` working without creating it at import."""
+    if name == "client":
+        return get_docdb_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def iter_docdb_records(
+    query: dict,
+    projection: Optional[dict] = None,
+    batch_size: int = BATCH_SIZE,
+    limit: int = 0,
+) -> Iterator[dict]:
+    """Stream the records matching a query one page at a time
+
+    Pages are only requested as the caller consumes the generator, so
+    stopping early (e.g. once a sample is large enough) never transfers
+    the remaining matches. Pages are read in ``_id`` order and each one
+    continues after the last ``_id`` seen, so records are never repeated
+    or skipped between pages, and only an empty page ends the matches.
+
+    Parameters
+    ----------
+    query : dict
+        MongoDB filter query
+    projection : dict, optional
+        MongoDB projection applied server-side
+    batch_size : int
+        Number of records requested per page
+    limit : int
+        Maximum number of records to yield, 0 for no limit
+
+    Yields
+    ------
+    dict
+        Records that match the query
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+
+    # Pages continue from the last _id, so it is fetched even if the
+    # projection leaves it out
+    drop_id = projection is not None and not projection.get("_id", 1)
+    if drop_id:
+        projection = {**projection, "_id": 1}
+
+    count = 0
+    page_query = query
+    while not limit or count < limit:
+        page_size = min(batch_size, limit - count) if limit else batch_size
+        page = get_docdb_client()._get_records(
+            filter_query=page_query,
+            projection=projection,
+            sort={"_id": 1},
+            limit=page_size,
+        )
+        _fetched(page)
+        record(records=len(page))
+        if not page:
+            return
+        page_query = {"$and": [query, {"_id": {"$gt": page[-1]["_id"]}}]}
+        count += len(page)
+        for doc in page:
+            if drop_id:
+                doc.pop("_id")
+            yield doc
+
+
+def retrieve_docdb_records(
+    query: dict, projection: Optional[dict] = None, limit: int = 0
+) -> List[dict]:
+    """Retrieve the records matching a query, reusing cached results
+
+    Parameters
+    ----------
+    query : dict
+        MongoDB filter query
+    projection : dict, optional
+        MongoDB projection applied server-side
+    limit : int
+        Maximum number of records, in ``_id`` order, 0 for no limit
+
+    Returns
+    -------
+    List[dict]
+        Records that match the query
+    """
+    # The agent sometimes sends the query as JSON or Python literal text
+    query = parse_query(query)
+    return cached_query(
+        "records",
+        lambda: list(
+            iter_docdb_records(query, projection=projection, limit=limit)
+        ),
+        canonical_query(query),
+        projection,
+        limit,
+    )
+
+
+def count_docdb_records(query: dict) -> int:
+    """Count the records matching a query without retrieving them
+
+    Parameters
+    ----------
+    query : dict
+        MongoDB filter query
+
+    Returns
+    -------
+    int
+        Number of records that match the query
+    """
+    query = parse_query(query)
+    return cached_query(
+        "count",
+        lambda: get_docdb_client()._count_records(filter_query=query)[
+            "filtered_record_count"
+        ],
+        canonical_query(query),
+    )
+
+
+def build_footprint_pipeline(
+    query: dict,
+    fields: Sequence[str],
+    top_values: int = FOOTPRINT_TOP_VALUES,
+    sample_size: int = FOOTPRINT_SAMPLE_SIZE,
+) -> List[dict]:
+    """Build the aggregation pipeline behind ``docdb_footprint``
+
+    Each part of the footprint is one ``$facet`` branch, so the matches are
+    only read once. Facet names are positional (``field_0``, ...) since
+    dotted field names aren't valid facet names.
+
+    Parameters
+    ----------
+    query : dict
+        MongoDB filter query
+    fields : Sequence[str]
+        Dotted fields to build histograms for, the sample is stratified by
+        the first one
+    top_values : int
+        Most common values kept per field
+    sample_size : int
+        Number of ``_id``s in the sample, drawn from the first
+        FOOTPRINT_SAMPLE_SCAN matches
+
+    Returns
+    -------
+    List[dict]
+        Aggregation pipeline returning a single document
+    """
+    facets = {"count": [{"$count": "count"}]}
+    for i, field in enumerate(fields):
+        facets[f"field_{i}"] = [
+            {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1, "_id": 1}},
+            {"$limit": top_values},
+        ]
+    if fields:
+        # Ids from each of the most common values of the first field, taken
+        # round-robin by parse_footprint so the sample covers more than the
+        # largest group. Only the first matches are grouped, so $push never
+        # collects the _id of every match
+        facets["sample"] = [
+            {"$limit": FOOTPRINT_SAMPLE_SCAN},
+            {
+                "$group": {
+                    "_id": f"${fields[0]}",
+                    "count": {"$sum": 1},
+                    "ids": {"$push": "$_id"},
+                }
+            },
+            {"$sort": {"count": -1, "_id": 1}},
+            {"$limit": sample_size},
+            {"$project": {"ids": {"$slice": ["$ids", sample_size]}}},
+        ]
+    else:
+        facets["sample"] = [
+            {"$limit": sample_size},
+            {"$project": {"ids": ["$_id"]}},
+        ]
+    return [{"$match": query}, {"$facet": facets}]
+
+
+def parse_footprint(
+    result: dict,
+    fields: Sequence[str],
+    sample_size: int = FOOTPRINT_SAMPLE_SIZE,
+) -> Dict:
+    """Turn the ``$facet`` document of a footprint pipeline into a footprint
+
+    Parameters
+    ----------
+    result : dict
+        The single document returned by ``build_footprint_pipeline``
+    fields : Sequence[str]
+        Dotted fields the pipeline was built with
+    sample_size : int
+        Maximum number of ``_id``s in the sample
+
+    Returns
+    -------
+    Dict
+        Total count, per-field histograms and a sample of ``_id``s
+    """
+    count = result.get("count") or [{"count": 0}]
+    groups = [group.get("ids", []) for group in result.get("sample", [])]
+    sample_ids = [
+        group[i]
+        for i in range(max(map(len, groups), default=0))
+        for group in groups
+        if i < len(group)
+    ]
+    return {
+        "count": count[0]["count"],
+        "histograms": {
+            field: [
+                {"value": bucket["_id"], "count": bucket["count"]}
+                for bucket in result.get(f"field_{i}", [])
+            ]
+            for i, field in enumerate(fields)
+        },
+        "sample_ids": sample_ids[:sample_size],
+    }
+
+
+def docdb_footprint(
+    query: dict,
+    fields: Sequence[str] = (),
+    top_values: int = FOOTPRINT_TOP_VALUES,
+    sample_size: int = FOOTPRINT_SAMPLE_SIZE,
+) -> Dict:
+    """Measure how many records a query affects in one server-side aggregation
+
+    Instead of retrieving every match, a single ``$facet`` query returns the
+    total count, a histogram of the most common values of each field (e.g.
+    ``data_description.project_name`` or ``subject.subject_id``) and a small
+    sample of ``_id``s stratified by the first field.
+
+    Parameters
+    ----------
+    query : dict
+        MongoDB filter query
+    fields : Sequence[str]
+        Dotted fields to build histograms for
+    top_values : int
+        Most common values kept per field
+    sample_size : int
+        Number of ``_id``s in the sample
+
+    Returns
+    -------
+    Dict
+        ``{"count": int, "histograms": {field: [{"value", "count"}]},
+        "sample_ids": [...]}``
+    """
+    fields = list(fields)
+    pipeline = build_footprint_pipeline(query, fields, top_values, sample_size)
+    results = cached_query(
+        "aggregate",
+        lambda: get_docdb_client().aggregate_docdb_records(pipeline=pipeline),
+        canonical_pipeline(pipeline),
+    )
+    return parse_footprint(results[0] if results else {}, fields, sample_size)
+
 
 @tool
-def query_docdb(query: dict) -> List[dict]:
-    """Query the MongoDB document database and retrieve a set of matching records
+def query_docdb(query: dict) -> Dict:
+    """Query the MongoDB document database and retrieve matching records
+
+    Returns a summary rather than a list of every match: the number of
+    matches and only the first few records, use count_docdb or
+    footprint_docdb to measure the rest.
 
     Parameters
     ----------
@@ -24,9 +391,51 @@ def query_docdb(query: dict) -> List[dict]:
 
     Returns
     -------
-    List[dict]
-        List of records that match the query
+    Dict
+        ``{"total": int, "records": [...]}``, the number of records that
+        match the query and up to QUERY_TOOL_LIMIT of them
+    """
+    query = parse_query(query)
+    return {
+        "total": count_docdb_records(query),
+        "records": retrieve_docdb_records(query, limit=QUERY_TOOL_LIMIT),
+    }
+
+
+@tool
+def count_docdb(query: dict) -> int:
+    """Count the records in the MongoDB document database that match a query
+
+    Parameters
+    ----------
+    query : dict
+        MongoDB query
+
+    Returns
+    -------
+    int
+        Number of records that match the query
+    """
+    return count_docdb_records(query)
+
+
+@tool
+def footprint_docdb(query: dict, fields: List[str]) -> Dict:
+    """Measure the footprint of an issue: how many records match a query
+    and how they are distributed
+
+    Parameters
+    ----------
+    query : dict
+        MongoDB query
+    fields : List[str]
+        Dotted fields to group the matching records by, e.g.
+        "data_description.project_name" or "subject.subject_id"
+
+    Returns
+    -------
+    Dict
+        Total count, the most common values of each field with their
+        counts, and a sample of matching record ``_id``s
     """
-    return client.retrieve_docdb_records(
-        filter_query=query
-    )
\ No newline at end of file
+    return docdb_footprint(query, fields)
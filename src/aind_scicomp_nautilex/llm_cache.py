@@ -0,0 +1,103 @@
+"""Persistent cache of Bedrock generations, keyed on their prompt inputs"""
+
+import hashlib
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from aind_scicomp_nautilex.providers import lazy_resource
+from aind_scicomp_nautilex.query_cache import QueryCache, cache_key
+from aind_scicomp_nautilex.storage import cache_path
+
+# Set LLM_CACHE=0 to always call Bedrock, or pass use_cache to the explorer
+# and solver
+LLM_CACHE = os.getenv("LLM_CACHE", "1") != "0"
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 30 * 24 * 3600))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+
+@lazy_resource
+def get_llm_cache() -> QueryCache:
+    """Create the generation cache, persisted in the local cache directory."""
+    return QueryCache(
+        max_bytes=LLM_CACHE_MAX_BYTES,
+        ttl=LLM_CACHE_TTL,
+        directory=cache_path("llm"),
+    )
+
+
+def text_digest(text: str) -> str:
+    """Hash a long text, such as the schema context, once per key."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def generation_key(
+    stage: str,
+    model_id: str,
+    template_version: int,
+    instructions: str,
+    schema_block: str,
+    issue: Dict,
+    *inputs: Any,
+) -> str:
+    """
+    Key a generation on everything its prompt depends on.
+
+    Args:
+        stage: Pipeline stage, e.g. "query_generation"
+        model_id: Bedrock model id
+        template_version: Version of the stage's prompt template, bumped
+            when the way a reply is used changes without the text changing
+        instructions: Task instructions sent in the system prompt
+        schema_block: Schema context sent in the system prompt
+        issue: GitHub issue, only its title and body are used so edits
+            invalidate the entry and label or comment changes don't
+        *inputs: Anything else in the prompt, e.g. the DB results digest
+            or the feedback of earlier attempts
+
+    Returns:
+        The cache key
+    """
+    return cache_key(
+        "llm",
+        stage,
+        model_id,
+        template_version,
+        text_digest(instructions),
+        text_digest(schema_block),
+        issue.get("title"),
+        issue.get("body"),
+        *inputs,
+    )
+
+
+def lookup(key: str, use_cache: bool = LLM_CACHE) -> Tuple[bool, Any]:
+    """
+    Look up a generation.
+
+    Args:
+        key: Key from generation_key
+        use_cache: False to bypass the cache
+
+    Returns:
+        (True, reply) on a hit, (False, None) otherwise
+    """
+    if not use_cache:
+        return False, None
+    return get_llm_cache().get(key)
+
+
+def store(key: Optional[str], value: Any, use_cache: bool = LLM_CACHE) -> None:
+    """
+    Cache a generation, once the stage has accepted it.
+
+    Only accepted replies are stored (a query matching records, a script
+    passing its dry run), so a rerun regenerates the ones that failed
+    instead of replaying them.
+
+    Args:
+        key: Key from generation_key, nothing is stored if None
+        value: JSON-serializable reply
+        use_cache: False to bypass the cache
+    """
+    if use_cache and key is not None:
+        get_llm_cache().put(key, value)
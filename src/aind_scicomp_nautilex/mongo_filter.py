@@ -0,0 +1,356 @@
+"""Local evaluation of the MongoDB filters the agents send to DocDB"""
+
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional
+
+_REGEX_FLAGS = {
+    "i": re.IGNORECASE,
+    "m": re.MULTILINE,
+    "s": re.DOTALL,
+    "x": re.VERBOSE,
+}
+_COMPARISONS = {
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+}
+
+
+def resolve_path(value: Any, path: str) -> List[Any]:
+    """
+    Find every value a dotted path reaches in a record.
+
+    Like MongoDB, a path that reaches an array continues into each of its
+    elements, so ``acquisition.tiles.channel.channel_name`` returns the
+    channel name of every tile. Numeric parts also index into arrays.
+
+    Args:
+        value: Record or sub-document
+        path: Dotted path, e.g. "subject.subject_id"
+
+    Returns:
+        The values found, empty if the path is missing
+    """
+    return _resolve(value, path.split("."))
+
+
+def _resolve(value: Any, parts: List[str]) -> List[Any]:
+    """Resolve the remaining path parts below a value."""
+    if not parts:
+        return [value]
+    head, rest = parts[0], parts[1:]
+    if isinstance(value, dict):
+        return _resolve(value[head], rest) if head in value else []
+    if isinstance(value, list):
+        found = []
+        if head.isdigit() and int(head) < len(value):
+            found.extend(_resolve(value[int(head)], rest))
+        for item in value:
+            if isinstance(item, dict):
+                found.extend(_resolve(item, parts))
+        return found
+    return []
+
+
+def expand_values(values: List[Any]) -> Iterator[Any]:
+    """Yield each value, then the elements of the ones that are arrays."""
+    for value in values:
+        yield value
+        if isinstance(value, list):
+            yield from value
+
+
+@lru_cache(maxsize=256)
+def compile_regex(pattern: str, options: str = "") -> re.Pattern:
+    """Compile a $regex pattern with its $options, e.g. "i"."""
+    flags = 0
+    for option in options:
+        flags |= _REGEX_FLAGS.get(option, 0)
+    return re.compile(pattern, flags)
+
+
+def _equal(value: Any, target: Any) -> bool:
+    """Compare like MongoDB, where booleans are never equal to numbers."""
+    if isinstance(value, bool) != isinstance(target, bool):
+        return False
+    return value == target
+
+
+def _comparable(value: Any, target: Any) -> bool:
+    """Whether MongoDB would compare two values with $gt/$lt and friends."""
+    if value is None or target is None or isinstance(value, (dict, list)):
+        return False
+    if isinstance(value, bool) or isinstance(target, bool):
+        return isinstance(value, bool) and isinstance(target, bool)
+    if isinstance(value, (int, float)):
+        return isinstance(target, (int, float))
+    return type(value) is type(target)
+
+
+def _is_operator_dict(condition: Any) -> bool:
+    """Whether a condition is made of operators rather than a literal value."""
+    return (
+        isinstance(condition, dict)
+        and bool(condition)
+        and all(
+            isinstance(key, str) and key.startswith("$") for key in condition
+        )
+    )
+
+
+def _match_eq(values: List[Any], target: Any) -> bool:
+    """Match {path: target}, where a missing path equals None."""
+    if isinstance(target, re.Pattern):
+        return any(
+            isinstance(value, str) and target.search(value)
+            for value in expand_values(values)
+        )
+    if target is None and not values:
+        return True
+    return any(_equal(value, target) for value in expand_values(values))
+
+
+def match_values(values: List[Any], condition: Any) -> bool:
+    """
+    Match the values found at a path against a literal or operator condition.
+
+    Args:
+        values: Values from resolve_path
+        condition: e.g. "731015" or {"$in": ["ecephys"]}
+
+    Returns:
+        Whether the condition holds
+    """
+    if not _is_operator_dict(condition):
+        return _match_eq(values, condition)
+    return all(
+        _match_operator(values, operator, argument, condition)
+        for operator, argument in condition.items()
+        if operator != "$options"
+    )
+
+
+def _match_operator(
+    values: List[Any], operator: str, argument: Any, condition: Dict
+) -> bool:
+    """Match the values at a path against a single operator."""
+    if operator not in _OPERATORS:
+        raise ValueError(f"Unsupported query operator: {operator}")
+    return _OPERATORS[operator](values, argument, condition)
+
+
+def _op_in(values: List[Any], argument: List[Any], condition: Dict) -> bool:
+    """Match {"$in": [...]}."""
+    return any(_match_eq(values, target) for target in argument)
+
+
+def _op_comparison(compare):
+    """Build the matcher of $gt/$gte/$lt/$lte from its comparison."""
+
+    def match(values: List[Any], argument: Any, condition: Dict) -> bool:
+        """Match when any value compares true against the argument."""
+        return any(
+            _comparable(value, argument) and compare(value, argument)
+            for value in expand_values(values)
+        )
+
+    return match
+
+
+def _op_regex(values: List[Any], argument: Any, condition: Dict) -> bool:
+    """Match {"$regex": ..., "$options": ...}."""
+    if isinstance(argument, re.Pattern):
+        pattern = argument
+    else:
+        pattern = compile_regex(argument, condition.get("$options", ""))
+    return _match_eq(values, pattern)
+
+
+def _op_not(values: List[Any], argument: Any, condition: Dict) -> bool:
+    """Match {"$not": condition}, where a pattern stands for a $regex."""
+    if isinstance(argument, (str, re.Pattern)):
+        argument = {"$regex": argument}
+    return not match_values(values, argument)
+
+
+def _op_elem_match(values: List[Any], argument: Dict, condition: Dict) -> bool:
+    """Match {"$elemMatch": condition} against the elements of arrays."""
+    return any(
+        isinstance(value, list)
+        and any(_match_element(item, argument) for item in value)
+        for value in values
+    )
+
+
+_OPERATORS = {
+    "$eq": lambda values, argument, condition: _match_eq(values, argument),
+    "$ne": lambda values, argument, condition: not _match_eq(values, argument),
+    "$in": _op_in,
+    "$nin": lambda values, argument, condition: not _op_in(
+        values, argument, condition
+    ),
+    **{
+        operator: _op_comparison(compare)
+        for operator, compare in _COMPARISONS.items()
+    },
+    "$exists": lambda values, argument, condition: bool(values)
+    == bool(argument),
+    "$regex": _op_regex,
+    "$not": _op_not,
+    "$elemMatch": _op_elem_match,
+    "$size": lambda values, argument, condition: any(
+        isinstance(value, list) and len(value) == argument for value in values
+    ),
+    "$all": lambda values, argument, condition: all(
+        match_values(values, target) for target in argument
+    ),
+}
+
+
+def _match_element(item: Any, condition: Dict) -> bool:
+    """Match one array element for $elemMatch."""
+    if _is_operator_dict(condition) and not any(
+        key in _LOGICAL for key in condition
+    ):
+        return match_values([item], condition)
+    return isinstance(item, dict) and matches(item, condition)
+
+
+def _match_and(record: Dict, queries: List[Dict]) -> bool:
+    """Match every query."""
+    return all(matches(record, query) for query in queries)
+
+
+def _match_or(record: Dict, queries: List[Dict]) -> bool:
+    """Match at least one query."""
+    return any(matches(record, query) for query in queries)
+
+
+def _match_nor(record: Dict, queries: List[Dict]) -> bool:
+    """Match none of the queries."""
+    return not any(matches(record, query) for query in queries)
+
+
+_LOGICAL = {"$and": _match_and, "$or": _match_or, "$nor": _match_nor}
+
+
+def matches(record: Dict, query: Optional[Dict]) -> bool:
+    """
+    Check whether a record matches a MongoDB filter.
+
+    Supports dotted paths through nested documents and arrays, equality,
+    comparisons, $in/$nin, $regex (with $options), $elemMatch, $exists,
+    $size, $all, $not and $and/$or/$nor.
+
+    Args:
+        record: Record as returned by DocDB
+        query: MongoDB filter, None or {} matches everything
+
+    Returns:
+        Whether the record matches
+
+    Raises:
+        ValueError: If the filter uses an operator that isn't supported
+    """
+    for key, condition in (query or {}).items():
+        if key in _LOGICAL:
+            if not _LOGICAL[key](record, condition):
+                return False
+        elif key.startswith("$"):
+            raise ValueError(f"Unsupported query operator: {key}")
+        elif not match_values(resolve_path(record, key), condition):
+            return False
+    return True
+
+
+def project(record: Dict, projection: Optional[Dict]) -> Dict:
+    """
+    Apply a MongoDB inclusion or exclusion projection to a record.
+
+    Args:
+        record: Record to project, left unmodified
+        projection: e.g. {"subject.subject_id": 1}, None keeps everything
+
+    Returns:
+        New record with only the projected fields
+    """
+    if not projection:
+        return dict(record)
+    include_id = bool(projection.get("_id", 1))
+    fields = {
+        path: bool(keep) for path, keep in projection.items() if path != "_id"
+    }
+
+    if fields and all(fields.values()):
+        projected: Dict = {}
+        if include_id and "_id" in record:
+            projected["_id"] = record["_id"]
+        for path in fields:
+            _copy_path(record, projected, path.split("."))
+        return projected
+
+    projected = _drop_paths(
+        record, [path.split(".") for path, keep in fields.items() if not keep]
+    )
+    if not include_id:
+        projected.pop("_id", None)
+    return projected
+
+
+def _copy_path(source: Any, target: Dict, parts: List[str]) -> None:
+    """Copy the value at a path from source into target."""
+    head, rest = parts[0], parts[1:]
+    if not isinstance(source, dict) or head not in source:
+        return
+    value = source[head]
+    if not rest:
+        target[head] = value
+    elif isinstance(value, dict):
+        _copy_path(value, target.setdefault(head, {}), rest)
+    elif isinstance(value, list):
+        items = target.setdefault(
+            head, [{} for item in value if isinstance(item, dict)]
+        )
+        for item, copied in zip(
+            (item for item in value if isinstance(item, dict)), items
+        ):
+            _copy_path(item, copied, rest)
+
+
+def _drop_paths(value: Any, paths: List[List[str]]) -> Any:
+    """Copy a value without the excluded paths."""
+    if isinstance(value, list):
+        return [_drop_paths(item, paths) for item in value]
+    if not isinstance(value, dict):
+        return value
+    dropped = {parts[0] for parts in paths if len(parts) == 1}
+    copied = {}
+    for key, child in value.items():
+        if key in dropped:
+            continue
+        below = [
+            parts[1:] for parts in paths if len(parts) > 1 and parts[0] == key
+        ]
+        copied[key] = _drop_paths(child, below) if below else child
+    return copied
+
+
+_TYPE_ORDER = {
+    type(None): 0,
+    int: 1,
+    float: 1,
+    str: 2,
+    dict: 3,
+    list: 4,
+    bool: 5,
+}
+
+
+def sort_key(record: Dict, path: str):
+    """Sort key for a path, ordering mixed types roughly like MongoDB."""
+    values = resolve_path(record, path)
+    value = values[0] if values else None
+    rank = _TYPE_ORDER.get(type(value), 6)
+    return (rank, value if rank in (1, 2, 5) else str(value))
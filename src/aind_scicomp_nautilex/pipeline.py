@@ -0,0 +1,130 @@
+"""Bounded-concurrency pipeline for processing many GitHub issues at once"""
+
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+if TYPE_CHECKING:
+    from aind_scicomp_nautilex.sweep_state import SweepState
+    from aind_scicomp_nautilex.tracing import Tracer
+
+MAX_IN_FLIGHT = 4
+
+# A stage takes the issue and the previous stage's result and returns its own
+StageFunc = Callable[[Dict, Any], Any]
+
+
+@dataclass
+class IssueOutcome:
+    """Result of running one issue through the pipeline."""
+
+    issue: Dict
+    result: Any = None
+    error: Optional[BaseException] = None
+    failed_stage: Optional[str] = None
+    # Completed in an earlier run for the same title and body
+    skipped: bool = False
+
+    @property
+    def ok(self) -> bool:
+        """Whether every stage completed for this issue."""
+        return self.error is None
+
+
+def run_pipeline(
+    issues: Sequence[Dict],
+    stages: Sequence[Tuple[str, StageFunc]],
+    max_in_flight: int = MAX_IN_FLIGHT,
+    stage_limits: Optional[Dict[str, int]] = None,
+    checkpoint: Optional["SweepState"] = None,
+    tracer: Optional["Tracer"] = None,
+) -> List[IssueOutcome]:
+    """
+    Run every issue through a sequence of stages with bounded concurrency.
+
+    Issues are processed independently, so an exception in one issue's stage
+    is recorded on its outcome and the remaining issues carry on.
+
+    Args:
+        issues: GitHub issue dictionaries
+        stages: Ordered (name, function) pairs, e.g. query generation, DB
+            execution, analysis and posting
+        max_in_flight: Maximum number of issues processed at once
+        stage_limits: Optional per-stage cap on concurrent calls, e.g. to
+            keep GitHub posting serial while Bedrock calls overlap
+        checkpoint: Journal recording every completed stage. Issues whose
+            last stage completed for their current title and body are
+            skipped, with the recorded output as their result. Issues
+            interrupted part way restart after the stages they completed,
+            from the journaled output (see SweepState.resume)
+        tracer: Tracer getting a span per stage and issue, timed once the
+            stage's concurrency limit lets it start
+
+    Returns:
+        One IssueOutcome per issue, in the same order as ``issues``
+    """
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1")
+
+    semaphores = {
+        name: threading.BoundedSemaphore(limit)
+        for name, limit in (stage_limits or {}).items()
+    }
+
+    def process(issue: Dict) -> IssueOutcome:
+        """Run one issue through all stages, capturing the first failure."""
+        outcome = IssueOutcome(issue=issue)
+        start = 0
+        if checkpoint is not None:
+            start, outcome.result = checkpoint.resume(
+                issue, [name for name, _ in stages]
+            )
+            if start == len(stages):
+                print(
+                    f"Issue #{issue.get('number')} is unchanged since it was "
+                    "completed, skipping"
+                )
+                outcome.skipped = True
+                return outcome
+            if start:
+                print(
+                    f"Issue #{issue.get('number')} resuming at "
+                    f"{stages[start][0]}"
+                )
+        for name, func in stages[start:]:
+            try:
+                inputs = outcome.result
+                span = (
+                    tracer.span(name, issue=issue.get("number"))
+                    if tracer is not None
+                    else nullcontext()
+                )
+                with semaphores.get(name, nullcontext()), span:
+                    outcome.result = func(issue, inputs)
+                if checkpoint is not None:
+                    checkpoint.record(issue, name, inputs, outcome.result)
+            except Exception as e:
+                print(
+                    f"Issue #{issue.get('number')} failed during {name}: {e}"
+                )
+                traceback.print_exc()
+                outcome.result = None
+                outcome.error = e
+                outcome.failed_stage = name
+                break
+        return outcome
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        return list(executor.map(process, issues))
@@ -0,0 +1,173 @@
+"""Shared, cacheable schema context for the Bedrock system prompts"""
+
+import os
+from typing import Dict, List, Optional
+
+from aind_scicomp_nautilex.providers import lazy_resource
+from aind_scicomp_nautilex.schema_index import SchemaIndex
+
+# Bedrock only supports prompt caching on some models, the schema block is
+# only marked as a cache breakpoint for those. Set to "0" to never mark it
+PROMPT_CACHING = os.getenv("BEDROCK_PROMPT_CACHING", "1") != "0"
+PROMPT_CACHING_MODELS = (
+    "anthropic.claude-3-5-haiku-20241022-v1:0",
+    "anthropic.claude-3-7-sonnet-20250219-v1:0",
+    "anthropic.claude-sonnet-4-20250514-v1:0",
+    "anthropic.claude-opus-4-20250514-v1:0",
+)
+
+
+def prompt_caching(model_id: str) -> bool:
+    """Whether prompts to a Bedrock model should mark cache breakpoints."""
+    # Cross-region inference profiles prefix the model id, e.g. "us."
+    return PROMPT_CACHING and any(
+        model_id.endswith(model) for model in PROMPT_CACHING_MODELS
+    )
+
+
+def load_schema_context(file: str) -> str:
+    """Load the AIND data schema context from file."""
+    schema_file = os.path.join(os.path.dirname(__file__), file)
+    with open(schema_file, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+@lazy_resource
+def get_schema_context() -> str:
+    """Load the aind-data-schema context on first use."""
+    return load_schema_context("schema_context.txt")
+
+
+@lazy_resource
+def get_models_context() -> str:
+    """Load the aind-data-schema-models context on first use."""
+    return load_schema_context("models_context.txt")
+
+
+SCHEMA_INTRO = (
+    "\n"
+    "To help you understand how the data is organized I'm going to provide "
+    "you with the full list of all models in the aind-data-schema and "
+    "aind-data-schema-models pydantic packages, which are used to create "
+    "records. This is a metadata schema built in pydantic and stored in a "
+    'MongoDB database as JSON. Each record has a top-level "metadata" file '
+    'that contains 7 files inside of it, "acquisition", "data_description", '
+    '"procedures", "processing", "quality_control", "rig", "session", and '
+    '"subject".\n'
+)
+
+
+@lazy_resource
+def get_schema_block() -> str:
+    """
+    Build the static schema prefix shared by the query, analysis and solver
+    prompts. It is built once so it stays byte-for-byte identical across
+    calls, which prompt cache hits depend on.
+    """
+    return f"""{SCHEMA_INTRO}
+Here's the aind-data-schema classes:
+{get_schema_context()}
+
+Here are the aind-data-schema-model classes:
+{get_models_context()}
+"""
+
+
+PRUNED_SCHEMA_INTRO = (
+    "\n"
+    "To help you understand how the data is organized I'm going to provide "
+    "you with the models from the aind-data-schema and "
+    "aind-data-schema-models pydantic packages that are relevant to this "
+    "issue, which are used to create records. This is a metadata schema built "
+    "in pydantic and stored in a MongoDB database as JSON. Each record has a "
+    'top-level "metadata" file that contains 7 files inside of it, '
+    '"acquisition", "data_description", "procedures", "processing", '
+    '"quality_control", "rig", "session", and "subject".\n'
+)
+
+
+@lazy_resource
+def get_schema_index() -> SchemaIndex:
+    """Build the model-dependency index for the schema context once."""
+    return SchemaIndex.from_context(get_schema_context(), get_models_context())
+
+
+_LAZY_ATTRIBUTES = {
+    "schema_context": get_schema_context,
+    "models_context": get_models_context,
+    "SCHEMA_BLOCK": get_schema_block,
+}
+
+
+def __getattr__(name: str):
+    """Load the schema context module attributes on first access."""
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def pruned_schema_block(issue_content: str) -> str:
+    """
+    Build a schema block containing only the models an issue touches.
+
+    Args:
+        issue_content: Issue title and body
+
+    Returns:
+        The pruned schema block, or the full schema block if nothing in the
+        issue could be matched to a model
+    """
+    context = get_schema_index().prune(issue_content)
+    if context is None:
+        return get_schema_block()
+    return f"""{PRUNED_SCHEMA_INTRO}
+Here are the relevant aind-data-schema and aind-data-schema-model classes:
+{context}
+"""
+
+
+def schema_content_block(
+    cache: bool = False, schema_block: Optional[str] = None
+) -> Dict:
+    """
+    Build the schema context as a single Anthropic text content block.
+
+    Args:
+        cache: Whether to mark the block as a prompt-cache breakpoint
+        schema_block: Schema context text, the full schema by default
+
+    Returns:
+        Text content block containing the schema context
+    """
+    if schema_block is None:
+        schema_block = get_schema_block()
+    block = {"type": "text", "text": schema_block}
+    if cache:
+        block["cache_control"] = {"type": "ephemeral"}
+    return block
+
+
+def build_system_blocks(
+    task_prompt: str, cache: bool = False, schema_block: Optional[str] = None
+) -> List[Dict]:
+    """
+    Build system content blocks with the cached schema prefix first.
+
+    The schema block comes first so every prompt shares the same cacheable
+    prefix, and only the short task-specific instructions after it are
+    processed again on each call.
+
+    Args:
+        task_prompt: Task-specific instructions that follow the schema
+        cache: Whether to mark the schema block as a prompt-cache breakpoint,
+            see prompt_caching
+        schema_block: Schema context text, e.g. from pruned_schema_block,
+            the full schema by default
+
+    Returns:
+        List of text content blocks for the system prompt
+    """
+    return [
+        schema_content_block(cache=cache, schema_block=schema_block),
+        {"type": "text", "text": task_prompt},
+    ]
@@ -0,0 +1,43 @@
+"""Lazily created, memoized shared resources"""
+
+import threading
+from functools import wraps
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+
+def lazy_resource(factory: Callable[[], T]) -> Callable[[], T]:
+    """
+    Turn a zero-argument factory into a thread-safe, memoized getter.
+
+    The resource is only created on the first call, so importing a module
+    that declares one never touches the network, credentials or large files.
+    Call ``getter.reset()`` to drop the cached instance, e.g. after rotating
+    credentials or in tests.
+
+    Args:
+        factory: Function that creates the resource
+
+    Returns:
+        Getter returning the same instance on every call
+    """
+    lock = threading.Lock()
+    instance = []
+
+    @wraps(factory)
+    def getter() -> T:
+        """Return the resource, creating it on first use."""
+        if not instance:
+            with lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+
+    def reset() -> None:
+        """Forget the cached resource so the next call recreates it."""
+        with lock:
+            instance.clear()
+
+    getter.reset = reset
+    return getter
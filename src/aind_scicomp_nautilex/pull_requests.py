@@ -0,0 +1,157 @@
+"""Single-commit pull request creation through the GitHub Git Data API"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from aind_scicomp_nautilex.github_client import (
+    REPO_NAME,
+    REPO_OWNER,
+    GitHubClient,
+    get_github_client,
+)
+
+# Content-creating requests are the ones GitHub's secondary rate limits
+# target, and GitHub asks for them to be made serially, so one PR goes up
+# at a time. Creating a PR takes a handful of requests, so running them
+# concurrently would save little next to generating the scripts
+PR_MAX_IN_FLIGHT = 1
+
+
+@dataclass
+class PullRequestSpec:
+    """Files and text for one pull request."""
+
+    files: Dict[str, str]
+    branch_name: str
+    title: str
+    body: str
+    commit_message: str
+
+
+class PullRequestBuilder:
+    """
+    Open pull requests that add any number of files in a single commit.
+
+    The default branch, its head commit and its tree are looked up once per
+    builder (i.e. per sweep) and reused by every PR. Each PR then costs one
+    tree, one commit, one ref and one pull request call, whatever the
+    number of files.
+    """
+
+    def __init__(
+        self,
+        repo_owner: str = REPO_OWNER,
+        repo_name: str = REPO_NAME,
+        client: Optional[GitHubClient] = None,
+    ):
+        """
+        Create the builder.
+
+        Args:
+            repo_owner: The owner of the repository
+            repo_name: The name of the repository
+            client: GitHub client, the shared one by default
+        """
+        self.client = client or get_github_client()
+        self.repo_path = f"repos/{repo_owner}/{repo_name}"
+        self._lock = threading.Lock()
+        self._base: Optional[Tuple[str, str, str]] = None
+
+    def base(self) -> Tuple[str, str, str]:
+        """
+        Look up the default branch with its head commit and tree SHAs.
+
+        Returns:
+            (default branch name, head commit SHA, head tree SHA)
+        """
+        with self._lock:
+            if self._base is None:
+                default_branch = self.client.get(self.repo_path).json()[
+                    "default_branch"
+                ]
+                branch = self.client.get(
+                    f"{self.repo_path}/branches/{default_branch}"
+                ).json()
+                commit = branch["commit"]
+                self._base = (
+                    default_branch,
+                    commit["sha"],
+                    commit["commit"]["tree"]["sha"],
+                )
+            return self._base
+
+    def create(self, spec: PullRequestSpec) -> Dict:
+        """
+        Commit all of a spec's files on a new branch and open the PR.
+
+        Args:
+            spec: Files, branch name and PR text
+
+        Returns:
+            The created pull request
+        """
+        default_branch, head_sha, tree_sha = self.base()
+
+        # Text files can be sent inline in the tree, so no separate blob calls
+        tree = self.client.post(
+            f"{self.repo_path}/git/trees",
+            json={
+                "base_tree": tree_sha,
+                "tree": [
+                    {
+                        "path": path,
+                        "mode": "100644",
+                        "type": "blob",
+                        "content": content,
+                    }
+                    for path, content in spec.files.items()
+                ],
+            },
+        ).json()
+        commit = self.client.post(
+            f"{self.repo_path}/git/commits",
+            json={
+                "message": spec.commit_message,
+                "tree": tree["sha"],
+                "parents": [head_sha],
+            },
+        ).json()
+        self.client.post(
+            f"{self.repo_path}/git/refs",
+            json={
+                "ref": f"refs/heads/{spec.branch_name}",
+                "sha": commit["sha"],
+            },
+        )
+        return self.client.post(
+            f"{self.repo_path}/pulls",
+            json={
+                "title": spec.title,
+                "body": spec.body,
+                "head": spec.branch_name,
+                "base": default_branch,
+            },
+        ).json()
+
+    def create_many(
+        self,
+        specs: List[PullRequestSpec],
+        max_in_flight: int = PR_MAX_IN_FLIGHT,
+    ) -> List[Dict]:
+        """
+        Open several independent pull requests, sharing one base lookup.
+
+        PRs go up one at a time by default, see PR_MAX_IN_FLIGHT.
+
+        Args:
+            specs: One spec per pull request
+            max_in_flight: Maximum number of PRs being created at once
+
+        Returns:
+            The created pull requests, in the same order as ``specs``
+        """
+        self.base()
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            return list(executor.map(self.create, specs))
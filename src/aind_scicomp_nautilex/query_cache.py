@@ -0,0 +1,360 @@
+"""Cache of DocDB query results keyed on the canonical form of the query"""
+
+import ast
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from aind_scicomp_nautilex.storage import write_atomic
+
+CACHE_TTL = 15 * 60.0
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def parse_query(query: Any) -> Any:
+    """
+    Parse a query the model sent as text, in JSON or Python literal style.
+
+    Args:
+        query: Query dict, or its JSON or Python literal text
+
+    Returns:
+        The query as Python objects, unchanged if it wasn't text
+    """
+    if not isinstance(query, str):
+        return query
+    try:
+        return json.loads(query)
+    except ValueError:
+        return ast.literal_eval(query)
+
+
+def canonicalize(value: Any) -> Any:
+    """
+    Normalize a value so equal ones serialize the same.
+
+    Tuples become lists, integral floats become ints (MongoDB treats 1.0
+    and 1 as equal) and compiled regexes become $regex/$options. Dict keys
+    keep their order, since it matters to MongoDB in $sort specs and in
+    documents compared as a whole; canonical_query sorts the keys of a
+    filter where it doesn't.
+
+    Args:
+        value: Projection, pipeline or any part of one
+
+    Returns:
+        The canonical form
+    """
+    if isinstance(value, dict):
+        return {str(key): canonicalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonicalize(item) for item in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, re.Pattern):
+        options = "".join(
+            flag
+            for flag, bit in (
+                ("i", re.I),
+                ("m", re.M),
+                ("s", re.S),
+                ("x", re.X),
+            )
+            if value.flags & bit
+        )
+        return {"$options": options, "$regex": value.pattern}
+    return value
+
+
+def _is_operators(condition: Any) -> bool:
+    """Whether a condition is a document of operators, e.g. {"$gt": 1}."""
+    return (
+        isinstance(condition, dict)
+        and bool(condition)
+        and all(str(key).startswith("$") for key in condition)
+    )
+
+
+def _canonical_condition(condition: Any) -> Any:
+    """Canonical form of the condition on one path of a filter."""
+    if not _is_operators(condition):
+        return canonicalize(condition)
+    canonical = {}
+    for operator in sorted(condition, key=str):
+        argument = condition[operator]
+        if operator == "$not" or (
+            operator == "$elemMatch" and _is_operators(argument)
+        ):
+            argument = _canonical_condition(argument)
+        elif operator == "$elemMatch":
+            argument = canonical_query(argument)
+        else:
+            argument = canonicalize(argument)
+        canonical[str(operator)] = argument
+    return canonical
+
+
+def canonical_query(query: Any) -> Any:
+    """
+    Normalize a filter so equivalent ones compare and hash the same.
+
+    The fields of the filter and the operators on each field are sorted,
+    as MongoDB ANDs them in any order. Literal values are only passed
+    through canonicalize, so {"subject": {"a": 1, "b": 2}} and
+    {"subject": {"b": 2, "a": 1}}, which match different records, stay
+    different.
+
+    Args:
+        query: MongoDB filter
+
+    Returns:
+        The canonical form
+    """
+    if not isinstance(query, dict):
+        return canonicalize(query)
+    canonical = {}
+    for key in sorted(query, key=str):
+        condition = query[key]
+        if key in ("$and", "$or", "$nor") and isinstance(
+            condition, (list, tuple)
+        ):
+            canonical[key] = [canonical_query(clause) for clause in condition]
+        elif str(key).startswith("$"):
+            canonical[str(key)] = canonicalize(condition)
+        else:
+            canonical[str(key)] = _canonical_condition(condition)
+    return canonical
+
+
+def canonical_pipeline(pipeline: Any) -> Any:
+    """Canonical form of a pipeline, sorting only its $match filters."""
+    if not isinstance(pipeline, (list, tuple)):
+        return canonicalize(pipeline)
+    return [
+        (
+            {"$match": canonical_query(stage["$match"])}
+            if isinstance(stage, dict) and list(stage) == ["$match"]
+            else canonicalize(stage)
+        )
+        for stage in pipeline
+    ]
+
+
+def cache_key(*parts: Any) -> str:
+    """Hash the canonical form of a query and anything else it depends on."""
+    text = json.dumps(
+        canonicalize(list(parts)), separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    """Counters of a QueryCache."""
+
+    hits: int = 0
+    misses: int = 0
+    disk_hits: int = 0
+    expired: int = 0
+    evictions: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups answered from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class QueryCache:
+    """
+    In-memory LRU cache of query results, bounded by total size in bytes.
+
+    Results are stored as JSON text, so every hit hands back a fresh copy
+    that callers can modify, and the entry size is just the text length.
+    Entries expire after a TTL. With a directory, entries are also written
+    to disk and survive between sessions, and the directory is pruned to
+    max_bytes when the cache is created.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = CACHE_MAX_BYTES,
+        ttl: float = CACHE_TTL,
+        directory: Optional[str] = None,
+    ):
+        """
+        Create the cache.
+
+        Args:
+            max_bytes: Total size of cached results kept in memory
+            ttl: Seconds a result stays valid
+            directory: Folder to persist entries in, memory only if None
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.directory = directory
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.prune_directory()
+
+    def _path(self, key: str) -> str:
+        """File holding the persisted entry for a key."""
+        return os.path.join(self.directory, key + ".json")
+
+    def _load(self, key: str) -> Optional[Tuple[float, str]]:
+        """Load a persisted entry."""
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            # Loaded entries count as recently used when pruning
+            os.utime(self._path(key))
+        except (OSError, ValueError):
+            return None
+        return entry["expires"], entry["text"]
+
+    def _discard(self, key: str) -> None:
+        """Remove a persisted entry."""
+        if self.directory:
+            try:
+                os.unlink(self._path(key))
+            except OSError:
+                pass
+
+    def prune_directory(self) -> None:
+        """Delete the least recently used persisted entries past max_bytes."""
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        files = []
+        for entry in os.scandir(self.directory):
+            if (
+                entry.is_file()
+                and entry.name.endswith(".json")
+                and not entry.name.startswith(".tmp-")
+            ):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = 0
+        for _, size, path in sorted(files, reverse=True):
+            total += size
+            if total > self.max_bytes:
+                try:
+                    os.unlink(path)
+                    self.stats.evictions += 1
+                except OSError:
+                    pass
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """
+        Look up a result.
+
+        Args:
+            key: Key from cache_key
+
+        Returns:
+            (True, result) on a hit, (False, None) on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            from_disk = False
+            if entry is None:
+                entry = self._load(key)
+                from_disk = entry is not None
+            if entry is not None and entry[0] < time.time():
+                self.stats.expired += 1
+                self._remove(key)
+                self._discard(key)
+                entry = None
+            if entry is None:
+                self.stats.misses += 1
+                return False, None
+            self.stats.hits += 1
+            if from_disk:
+                self.stats.disk_hits += 1
+                self._insert(key, entry)
+            else:
+                self._entries.move_to_end(key)
+        return True, json.loads(entry[1])
+
+    def put(self, key: str, value: Any) -> None:
+        """
+        Cache a result.
+
+        Args:
+            key: Key from cache_key
+            value: JSON-serializable result
+        """
+        text = json.dumps(value, separators=(",", ":"), default=str)
+        entry = (time.time() + self.ttl, text)
+        if len(text) > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._insert(key, entry)
+            # Under the lock, so a concurrent put of the same key can't
+            # leave the older result on disk
+            if self.directory:
+                write_atomic(
+                    self._path(key),
+                    json.dumps({"expires": entry[0], "text": text}),
+                )
+
+    def _insert(self, key: str, entry: Tuple[float, str]) -> None:
+        """Add an entry, evicting the least recently used ones to make room."""
+        self._entries[key] = entry
+        self.stats.bytes += len(entry[1])
+        while self.stats.bytes > self.max_bytes:
+            evicted, _ = next(iter(self._entries.items()))
+            self._remove(evicted)
+            self._discard(evicted)
+            self.stats.evictions += 1
+        self.stats.entries = len(self._entries)
+
+    def _remove(self, key: str) -> None:
+        """Drop an entry from memory."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.stats.bytes -= len(entry[1])
+        self.stats.entries = len(self._entries)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        Return the cached result, or compute and cache it.
+
+        Args:
+            key: Key from cache_key
+            compute: Function producing the result on a miss
+
+        Returns:
+            The result
+        """
+        hit, value = self.get(key)
+        if hit:
+            return value
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        """Drop every entry from memory, persisted entries are kept."""
+        with self._lock:
+            self._entries.clear()
+            self.stats.bytes = 0
+            self.stats.entries = 0
+
+    def report(self) -> Dict[str, Any]:
+        """Counters and hit rate, e.g. for logging at the end of a sweep."""
+        return {
+            **asdict(self.stats),
+            "hit_rate": round(self.stats.hit_rate, 3),
+        }
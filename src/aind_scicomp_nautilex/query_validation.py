@@ -0,0 +1,516 @@
+"""Check generated DocDB queries against the schema before running them"""
+
+import difflib
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from aind_scicomp_nautilex.lc_tools import count_docdb_records
+from aind_scicomp_nautilex.schema_index import CORE_FILES, SchemaIndex
+from aind_scicomp_nautilex.tracing import propagate
+
+LOGICAL_OPERATORS = {"$and", "$or", "$nor"}
+FIELD_OPERATORS = {
+    "$eq",
+    "$ne",
+    "$gt",
+    "$gte",
+    "$lt",
+    "$lte",
+    "$in",
+    "$nin",
+    "$all",
+    "$exists",
+    "$type",
+    "$size",
+    "$regex",
+    "$options",
+    "$elemMatch",
+    "$not",
+}
+REGEX_OPTIONS = set("imsxu")
+# Top-level record fields besides the core files, _id is the alias of id
+RECORD_FIELDS = {"_id", "schema_version", "describedBy", "object_type"}
+# Fields every AindModel and AindCoreModel has, which aren't in the context
+INHERITED_FIELDS = {"schema_version", "describedBy", "object_type"}
+
+# Clause counts are independent DocDB calls, run this many at once
+CLAUSE_WORKERS = 8
+
+_ARRAY = re.compile(r"\b(List|list|Set|set|Tuple|tuple)\[")
+_SCALAR = re.compile(
+    r"^(Optional\[)?(str|int|float|bool|datetime|date|time|date_type|UUID"
+    r"|Decimal|AwareDatetime|AwareDatetimeWithDefault|Literal\[.*\])\]?$"
+)
+
+
+@dataclass
+class QueryCheck:
+    """Result of checking a query, and its estimated selectivity."""
+
+    query: Any
+    errors: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+    count: Optional[int] = None
+    total: Optional[int] = None
+    # Each clause of the query and the number of records it matches alone
+    clauses: List[Tuple[Dict, int]] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        """Whether the query can be sent to DocDB."""
+        return not self.errors
+
+    @property
+    def selectivity(self) -> Optional[float]:
+        """Fraction of all records the query matches, if it was counted."""
+        if self.count is None or not self.total:
+            return None
+        return self.count / self.total
+
+    def feedback(self) -> str:
+        """Describe the problems found, to send back to the model."""
+        lines = []
+        if self.errors:
+            lines.append("The query is invalid:")
+            lines.extend(f"- {error}" for error in self.errors)
+        if self.warnings:
+            lines.append("Warnings:")
+            lines.extend(f"- {warning}" for warning in self.warnings)
+        if self.count is not None:
+            lines.append(f"The query matches {self.count} records.")
+        if self.clauses:
+            lines.append("On their own, its clauses match:")
+            lines.extend(
+                f"- {json.dumps(clause, default=str)}: {count} records"
+                for clause, count in self.clauses
+            )
+            if any(count == 0 for _, count in self.clauses):
+                lines.append(
+                    "Clauses matching no records probably use a wrong path "
+                    "or value."
+                )
+            else:
+                lines.append(
+                    "Every clause matches on its own, so they are too strict "
+                    "together."
+                )
+        return "\n".join(lines)
+
+
+def _suggest(name: str, options: Set[str]) -> str:
+    """Suggest the closest valid name, if there is one."""
+    close = difflib.get_close_matches(name, sorted(options), n=1)
+    return f", did you mean '{close[0]}'?" if close else ""
+
+
+def check_path(index: SchemaIndex, path: str) -> Tuple[Optional[str], bool]:
+    """
+    Check that a dotted path exists in the schema.
+
+    Paths are followed through the models in the schema context. Once a
+    field's type isn't a model in the context (enums, dicts, generic
+    parameters...), the rest of the path can't be checked and is accepted.
+
+    Args:
+        index: Schema index built from the get_context output
+        path: Dotted path, e.g. "acquisition.tiles.channel.channel_name"
+
+    Returns:
+        (error or None, whether the path goes through an array)
+    """
+    parts = path.split(".")
+    top_level = set(CORE_FILES) | RECORD_FIELDS | index.field_names("Metadata")
+    if parts[0] == "metadata":
+        return (
+            f"'{path}' starts with metadata, but records store the Metadata "
+            f"fields at the top level, use '{'.'.join(parts[1:])}'"
+        ), False
+    if parts[0] not in top_level:
+        return (
+            f"Unknown field '{parts[0]}' in '{path}': paths start with a "
+            f"core file ({', '.join(CORE_FILES)}) or a record field such as "
+            "name"
+            f"{_suggest(parts[0], top_level)}"
+        ), False
+    if parts[0] not in CORE_FILES or CORE_FILES[parts[0]] not in index.entries:
+        return None, False
+
+    models = {CORE_FILES[parts[0]]}
+    through_array = False
+    for i, part in enumerate(parts[1:], start=1):
+        if part.isdigit():
+            through_array = True
+            continue
+        annotations = [
+            annotation
+            for annotation in (
+                index.field_annotation(model, part) for model in models
+            )
+            if annotation is not None
+        ]
+        if not annotations:
+            if part in INHERITED_FIELDS:
+                return None, through_array
+            names = set().union(
+                *(index.field_names(model) for model in models)
+            )
+            return (
+                f"Unknown field '{part}' in '{path}': "
+                f"{' / '.join(sorted(models))} "
+                f"has no such field{_suggest(part, names)}"
+            ), through_array
+        through_array = through_array or any(
+            _ARRAY.search(annotation) for annotation in annotations
+        )
+        following = set().union(
+            *(index._field_type(model, part) for model in models)
+        )
+        following = {
+            model for model in following if index.annotations.get(model)
+        }
+        if not following:
+            if i + 1 < len(parts) and all(
+                _SCALAR.match(annotation) for annotation in annotations
+            ):
+                return (
+                    f"'{'.'.join(parts[:i + 1])}' is a {annotations[0]} "
+                    f"and has no field '{parts[i + 1]}'"
+                ), through_array
+            return None, through_array
+        models = following
+    return None, through_array
+
+
+class QueryValidator:
+    """Checks MongoDB filter fields and operators against the schema."""
+
+    def __init__(self, index: SchemaIndex):
+        """
+        Create the validator.
+
+        Args:
+            index: Schema index built from the get_context output
+        """
+        self.index = index
+
+    def validate(self, query: Any) -> QueryCheck:
+        """
+        Check a query locally, without touching DocDB.
+
+        Args:
+            query: MongoDB filter
+
+        Returns:
+            The errors (unknown fields, misspelled operators, malformed
+            arguments) and warnings (e.g. unanchored regexes over arrays)
+        """
+        check = QueryCheck(query=query)
+        if not isinstance(query, dict):
+            check.errors.append(
+                f"The query must be a JSON object, got {type(query).__name__}"
+            )
+            return check
+        self._check_filter(query, None, check)
+        return check
+
+    def _check_filter(
+        self, query: Dict, base: Optional[str], check: QueryCheck
+    ) -> None:
+        """Check a filter document, with paths relative to base if given."""
+        for key, condition in query.items():
+            if key in LOGICAL_OPERATORS:
+                if not isinstance(condition, list) or not condition:
+                    check.errors.append(
+                        f"{key} needs a non-empty list of filters"
+                    )
+                    continue
+                for clause in condition:
+                    if isinstance(clause, dict):
+                        self._check_filter(clause, base, check)
+                    else:
+                        check.errors.append(
+                            f"Every clause of {key} must be a filter object, "
+                            f"got {clause!r}"
+                        )
+            elif key.startswith("$"):
+                check.errors.append(
+                    f"Unsupported operator {key} at the top of a filter"
+                    f"{_suggest(key, LOGICAL_OPERATORS)}"
+                )
+            else:
+                path = f"{base}.{key}" if base else key
+                error, through_array = check_path(self.index, path)
+                if error:
+                    check.errors.append(error)
+                self._check_condition(path, condition, through_array, check)
+
+    def _check_condition(
+        self, path: str, condition: Any, through_array: bool, check: QueryCheck
+    ) -> None:
+        """Check the condition on one path."""
+        if not isinstance(condition, dict) or not condition:
+            return
+        operators = [key for key in condition if key.startswith("$")]
+        if not operators:
+            return
+        if len(operators) != len(condition):
+            check.errors.append(
+                f"The condition on '{path}' mixes operators and field names"
+            )
+            return
+        for operator in condition:
+            if operator not in FIELD_OPERATORS:
+                check.errors.append(
+                    f"Unknown operator {operator} on '{path}'"
+                    f"{_suggest(operator, FIELD_OPERATORS)}"
+                )
+            elif operator in self._OPERATOR_CHECKS:
+                self._OPERATOR_CHECKS[operator](
+                    self, path, operator, condition, through_array, check
+                )
+
+    def _check_list(
+        self,
+        path: str,
+        operator: str,
+        condition: Dict,
+        through_array: bool,
+        check: QueryCheck,
+    ) -> None:
+        """Check the argument of $in, $nin or $all."""
+        argument = condition[operator]
+        if not isinstance(argument, list):
+            check.errors.append(
+                f"{operator} on '{path}' needs a list, got {argument!r}"
+            )
+
+    def _check_exists(
+        self,
+        path: str,
+        operator: str,
+        condition: Dict,
+        through_array: bool,
+        check: QueryCheck,
+    ) -> None:
+        """Check the argument of $exists, which may also be a number."""
+        argument = condition[operator]
+        if not isinstance(argument, (bool, int, float)):
+            check.errors.append(
+                f"$exists on '{path}' needs true, false or a number, "
+                f"got {argument!r}"
+            )
+
+    def _check_size(
+        self,
+        path: str,
+        operator: str,
+        condition: Dict,
+        through_array: bool,
+        check: QueryCheck,
+    ) -> None:
+        """Check the argument of $size."""
+        argument = condition[operator]
+        if not isinstance(argument, int) or isinstance(argument, bool):
+            check.errors.append(
+                f"$size on '{path}' needs an integer, got {argument!r}"
+            )
+
+    def _check_regex_operator(
+        self,
+        path: str,
+        operator: str,
+        condition: Dict,
+        through_array: bool,
+        check: QueryCheck,
+    ) -> None:
+        """Check $regex along with its $options."""
+        self._check_regex(
+            path,
+            condition[operator],
+            condition.get("$options", ""),
+            through_array,
+            check,
+        )
+
+    def _check_options(
+        self,
+        path: str,
+        operator: str,
+        condition: Dict,
+        through_array: bool,
+        check: QueryCheck,
+    ) -> None:
+        """Check that $options comes with a $regex."""
+        if "$regex" not in condition:
+            check.errors.append(
+                f"$options on '{path}' is only valid next to $regex"
+            )
+
+    def _check_elem_match(
+        self,
+        path: str,
+        operator: str,
+        condition: Dict,
+        through_array: bool,
+        check: QueryCheck,
+    ) -> None:
+        """Check $elemMatch, an element condition or a filter on fields."""
+        argument = condition[operator]
+        if not isinstance(argument, dict) or not argument:
+            check.errors.append(
+                f"$elemMatch on '{path}' needs a filter object"
+            )
+        elif all(key.startswith("$") for key in argument):
+            self._check_condition(path, argument, through_array, check)
+        else:
+            self._check_filter(argument, path, check)
+
+    def _check_not(
+        self,
+        path: str,
+        operator: str,
+        condition: Dict,
+        through_array: bool,
+        check: QueryCheck,
+    ) -> None:
+        """Check $not, an operator object or a regex."""
+        argument = condition[operator]
+        if isinstance(argument, dict):
+            self._check_condition(path, argument, through_array, check)
+        elif not isinstance(argument, str):
+            check.errors.append(
+                f"$not on '{path}' needs an operator object or a regex"
+            )
+
+    # Operators whose argument is checked, the others take any value
+    _OPERATOR_CHECKS = {
+        "$in": _check_list,
+        "$nin": _check_list,
+        "$all": _check_list,
+        "$exists": _check_exists,
+        "$size": _check_size,
+        "$regex": _check_regex_operator,
+        "$options": _check_options,
+        "$elemMatch": _check_elem_match,
+        "$not": _check_not,
+    }
+
+    def _check_regex(
+        self,
+        path: str,
+        pattern: Any,
+        options: Any,
+        through_array: bool,
+        check: QueryCheck,
+    ) -> None:
+        """Check a $regex pattern and its options."""
+        if not isinstance(pattern, str):
+            check.errors.append(
+                f"$regex on '{path}' needs a string pattern, got {pattern!r}"
+            )
+            return
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            check.errors.append(
+                f"$regex on '{path}' is not a valid pattern: {e}"
+            )
+        if not isinstance(options, str) or set(options) - REGEX_OPTIONS:
+            check.errors.append(
+                f"$options on '{path}' must only use the letters "
+                "i, m, s, x and u"
+            )
+        if not pattern.startswith(("^", "\\A")) and through_array:
+            check.warnings.append(
+                f"$regex on '{path}' is not anchored with ^ and runs over "
+                "every element of an array in every record, anchor it or "
+                "match exact values with $in if you can"
+            )
+
+
+def estimate_selectivity(check: QueryCheck) -> QueryCheck:
+    """
+    Count the records a valid query matches, and all records.
+
+    Args:
+        check: Check of a valid query
+
+    Returns:
+        The same check, with count and total filled in
+    """
+    check.count = count_docdb_records(check.query)
+    # Counts are cached, so the total is only fetched once per session
+    check.total = count_docdb_records({})
+    return check
+
+
+def split_clauses(query: Dict) -> List[Dict]:
+    """
+    Split a filter into the clauses that must all hold.
+
+    Args:
+        query: MongoDB filter
+
+    Returns:
+        One filter per top-level field, with $and flattened into its members
+    """
+    clauses = []
+    for key, condition in query.items():
+        if key == "$and" and isinstance(condition, list):
+            for clause in condition:
+                clauses.extend(
+                    split_clauses(clause) if isinstance(clause, dict) else []
+                )
+        else:
+            clauses.append({key: condition})
+    return clauses
+
+
+def count_clauses(
+    check: QueryCheck, max_workers: int = CLAUSE_WORKERS
+) -> QueryCheck:
+    """
+    Count the records each clause of a query matches on its own.
+
+    Used when a query matches nothing, to tell which clause is wrong. The
+    counts run in parallel and are cached like every other count.
+
+    Args:
+        check: Check of a valid query
+        max_workers: Number of counts run at once
+
+    Returns:
+        The same check, with clauses filled in if the query has several
+    """
+    clauses = split_clauses(check.query)
+    if len(clauses) < 2:
+        return check
+    with ThreadPoolExecutor(
+        max_workers=min(max_workers, len(clauses))
+    ) as executor:
+        counts = list(executor.map(propagate(count_docdb_records), clauses))
+    check.clauses = list(zip(clauses, counts))
+    return check
+
+
+def check_query(
+    query: Any, index: SchemaIndex, estimate: bool = True
+) -> QueryCheck:
+    """
+    Validate a query and, if it is valid, estimate how many records it hits.
+
+    Args:
+        query: MongoDB filter
+        index: Schema index built from the get_context output
+        estimate: Count the matches to estimate selectivity
+
+    Returns:
+        The check, with count and total filled in for valid queries
+    """
+    check = QueryValidator(index).validate(query)
+    if check.ok and estimate:
+        estimate_selectivity(check)
+    return check
@@ -0,0 +1,153 @@
+"""Projection-aware sampling of query results for LLM prompts"""
+
+from typing import Iterable, List, Optional, Set
+
+from aind_scicomp_nautilex.lc_tools import iter_docdb_records
+
+SAMPLE_BUDGET_BYTES = 1024 * 10
+IDENTITY_FIELDS = ("_id", "name", "location")
+
+# Operators whose operand is a list of sub-filters on the same document
+_LOGICAL_OPERATORS = ("$and", "$or", "$nor")
+
+
+def extract_filter_paths(query: dict, prefix: str = "") -> Set[str]:
+    """Collect the dotted field paths referenced by a MongoDB filter.
+
+    Args:
+        query: MongoDB filter query
+        prefix: Path prefix applied to nested ($elemMatch) conditions
+
+    Returns:
+        Set of dotted paths, e.g. {"acquisition.tiles.channel.channel_name"}
+    """
+    paths = set()
+    for key, value in query.items():
+        if key in _LOGICAL_OPERATORS:
+            for clause in value:
+                paths |= extract_filter_paths(clause, prefix)
+        elif key.startswith("$"):
+            continue
+        else:
+            path = f"{prefix}{key}"
+            paths.add(path)
+            if isinstance(value, dict):
+                paths |= _extract_operator_paths(value, f"{path}.")
+    return paths
+
+
+def _extract_operator_paths(condition: dict, prefix: str) -> Set[str]:
+    """Collect paths nested inside the operators of a field condition."""
+    paths = set()
+    for operator, operand in condition.items():
+        if operator == "$elemMatch" and isinstance(operand, dict):
+            paths |= extract_filter_paths(operand, prefix)
+        elif operator == "$not" and isinstance(operand, dict):
+            paths |= _extract_operator_paths(operand, prefix)
+    return paths
+
+
+def build_projection(
+    paths: Iterable[str], include: Iterable[str] = IDENTITY_FIELDS
+) -> dict:
+    """Build a MongoDB inclusion projection covering a set of dotted paths.
+
+    Array indexes are dropped from paths and any path nested under another
+    requested path is collapsed into it, since MongoDB rejects projections
+    whose paths collide.
+
+    Args:
+        paths: Dotted field paths to include
+        include: Fields always returned so records can be identified
+
+    Returns:
+        Projection dictionary mapping each path to 1
+    """
+    cleaned = set(include)
+    for path in paths:
+        parts = []
+        for part in path.split("."):
+            if part.isdigit() or part.startswith("$"):
+                break
+            parts.append(part)
+        if parts:
+            cleaned.add(".".join(parts))
+
+    projection = {}
+    for path in sorted(cleaned, key=lambda p: p.count(".")):
+        if not any(path.startswith(f"{kept}.") for kept in projection):
+            projection[path] = 1
+    return projection
+
+
+def estimate_size(value, limit: Optional[int] = None) -> int:
+    """Estimate the serialized size of a record in bytes.
+
+    Walks the structure once, counting keys, scalars and separators, and
+    stops as soon as the running total exceeds ``limit`` so oversized
+    records are rejected without being fully traversed.
+
+    Args:
+        value: Record or sub-value to measure
+        limit: Stop counting once the estimate exceeds this many bytes
+
+    Returns:
+        Estimated size in bytes (at least ``limit + 1`` if it was exceeded)
+    """
+    total = 0
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            total += 2 + 4 * len(item)
+            for key, sub in item.items():
+                total += len(key)
+                stack.append(sub)
+        elif isinstance(item, (list, tuple)):
+            total += 2 + 2 * len(item)
+            stack.extend(item)
+        elif isinstance(item, str):
+            total += len(item) + 2
+        else:
+            total += len(str(item))
+        if limit is not None and total > limit:
+            return total
+    return total
+
+
+def sample_records(
+    query: dict,
+    budget_bytes: int = SAMPLE_BUDGET_BYTES,
+    projection: Optional[dict] = None,
+    batch_size: int = 5,
+) -> List[dict]:
+    """Stream a small, projected sample of the records matching a query.
+
+    Only the subtrees referenced by the filter (plus the identity fields)
+    are fetched, and records are added until the byte budget is filled.
+    At least one record is always returned if any match.
+
+    Args:
+        query: MongoDB filter query
+        budget_bytes: Approximate size budget for the whole sample
+        projection: Projection to use instead of the one derived from query
+        batch_size: Number of records requested per page
+
+    Returns:
+        List of projected records
+    """
+    if projection is None:
+        projection = build_projection(extract_filter_paths(query))
+
+    total_bytes = 0
+    samples = []
+    for record in iter_docdb_records(
+        query, projection=projection, batch_size=batch_size
+    ):
+        remaining = budget_bytes - total_bytes
+        record_bytes = estimate_size(record, limit=remaining)
+        if record_bytes > remaining and samples:
+            break
+        samples.append(record)
+        total_bytes += record_bytes
+    return samples
@@ -0,0 +1,299 @@
+"""Model-dependency index for pruning the schema context to an issue"""
+
+import re
+from collections import defaultdict, deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# (model_name, parent_class, fields) as produced by get_context
+ModelTuple = Tuple[str, Optional[str], List[str]]
+
+# Core files stored on each record and the model each one is a dump of
+CORE_FILES = {
+    "acquisition": "Acquisition",
+    "data_description": "DataDescription",
+    "instrument": "Instrument",
+    "procedures": "Procedures",
+    "processing": "Processing",
+    "quality_control": "QualityControl",
+    "rig": "Rig",
+    "session": "Session",
+    "subject": "Subject",
+}
+
+# Field names shared by more models than this (e.g. "name") say nothing
+# about which model an issue is about, unless they appear in a dotted path
+MAX_FIELD_OWNERS = 5
+
+_MODEL_HEADER = re.compile(r"^Model: (\w+)(?:\((\w+)\))?$")
+_IDENTIFIER = re.compile(r"[A-Za-z_]\w*")
+_TOKEN = re.compile(r"[A-Za-z_][\w.]*")
+
+
+def parse_context(text: str) -> List[ModelTuple]:
+    """
+    Parse a schema context file back into model tuples.
+
+    Args:
+        text: Contents of schema_context.txt or models_context.txt
+
+    Returns:
+        List of (model_name, parent_class, fields) tuples
+    """
+    models = []
+    for block in text.split("\n\n"):
+        lines = block.strip("\n").split("\n")
+        match = _MODEL_HEADER.match(lines[0])
+        if not match:
+            continue
+        fields = [
+            line.removeprefix("  - ")
+            for line in lines[1:]
+            if line.startswith("  - ")
+        ]
+        models.append((match.group(1), match.group(2), fields))
+    return models
+
+
+def _split_field(field: str) -> Tuple[str, str]:
+    """Split a formatted field into its name and type annotation."""
+    name, _, rest = field.partition(": ")
+    annotation = rest.split(" (default=", 1)[0]
+    return name, annotation
+
+
+class SchemaIndex:
+    """Index of which models reference which, built from model tuples."""
+
+    def __init__(self, models: Iterable[ModelTuple]):
+        """
+        Build the index.
+
+        Args:
+            models: (model_name, parent_class, fields) tuples
+        """
+        self.entries: Dict[str, List[ModelTuple]] = defaultdict(list)
+        for model in models:
+            self.entries[model[0]].append(model)
+        self._lower_names = {name.lower(): name for name in self.entries}
+
+        # field name -> model names referenced by its type, per model
+        self.field_types: Dict[str, Dict[str, Set[str]]] = defaultdict(dict)
+        self.annotations: Dict[str, Dict[str, str]] = defaultdict(dict)
+        self.parents: Dict[str, Set[str]] = defaultdict(set)
+        self.references: Dict[str, Set[str]] = defaultdict(set)
+        self.field_owners: Dict[str, Set[str]] = defaultdict(set)
+        for name, parent, fields in models:
+            if parent in self.entries:
+                self.parents[name].add(parent)
+                self.references[name].add(parent)
+            for field in fields:
+                field_name, annotation = _split_field(field)
+                self.annotations[name].setdefault(field_name, annotation)
+                refs = {
+                    ident
+                    for ident in _IDENTIFIER.findall(annotation)
+                    if ident in self.entries and ident != name
+                }
+                self.field_types[name].setdefault(field_name, set()).update(
+                    refs
+                )
+                self.references[name] |= refs
+                self.field_owners[field_name].add(name)
+
+    @classmethod
+    def from_context(cls, *texts: str) -> "SchemaIndex":
+        """Build an index from the contents of one or more context files."""
+        models = []
+        for text in texts:
+            models.extend(parse_context(text))
+        return cls(models)
+
+    def _field_type(self, model: str, field: str) -> Set[str]:
+        """Find the models a field's type references, via parent classes."""
+        seen = set()
+        queue = deque([model])
+        while queue:
+            current = queue.popleft()
+            if current in seen:
+                continue
+            seen.add(current)
+            if field in self.field_types.get(current, {}):
+                return self.field_types[current][field]
+            queue.extend(self.parents.get(current, ()))
+        return set()
+
+    def _ancestors(self, model: str) -> List[str]:
+        """A model followed by its parent classes, nearest first."""
+        seen = []
+        queue = deque([model])
+        while queue:
+            current = queue.popleft()
+            if current not in seen:
+                seen.append(current)
+                queue.extend(sorted(self.parents.get(current, ())))
+        return seen
+
+    def field_annotation(self, model: str, field: str) -> Optional[str]:
+        """
+        Find the type annotation of a field, searching parent classes.
+
+        Args:
+            model: Model name
+            field: Field name
+
+        Returns:
+            The annotation, e.g. "Optional[List[Channel]]", None if the model
+            and its parents have no such field
+        """
+        for current in self._ancestors(model):
+            if field in self.annotations.get(current, {}):
+                return self.annotations[current][field]
+        return None
+
+    def field_names(self, model: str) -> Set[str]:
+        """Names of every field of a model, including inherited ones."""
+        names = set()
+        for current in self._ancestors(model):
+            names.update(self.annotations.get(current, {}))
+        return names
+
+    def resolve_path(self, path: str) -> List[str]:
+        """
+        Resolve a dotted path like "acquisition.tiles.channel.channel_name".
+
+        Args:
+            path: Dotted path starting with a core file name
+
+        Returns:
+            Models visited along the path, starting with the core file's model
+        """
+        parts = path.split(".")
+        root = CORE_FILES.get(parts[0])
+        if root not in self.entries:
+            return []
+        visited = [root]
+        current = {root}
+        for part in parts[1:]:
+            if part.isdigit():
+                continue
+            following = set()
+            for model in current:
+                following |= self._field_type(model, part)
+            if not following:
+                break
+            visited.extend(sorted(following - set(visited)))
+            current = following
+        return visited
+
+    def _shortest_path(self, root: str, target: str) -> List[str]:
+        """Breadth-first search for the chain of models from root to target."""
+        previous = {root: None}
+        queue = deque([root])
+        while queue:
+            current = queue.popleft()
+            if current == target:
+                path = []
+                while current is not None:
+                    path.append(current)
+                    current = previous[current]
+                return path[::-1]
+            for ref in sorted(self.references.get(current, ())):
+                if ref not in previous:
+                    previous[ref] = current
+                    queue.append(ref)
+        return []
+
+    def relevant_models(self, text: str) -> List[str]:
+        """
+        Find the model subgraph an issue touches.
+
+        Dotted paths are resolved field by field, and core files, model names
+        and distinctive field names mentioned in the text are matched. Every
+        matched model is connected back to the core file models by its
+        shortest reference chain, and its direct references are included so
+        the types of its fields are known.
+
+        Args:
+            text: Issue title and body
+
+        Returns:
+            Model names in a stable order, empty if nothing matched
+        """
+        roots = set()
+        targets = set()
+        for token in _TOKEN.findall(text):
+            self._match_token(token, roots, targets)
+        if not targets:
+            return []
+        if not roots:
+            roots = {
+                model for model in CORE_FILES.values() if model in self.entries
+            }
+
+        selected = set(targets)
+        for target in targets:
+            paths = [self._shortest_path(root, target) for root in roots]
+            paths = [path for path in paths if path]
+            if paths:
+                selected.update(min(paths, key=len))
+            selected |= self.references.get(target, set())
+        return sorted(selected)
+
+    def _match_token(
+        self, token: str, roots: Set[str], targets: Set[str]
+    ) -> None:
+        """Add the models a token refers to and the core files it starts at."""
+        parts = [part for part in token.split(".") if part]
+        if len(parts) > 1 and parts[0] in CORE_FILES:
+            resolved = self.resolve_path(".".join(parts))
+            if resolved:
+                roots.add(resolved[0])
+                targets.update(resolved)
+            return
+        for part in parts:
+            if part in CORE_FILES and CORE_FILES[part] in self.entries:
+                roots.add(CORE_FILES[part])
+            targets |= self._match_part(part)
+
+    def _match_part(self, part: str) -> Set[str]:
+        """Models a name refers to: a core file, model or distinctive field."""
+        if part in CORE_FILES and CORE_FILES[part] in self.entries:
+            return {CORE_FILES[part]}
+        if part in self.entries or (
+            len(part) > 3 and part.lower() in self._lower_names
+        ):
+            return {self._lower_names[part.lower()]}
+        if (
+            "_" in part
+            and 0 < len(self.field_owners.get(part, ())) <= MAX_FIELD_OWNERS
+        ):
+            return set(self.field_owners[part])
+        return set()
+
+    def format(self, names: Iterable[str]) -> str:
+        """Format the given models the same way get_context writes them."""
+        output = []
+        for name in names:
+            for model_name, parent_class, fields in self.entries.get(name, ()):
+                if parent_class:
+                    model_name = f"{model_name}({parent_class})"
+                output.append(
+                    f"Model: {model_name}\n"
+                    + "\n".join(f"  - {field}" for field in fields)
+                )
+        return "\n\n".join(output)
+
+    def prune(self, text: str) -> Optional[str]:
+        """
+        Build a schema context containing only the models an issue touches.
+
+        Args:
+            text: Issue title and body
+
+        Returns:
+            Formatted context, or None if nothing in the text matched
+        """
+        names = self.relevant_models(text)
+        if not names:
+            return None
+        return self.format(names)
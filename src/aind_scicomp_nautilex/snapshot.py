@@ -0,0 +1,635 @@
+"""Local DocDB snapshots for offline exploration, dry runs and tests"""
+
+import argparse
+import datetime
+import gzip
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
+
+from aind_scicomp_nautilex.columnar import ColumnarBatch, compile_filter
+from aind_scicomp_nautilex.mongo_filter import (
+    expand_values,
+    matches,
+    project,
+    resolve_path,
+    sort_key,
+)
+from aind_scicomp_nautilex.storage import cache_path, file_mode, write_atomic
+
+DEFAULT_SNAPSHOT_DIR = cache_path("snapshots", "data_assets")
+RECORDS_FILE = "records.jsonl.gz"
+META_FILE = "snapshot.json"
+
+# Top-level fields kept in every snapshot next to the selected core files
+IDENTITY_FIELDS = ("_id", "name", "location", "created", "last_modified")
+SNAPSHOT_FILES = (
+    "acquisition",
+    "data_description",
+    "instrument",
+    "procedures",
+    "processing",
+    "quality_control",
+    "rig",
+    "session",
+    "subject",
+)
+# Paths the generated queries filter on most, indexed on first use
+INDEX_PATHS = (
+    "_id",
+    "name",
+    "subject.subject_id",
+    "data_description.project_name",
+    "data_description.modality.abbreviation",
+    "data_description.platform.abbreviation",
+)
+
+
+def _hashable(value: Any) -> bool:
+    """Whether a value can be an index key."""
+    return not isinstance(value, (dict, list, re.Pattern))
+
+
+class Snapshot:
+    """
+    A local copy of DocDB records, queried with the same filters.
+
+    Records are stored as gzip-compressed JSON lines and loaded on first
+    use. Equality and $in clauses on indexed paths narrow the records down
+    to candidates through a value index, and every candidate is then checked
+    against the full filter with mongo_filter.matches. Other filters are
+    compiled and evaluated over the whole snapshot as a columnar batch.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_SNAPSHOT_DIR,
+        index_paths: Sequence[str] = INDEX_PATHS,
+    ):
+        """
+        Open a snapshot.
+
+        Args:
+            path: Snapshot folder, as written by create_snapshot
+            index_paths: Dotted paths to build value indexes for
+        """
+        self.path = path
+        self.index_paths = set(index_paths)
+        self._lock = threading.Lock()
+        self._records: Optional[List[Dict]] = None
+        self._indexes: Dict[str, Dict[Any, List[int]]] = {}
+        self._batch: Optional[ColumnarBatch] = None
+
+    @property
+    def records(self) -> List[Dict]:
+        """Every record in the snapshot, loaded on first access."""
+        if self._records is None:
+            with self._lock:
+                if self._records is None:
+                    with gzip.open(
+                        os.path.join(self.path, RECORDS_FILE),
+                        "rt",
+                        encoding="utf-8",
+                    ) as f:
+                        self._records = [
+                            json.loads(line) for line in f if line.strip()
+                        ]
+        return self._records
+
+    @property
+    def batch(self) -> ColumnarBatch:
+        """The records as a columnar batch, kept between queries."""
+        if self._batch is None:
+            records = self.records
+            with self._lock:
+                if self._batch is None:
+                    self._batch = ColumnarBatch(records)
+        return self._batch
+
+    @property
+    def meta(self) -> Dict:
+        """How the snapshot was taken: its query, files, size and time."""
+        with open(
+            os.path.join(self.path, META_FILE), "r", encoding="utf-8"
+        ) as f:
+            return json.load(f)
+
+    def index(self, path: str) -> Dict[Any, List[int]]:
+        """
+        Map each value at a path to the positions of the records holding it.
+
+        Records missing the path are indexed under None, like MongoDB treats
+        a missing field as equal to null.
+
+        Args:
+            path: Dotted path to index
+
+        Returns:
+            Value to sorted record positions
+        """
+        if path not in self._indexes:
+            records = self.records
+            with self._lock:
+                if path not in self._indexes:
+                    index = defaultdict(list)
+                    for position, record in enumerate(records):
+                        values = resolve_path(record, path)
+                        keys = {
+                            value
+                            for value in expand_values(values)
+                            if _hashable(value)
+                        }
+                        if not values:
+                            keys.add(None)
+                        for key in keys:
+                            index[key].append(position)
+                    self._indexes[path] = dict(index)
+        return self._indexes[path]
+
+    def _index_keys(self, condition: Any) -> Optional[List[Any]]:
+        """Index keys that every match of a condition must have, if any."""
+        if isinstance(condition, dict):
+            if set(condition) == {"$eq"}:
+                condition = condition["$eq"]
+            elif set(condition) == {"$in"} and isinstance(
+                condition["$in"], list
+            ):
+                keys = condition["$in"]
+                return keys if all(_hashable(key) for key in keys) else None
+            else:
+                return None
+        if _hashable(condition):
+            return [condition]
+        return None
+
+    def _candidates(self, query: Dict) -> Optional[Set[int]]:
+        """Narrow a query down to candidate positions using the indexes."""
+        candidates = None
+        for key, condition in query.items():
+            if key == "$and":
+                found = [self._candidates(clause) for clause in condition]
+                found = [
+                    positions for positions in found if positions is not None
+                ]
+            elif key in self.index_paths or key in self._indexes:
+                keys = self._index_keys(condition)
+                if keys is None:
+                    continue
+                index = self.index(key)
+                found = [
+                    {position for k in keys for position in index.get(k, ())}
+                ]
+            else:
+                continue
+            for positions in found:
+                candidates = (
+                    positions if candidates is None else candidates & positions
+                )
+        return candidates
+
+    def find(
+        self,
+        query: Optional[Dict] = None,
+        projection: Optional[Dict] = None,
+        sort: Optional[Dict] = None,
+        skip: int = 0,
+        limit: int = 0,
+    ) -> List[Dict]:
+        """
+        Find the records matching a MongoDB filter.
+
+        Args:
+            query: MongoDB filter, everything by default
+            projection: MongoDB projection
+            sort: Dotted path to 1 or -1
+            skip: Number of matches to skip
+            limit: Maximum number of records, 0 for no limit
+
+        Returns:
+            Matching records, projected. Nested values are shared with the
+            snapshot, so copy them before modifying.
+        """
+        query = query or {}
+        records = self.records
+        candidates = self._candidates(query)
+        if candidates is None:
+            found = self.batch.select(compile_filter(query)(self.batch))
+        else:
+            found = [
+                records[position]
+                for position in sorted(candidates)
+                if matches(records[position], query)
+            ]
+        for path, direction in reversed(list((sort or {}).items())):
+            found.sort(
+                key=lambda record: sort_key(record, path),
+                reverse=direction < 0,
+            )
+        found = found[skip:]
+        if limit:
+            found = found[:limit]
+        return [project(record, projection) for record in found]
+
+    def count(self, query: Optional[Dict] = None) -> int:
+        """Count the records matching a MongoDB filter."""
+        query = query or {}
+        candidates = self._candidates(query)
+        if candidates is None:
+            return self.batch.count(compile_filter(query)(self.batch))
+        return sum(
+            1
+            for position in candidates
+            if matches(self.records[position], query)
+        )
+
+    def aggregate(self, pipeline: List[Dict]) -> List[Dict]:
+        """
+        Run a read-only aggregation pipeline on the snapshot.
+
+        Supports $match, $project, $sort, $skip, $limit, $count, $group
+        ($sum, $push, $addToSet, $first, $min, $max, $avg) and $facet, which
+        covers the footprint pipeline.
+
+        Args:
+            pipeline: Aggregation stages
+
+        Returns:
+            The resulting documents
+        """
+        documents = None
+        for stage in pipeline:
+            ((operator, argument),) = stage.items()
+            if operator == "$match" and documents is None:
+                documents = self.find(argument)
+                continue
+            if documents is None:
+                documents = self.records
+            documents = _run_stage(documents, operator, argument)
+        return list(self.records if documents is None else documents)
+
+
+def _field_value(document: Any, path: str) -> Any:
+    """Value of a "$field.path" expression, mapping over arrays like
+    MongoDB."""
+    value = document
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part)
+        elif isinstance(value, list):
+            value = [
+                item.get(part)
+                for item in value
+                if isinstance(item, dict) and part in item
+            ]
+        else:
+            return None
+    return value
+
+
+def _evaluate(expression: Any, document: Dict) -> Any:
+    """Evaluate an aggregation expression against a document."""
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _field_value(document, expression[1:])
+    if isinstance(expression, list):
+        return [_evaluate(item, document) for item in expression]
+    if isinstance(expression, dict):
+        if set(expression) == {"$slice"}:
+            values, n = _evaluate(expression["$slice"], document)
+            if not isinstance(values, list):
+                return None
+            return values[:n] if n >= 0 else values[n:]
+        if any(key.startswith("$") for key in expression):
+            raise ValueError(
+                f"Unsupported aggregation expression: {expression}"
+            )
+        return {
+            key: _evaluate(value, document)
+            for key, value in expression.items()
+        }
+    return expression
+
+
+def _accumulate_sum(group: Dict, state: Dict, name: str, value: Any) -> None:
+    """$sum of the numeric values."""
+    group[name] = group.get(name, 0) + (
+        value if isinstance(value, (int, float)) else 0
+    )
+
+
+def _accumulate_push(group: Dict, state: Dict, name: str, value: Any) -> None:
+    """$push every value."""
+    group.setdefault(name, []).append(value)
+
+
+def _accumulate_add_to_set(
+    group: Dict, state: Dict, name: str, value: Any
+) -> None:
+    """$addToSet the distinct values."""
+    if value not in group.setdefault(name, []):
+        group[name].append(value)
+
+
+def _accumulate_first(group: Dict, state: Dict, name: str, value: Any) -> None:
+    """$first value of the group."""
+    group.setdefault(name, value)
+
+
+def _accumulate_extreme(minimum: bool):
+    """Build the $min or $max accumulator, which ignore missing values."""
+
+    def accumulate(group: Dict, state: Dict, name: str, value: Any) -> None:
+        """Keep the smallest (or largest) value seen."""
+        if value is not None and (
+            name not in group
+            or group[name] is None
+            or (value < group[name]) == minimum
+        ):
+            group[name] = value
+
+    return accumulate
+
+
+def _accumulate_avg(group: Dict, state: Dict, name: str, value: Any) -> None:
+    """$avg of the numeric values, keeping the running total and count."""
+    total, n = state.get(name, (0, 0))
+    if isinstance(value, (int, float)):
+        total, n = total + value, n + 1
+    state[name] = (total, n)
+    group[name] = total / n if n else None
+
+
+_ACCUMULATORS = {
+    "$sum": _accumulate_sum,
+    "$push": _accumulate_push,
+    "$addToSet": _accumulate_add_to_set,
+    "$first": _accumulate_first,
+    "$min": _accumulate_extreme(True),
+    "$max": _accumulate_extreme(False),
+    "$avg": _accumulate_avg,
+}
+
+
+def _group(documents: List[Dict], spec: Dict) -> List[Dict]:
+    """Run a $group stage."""
+    accumulators = []
+    for name, accumulator in spec.items():
+        if name == "_id":
+            continue
+        ((operator, expression),) = accumulator.items()
+        if operator not in _ACCUMULATORS:
+            raise ValueError(f"Unsupported accumulator: {operator}")
+        accumulators.append((name, _ACCUMULATORS[operator], expression))
+
+    groups: Dict[str, Dict] = {}
+    states: Dict[str, Dict] = defaultdict(dict)
+    for document in documents:
+        key = _evaluate(spec["_id"], document)
+        group_key = json.dumps(key, sort_keys=True, default=str)
+        group = groups.setdefault(group_key, {"_id": key})
+        for name, accumulate, expression in accumulators:
+            accumulate(
+                group, states[group_key], name, _evaluate(expression, document)
+            )
+    return list(groups.values())
+
+
+def _sort_stage(documents: List[Dict], argument: Dict) -> List[Dict]:
+    """Run a $sort stage, one stable sort per key starting with the last."""
+    documents = list(documents)
+    for path, direction in reversed(list(argument.items())):
+        documents.sort(
+            key=lambda document: sort_key(document, path),
+            reverse=direction < 0,
+        )
+    return documents
+
+
+def _project_stage(documents: List[Dict], argument: Dict) -> List[Dict]:
+    """Run a $project stage of inclusions and computed fields."""
+    included = {path for path, value in argument.items() if value in (1, True)}
+    expressions = {
+        path: value
+        for path, value in argument.items()
+        if path != "_id" and value not in (0, 1, True, False)
+    }
+    projected = []
+    for document in documents:
+        result = (
+            project(document, {path: 1 for path in included})
+            if included
+            else {}
+        )
+        if argument.get("_id", 1) and "_id" in document:
+            result["_id"] = document["_id"]
+        for path, expression in expressions.items():
+            result[path] = _evaluate(expression, document)
+        projected.append(result)
+    return projected
+
+
+_STAGES = {
+    "$match": lambda documents, argument: [
+        document for document in documents if matches(document, argument)
+    ],
+    "$sort": _sort_stage,
+    "$skip": lambda documents, argument: documents[argument:],
+    "$limit": lambda documents, argument: documents[:argument],
+    "$count": lambda documents, argument: (
+        [{argument: len(documents)}] if documents else []
+    ),
+    "$group": _group,
+    "$facet": lambda documents, argument: [
+        {
+            name: _run_pipeline(documents, stages)
+            for name, stages in argument.items()
+        }
+    ],
+    "$project": _project_stage,
+}
+
+
+def _run_stage(
+    documents: List[Dict], operator: str, argument: Any
+) -> List[Dict]:
+    """Run one aggregation stage on a list of documents."""
+    if operator not in _STAGES:
+        raise ValueError(f"Unsupported aggregation stage: {operator}")
+    return _STAGES[operator](documents, argument)
+
+
+def _run_pipeline(documents: List[Dict], stages: List[Dict]) -> List[Dict]:
+    """Run several aggregation stages on a list of documents."""
+    for stage in stages:
+        ((operator, argument),) = stage.items()
+        documents = _run_stage(documents, operator, argument)
+    return documents
+
+
+class SnapshotClient:
+    """
+    Stand-in for MetadataDbClient that answers from a local snapshot.
+
+    Implements the client methods the tools use, so setting
+    NAUTILEX_DOCDB_SNAPSHOT points lc_tools, and through it the explorer,
+    solver and dry runs, at the snapshot instead of the live database.
+    """
+
+    def __init__(self, snapshot: Snapshot):
+        """Wrap a snapshot."""
+        self.snapshot = snapshot
+
+    def _get_records(
+        self,
+        filter_query: Optional[Dict] = None,
+        projection: Optional[Dict] = None,
+        sort: Optional[Dict] = None,
+        limit: int = 0,
+        skip: int = 0,
+    ) -> List[Dict]:
+        """Get one page of matching records."""
+        return self.snapshot.find(filter_query, projection, sort, skip, limit)
+
+    def _count_records(
+        self, filter_query: Optional[Dict] = None
+    ) -> Dict[str, int]:
+        """Count all records and the matching ones."""
+        return {
+            "total_record_count": len(self.snapshot.records),
+            "filtered_record_count": self.snapshot.count(filter_query),
+        }
+
+    def retrieve_docdb_records(
+        self,
+        filter_query: Optional[Dict] = None,
+        projection: Optional[Dict] = None,
+        sort: Optional[Dict] = None,
+        limit: int = 0,
+        **kwargs,
+    ) -> List[Dict]:
+        """Get every matching record, pagination options are ignored."""
+        return self.snapshot.find(filter_query, projection, sort, limit=limit)
+
+    def aggregate_docdb_records(self, pipeline: List[Dict]) -> List[Dict]:
+        """Run an aggregation pipeline on the snapshot."""
+        return self.snapshot.aggregate(pipeline)
+
+
+def write_snapshot(
+    path: str, records: Iterable[Dict], meta: Optional[Dict] = None
+) -> int:
+    """
+    Write records as a snapshot, replacing any existing one at path.
+
+    Args:
+        path: Snapshot folder
+        records: Records to store
+        meta: Extra information saved with the snapshot, e.g. its query
+
+    Returns:
+        Number of records written
+    """
+    os.makedirs(path, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=path, prefix=".tmp-", suffix=RECORDS_FILE
+    )
+    count = 0
+    try:
+        with (
+            os.fdopen(fd, "wb") as raw,
+            gzip.GzipFile(fileobj=raw, mode="wb") as f,
+        ):
+            for record in records:
+                f.write(
+                    json.dumps(
+                        record, separators=(",", ":"), default=str
+                    ).encode("utf-8")
+                )
+                f.write(b"\n")
+                count += 1
+        os.chmod(tmp_path, file_mode(os.path.join(path, RECORDS_FILE)))
+        os.replace(tmp_path, os.path.join(path, RECORDS_FILE))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    write_atomic(
+        os.path.join(path, META_FILE),
+        json.dumps(
+            {
+                **(meta or {}),
+                "records": count,
+                "created": datetime.datetime.now(
+                    datetime.timezone.utc
+                ).isoformat(),
+            },
+            indent=2,
+            default=str,
+        ),
+    )
+    return count
+
+
+def create_snapshot(
+    path: str = DEFAULT_SNAPSHOT_DIR,
+    query: Optional[Dict] = None,
+    files: Sequence[str] = SNAPSHOT_FILES,
+    limit: int = 0,
+) -> Snapshot:
+    """
+    Dump records from DocDB into a local snapshot.
+
+    Args:
+        path: Snapshot folder
+        query: MongoDB filter selecting the records, everything by default
+        files: Core files kept in each record, next to IDENTITY_FIELDS
+        limit: Maximum number of records, 0 for no limit
+
+    Returns:
+        The new snapshot
+    """
+    # Imported here so reading a snapshot never needs the DocDB client
+    from aind_scicomp_nautilex.lc_tools import iter_docdb_records
+
+    projection = {field: 1 for field in (*IDENTITY_FIELDS, *files)}
+    records = iter_docdb_records(
+        query or {}, projection=projection, limit=limit
+    )
+    write_snapshot(
+        path, records, meta={"query": query or {}, "files": list(files)}
+    )
+    return Snapshot(path)
+
+
+def main(argv=None):
+    """Dump DocDB records into a local snapshot."""
+    parser = argparse.ArgumentParser(
+        description="Save DocDB records to a local snapshot for offline use"
+    )
+    parser.add_argument(
+        "path", nargs="?", default=DEFAULT_SNAPSHOT_DIR, help="Snapshot folder"
+    )
+    parser.add_argument(
+        "--query", type=json.loads, default=None, help="MongoDB filter as JSON"
+    )
+    parser.add_argument(
+        "--files",
+        nargs="+",
+        default=list(SNAPSHOT_FILES),
+        help="Core files to keep",
+    )
+    parser.add_argument(
+        "--limit", type=int, default=0, help="Maximum number of records"
+    )
+    args = parser.parse_args(argv)
+
+    snapshot = create_snapshot(
+        args.path, query=args.query, files=args.files, limit=args.limit
+    )
+    print(f"Saved {snapshot.meta['records']} records to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Local cache locations and atomic file writes"""
+
+import os
+import stat
+import tempfile
+
+CACHE_DIR = os.getenv(
+    "NAUTILEX_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "aind-scicomp-nautilex"),
+)
+
+# Read once, os.umask can only be queried by setting it, which isn't
+# thread-safe
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def cache_path(*parts: str) -> str:
+    """Build a path inside the local cache directory."""
+    return os.path.join(CACHE_DIR, *parts)
+
+
+def file_mode(path):
+    """Permissions for a new version of path: its own, or 0o644 less umask."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o644 & ~_UMASK
+
+
+def write_atomic(path, text):
+    """Write text to a temporary file next to path and move it into place.
+
+    mkstemp creates the file readable by its owner only, so it is given the
+    destination's permissions before replacing it.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=".tmp-", suffix=os.path.basename(path)
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.chmod(tmp_path, file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
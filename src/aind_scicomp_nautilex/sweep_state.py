@@ -0,0 +1,213 @@
+"""Checkpointed state of explorer and solver sweeps, so runs can resume"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from aind_scicomp_nautilex.query_cache import cache_key
+from aind_scicomp_nautilex.storage import cache_path
+
+SWEEP_STATE_PATH = os.getenv(
+    "NAUTILEX_SWEEP_STATE", cache_path("sweeps.sqlite")
+)
+# Larger stage outputs (e.g. states holding the schema block), and those that
+# aren't plain JSON (e.g. states holding a dry run's future), are journaled
+# as a digest only, so an interrupted issue can't resume from them
+MAX_OUTPUT_CHARS = 64 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stages (
+    sweep TEXT NOT NULL,
+    issue INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    inputs TEXT NOT NULL,
+    output TEXT NOT NULL,
+    completed_at REAL NOT NULL,
+    PRIMARY KEY (sweep, issue, stage)
+)
+"""
+
+
+def issue_fingerprint(issue: Dict) -> str:
+    """
+    Identify the version of an issue the sweep acted on.
+
+    Only the title and body are used: updated_at also changes when the
+    explorer comments or the solver links a PR, which aren't edits.
+    """
+    return cache_key(issue.get("title"), issue.get("body"))
+
+
+def _serialize(value: Any) -> str:
+    """JSON of a stage output, or its digest if too large or not plain JSON."""
+    try:
+        text = json.dumps(value)
+    except (TypeError, ValueError):
+        text = json.dumps(value, default=str)
+    else:
+        if len(text) <= MAX_OUTPUT_CHARS:
+            return text
+    return json.dumps(
+        {
+            "digest": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+            "chars": len(text),
+        }
+    )
+
+
+def _is_digest(output: Any) -> bool:
+    """Whether a journaled output is only the digest of the real one."""
+    return isinstance(output, dict) and output.keys() == {"digest", "chars"}
+
+
+class SweepState:
+    """
+    SQLite journal of the stages each issue completed in a sweep.
+
+    Every completed stage is recorded with the issue's fingerprint, a
+    digest of its input and its output. An issue whose final stage was
+    completed for its current title and body is skipped by run_pipeline,
+    so rerunning a sweep, or running it on a schedule, only processes new
+    and edited issues and never posts the same comment or PR twice. An
+    issue interrupted part way resumes after the stages it completed, see
+    ``resume``.
+    """
+
+    def __init__(self, sweep: str, path: str = SWEEP_STATE_PATH):
+        """
+        Open (or create) the journal.
+
+        Args:
+            sweep: Name of the sweep, e.g. "explore" or "solve"
+            path: SQLite file, shared by every sweep
+        """
+        self.sweep = sweep
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        # Shared by the pipeline's worker threads, serialized by the lock
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(_SCHEMA)
+
+    def lookup(self, issue: Dict, stage: str) -> Tuple[bool, Any]:
+        """
+        Find the output of a stage completed for the current issue version.
+
+        Args:
+            issue: GitHub issue
+            stage: Stage name
+
+        Returns:
+            (True, output) if the stage completed for this title and body,
+            (False, None) otherwise
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT fingerprint, output FROM stages WHERE sweep = ? AND "
+                "issue = ? AND stage = ?",
+                (self.sweep, issue["number"], stage),
+            ).fetchone()
+        if row is None or row[0] != issue_fingerprint(issue):
+            return False, None
+        return True, json.loads(row[1])
+
+    def resume(self, issue: Dict, stages: Sequence[str]) -> Tuple[int, Any]:
+        """
+        Find the stage an issue picks up from, for its current version.
+
+        Stages are looked up in order until one didn't complete. The issue
+        restarts there with the previous stage's output, or further back
+        when that output was only journaled as a digest.
+
+        Args:
+            issue: GitHub issue
+            stages: Stage names, in the order they run
+
+        Returns:
+            (index of the first stage to run, that stage's input). The index
+            is ``len(stages)`` if every stage completed, with the last output
+        """
+        outputs = []
+        for stage in stages:
+            done, output = self.lookup(issue, stage)
+            if not done:
+                break
+            outputs.append(output)
+        else:
+            return len(stages), outputs[-1] if outputs else None
+        while outputs and _is_digest(outputs[-1]):
+            outputs.pop()
+        return len(outputs), outputs[-1] if outputs else None
+
+    def record(
+        self, issue: Dict, stage: str, inputs: Any, output: Any
+    ) -> None:
+        """
+        Record that an issue completed a stage.
+
+        Args:
+            issue: GitHub issue
+            stage: Stage name
+            inputs: The stage's input, journaled as a digest
+            output: The stage's output, journaled as JSON or as a digest
+        """
+        row = (
+            self.sweep,
+            issue["number"],
+            stage,
+            issue_fingerprint(issue),
+            cache_key(inputs),
+            _serialize(output),
+            time.time(),
+        )
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO stages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+
+    def history(self, issue_number: int) -> List[Dict]:
+        """Stages an issue completed in this sweep, oldest first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT stage, fingerprint, inputs, output, completed_at "
+                "FROM stages WHERE sweep = ? AND issue = ? "
+                "ORDER BY completed_at",
+                (self.sweep, issue_number),
+            ).fetchall()
+        return [
+            {
+                "stage": stage,
+                "fingerprint": fingerprint,
+                "inputs": inputs,
+                "output": json.loads(output),
+                "completed_at": completed_at,
+            }
+            for stage, fingerprint, inputs, output, completed_at in rows
+        ]
+
+    def forget(self, issue_number: Optional[int] = None) -> None:
+        """Drop the journal of one issue, or of the whole sweep, to redo it."""
+        with self._lock, self._db:
+            if issue_number is None:
+                self._db.execute(
+                    "DELETE FROM stages WHERE sweep = ?", (self.sweep,)
+                )
+            else:
+                self._db.execute(
+                    "DELETE FROM stages WHERE sweep = ? AND issue = ?",
+                    (self.sweep, issue_number),
+                )
+
+    def close(self) -> None:
+        """Close the database."""
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,268 @@
+"""Per-stage tracing of explorer and solver sweeps, written as JSON lines"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from aind_scicomp_nautilex.storage import cache_path
+
+TRACE_DIR = os.getenv("NAUTILEX_TRACE_DIR", cache_path("traces"))
+# Counters every span carries, summed per stage in the summary table
+COUNTERS = (
+    "bytes",
+    "records",
+    "input_tokens",
+    "output_tokens",
+    "cached_tokens",
+)
+
+_current: ContextVar[Optional["Span"]] = ContextVar(
+    "nautilex_span", default=None
+)
+
+
+@dataclass
+class Span:
+    """
+    One traced stage (or step within a stage) of one issue.
+
+    Serialized with the field names of OpenTelemetry's span JSON, so the
+    trace files can be loaded by OTLP tooling as well as read directly.
+    """
+
+    tracer: "Tracer"
+    name: str
+    issue: Optional[int] = None
+    parent_id: Optional[str] = None
+    span_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    start: float = field(default_factory=time.time)
+    duration: Optional[float] = None
+    error: Optional[str] = None
+    counters: Dict[str, float] = field(
+        default_factory=lambda: dict.fromkeys(COUNTERS, 0)
+    )
+    _started: float = field(default_factory=time.monotonic)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def add(self, **counters: float) -> None:
+        """Add to the span's counters, e.g. add(records=5, bytes=1024)."""
+        with self._lock:
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + (value or 0)
+
+    def end(self) -> None:
+        """Stop the clock."""
+        self.duration = time.monotonic() - self._started
+
+    def to_dict(self) -> Dict[str, Any]:
+        """OpenTelemetry-style span document."""
+        return {
+            "name": self.name,
+            "trace_id": self.tracer.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "start_time_unix_nano": int(self.start * 1e9),
+            "end_time_unix_nano": int(
+                (self.start + (self.duration or 0)) * 1e9
+            ),
+            "status": (
+                {"code": "ERROR", "message": self.error}
+                if self.error
+                else {"code": "OK"}
+            ),
+            "attributes": {
+                "sweep": self.tracer.sweep,
+                "issue": self.issue,
+                "duration_s": round(self.duration or 0, 4),
+                **self.counters,
+            },
+        }
+
+
+class Tracer:
+    """
+    Records a span per pipeline stage and issue, and summarizes a sweep.
+
+    Spans are appended to a JSON lines file as they end, so a crashed sweep
+    still leaves its trace behind. Code deeper down (the Bedrock client,
+    DocDB queries, GitHub requests) adds its counters to whichever span is
+    current in its thread through ``record``.
+    """
+
+    def __init__(self, sweep: str, path: Optional[str] = None):
+        """
+        Start a trace.
+
+        Args:
+            sweep: Name of the sweep, e.g. "explore" or "solve"
+            path: JSON lines file, by default a new file in TRACE_DIR,
+                "" to keep the spans in memory only
+        """
+        self.sweep = sweep
+        self.trace_id = uuid.uuid4().hex
+        if path is None:
+            timestamp = (
+                datetime.now().isoformat(timespec="seconds").replace(":", "-")
+            )
+            path = os.path.join(TRACE_DIR, f"{sweep}-{timestamp}.jsonl")
+        self.path = path
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, issue: Optional[int] = None) -> Iterator[Span]:
+        """
+        Trace a block, as a child of the current span if there is one.
+
+        Args:
+            name: Stage name, e.g. "query_generation"
+            issue: Issue number, inherited from the parent span if None
+
+        Yields:
+            The span, current for the duration of the block
+        """
+        parent = _current.get()
+        if issue is None and parent is not None:
+            issue = parent.issue
+        span = Span(
+            tracer=self,
+            name=name,
+            issue=issue,
+            parent_id=parent.span_id if parent is not None else None,
+        )
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current.reset(token)
+            span.end()
+            self._finish(span)
+
+    def _finish(self, span: Span) -> None:
+        """Keep the span and append it to the trace file."""
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self.spans.append(span)
+            if self.path:
+                os.makedirs(
+                    os.path.dirname(os.path.abspath(self.path)), exist_ok=True
+                )
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+
+    def summary(self) -> str:
+        """
+        Table of the sweep's spans, one row per stage.
+
+        Counters of nested spans (e.g. truncation within db_execution) are
+        only counted in their own row.
+
+        Returns:
+            The table as text
+        """
+        with self._lock:
+            spans = list(self.spans)
+        stages: Dict[str, List[Span]] = {}
+        for span in spans:
+            stages.setdefault(span.name, []).append(span)
+        header = [
+            "stage",
+            "spans",
+            "errors",
+            "total s",
+            "mean s",
+            "max s",
+            "bytes",
+            "records",
+            "in tok",
+            "out tok",
+            "cached tok",
+        ]
+        rows = []
+        for name, group in stages.items():
+            durations = [span.duration or 0 for span in group]
+            rows.append(
+                [
+                    name,
+                    str(len(group)),
+                    str(sum(1 for span in group if span.error)),
+                    f"{sum(durations):.2f}",
+                    f"{sum(durations) / len(durations):.2f}",
+                    f"{max(durations):.2f}",
+                    *(
+                        f"{total:,.0f}"
+                        for total in (
+                            sum(
+                                span.counters.get(counter, 0) for span in group
+                            )
+                            for counter in COUNTERS
+                        )
+                    ),
+                ]
+            )
+        widths = [
+            max(len(row[i]) for row in [header] + rows)
+            for i in range(len(header))
+        ]
+        lines = [
+            "  ".join(
+                cell.ljust(width) if i == 0 else cell.rjust(width)
+                for i, (cell, width) in enumerate(zip(row, widths))
+            )
+            for row in [header] + rows
+        ]
+        lines.insert(1, "  ".join("-" * width for width in widths))
+        return (
+            f"Sweep {self.sweep} ({self.path or 'not written'}):\n"
+            + "\n".join(lines)
+        )
+
+
+def current_span() -> Optional[Span]:
+    """The span current in this thread, None outside of a traced sweep."""
+    return _current.get()
+
+
+def record(**counters: float) -> None:
+    """Add counters to the current span, if any, e.g. record(bytes=1024)."""
+    span = _current.get()
+    if span is not None:
+        span.add(**counters)
+
+
+def traced(name: str):
+    """Trace a block under the current span, or do nothing outside a sweep."""
+    span = _current.get()
+    return span.tracer.span(name) if span is not None else nullcontext()
+
+
+def propagate(func: Callable) -> Callable:
+    """
+    Make func record into the current span when run on another thread.
+
+    Executors don't carry context variables over to their workers, so work
+    handed to them (e.g. parallel clause counts) is wrapped with this.
+    """
+    span = _current.get()
+    if span is None:
+        return func
+
+    def run(*args, **kwargs):
+        """Run func with the captured span current."""
+        token = _current.set(span)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+
+    return run
@@ -0,0 +1,118 @@
+"""Tests for the shared Bedrock client and its rate limiter."""
+
+import unittest
+from unittest import mock
+
+from aind_scicomp_nautilex import bedrock_client
+from aind_scicomp_nautilex.bedrock_client import RateLimiter, TokenBucket
+from aind_scicomp_nautilex.tracing import Tracer
+
+
+class TokenBucketTest(unittest.TestCase):
+    """Tests for TokenBucket, on a fake clock."""
+
+    def setUp(self):
+        """Freeze time, sleeping moves it forward."""
+        self.now = [0.0]
+        for target, fake in (
+            ("time.monotonic", lambda: self.now[0]),
+            (
+                "time.sleep",
+                lambda seconds: self.now.__setitem__(0, self.now[0] + seconds),
+            ),
+        ):
+            patcher = mock.patch(
+                f"aind_scicomp_nautilex.bedrock_client.{target}", fake
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_acquire(self):
+        """Requests wait for the tokens they need, capped at the capacity."""
+        bucket = TokenBucket(60)
+        self.assertEqual(bucket.acquire(60), 0.0)
+        self.assertAlmostEqual(bucket.acquire(1), 1.0)
+        self.assertAlmostEqual(bucket.acquire(600), 60.0)
+
+    def test_charge(self):
+        """Charges can overdraw the bucket or give tokens back."""
+        bucket = TokenBucket(60)
+        bucket.charge(90)
+        self.assertAlmostEqual(bucket.acquire(1), 31.0)
+        bucket.charge(-1000)
+        self.assertEqual(bucket.acquire(60), 0.0)
+
+    def test_limiter(self):
+        """The limiter waits on both buckets and settles the real usage."""
+        limiter = RateLimiter(rpm=60, tpm=600)
+        limiter.acquire(600)
+        limiter.acquire(10)
+        self.assertAlmostEqual(limiter.waited, 1.0)
+        limiter.settle(10, 610)
+        self.assertAlmostEqual(limiter.tokens.acquire(1), 60.1)
+
+
+class BedrockClientTest(unittest.TestCase):
+    """Tests for the client's rate-limiting hooks."""
+
+    def setUp(self):
+        """Create the client on a fake boto3, keeping its event handlers."""
+        for getter in (
+            bedrock_client.get_bedrock_client,
+            bedrock_client.get_rate_limiter,
+        ):
+            getter.reset()
+            self.addCleanup(getter.reset)
+        with mock.patch.object(bedrock_client.boto3, "client") as client:
+            self.client = bedrock_client.get_bedrock_client()
+        self.config = client.call_args.kwargs["config"]
+        self.handlers = {
+            call.args[0]: call.args[1]
+            for call in self.client.meta.events.register.call_args_list
+        }
+        self.limiter = bedrock_client.get_rate_limiter()
+
+    def test_client(self):
+        """One client is shared, retrying adaptively with a large pool."""
+        self.assertIs(bedrock_client.get_bedrock_client(), self.client)
+        self.assertEqual(self.config.retries["mode"], "adaptive")
+        self.assertEqual(
+            self.config.max_pool_connections, bedrock_client.BEDROCK_MAX_POOL
+        )
+        self.assertEqual(len(self.handlers), 4)
+
+    def test_hooks(self):
+        """Model calls wait for the limiter, then charge and trace usage."""
+        tracer = Tracer("test", path="")
+        context = {}
+        headers = {
+            "x-amzn-bedrock-input-token-count": "90",
+            "x-amzn-bedrock-output-token-count": "20",
+            "content-length": "50",
+        }
+        with (
+            mock.patch.object(self.limiter, "acquire") as acquire,
+            mock.patch.object(self.limiter, "settle") as settle,
+            tracer.span("solve") as span,
+        ):
+            self.handlers["before-call.bedrock-runtime.InvokeModel"](
+                params={"body": b"x" * 400}, context=context, model=None
+            )
+            self.handlers["after-call.bedrock-runtime.InvokeModel"](
+                parsed={"ResponseMetadata": {"HTTPHeaders": headers}},
+                context=context,
+                model=None,
+            )
+            # Streams don't report their usage in the headers
+            self.handlers[
+                "after-call.bedrock-runtime.InvokeModelWithResponseStream"
+            ](parsed={}, context={}, model=None)
+        acquire.assert_called_once_with(100.0)
+        settle.assert_called_once_with(100.0, 110)
+        self.assertEqual(
+            (span.counters["bytes"], span.counters["input_tokens"]), (450, 90)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
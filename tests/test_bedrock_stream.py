@@ -0,0 +1,163 @@
+"""Tests for streaming Bedrock responses."""
+
+import json
+import unittest
+from unittest import mock
+
+from aind_scicomp_nautilex.bedrock_stream import (
+    CodeBlockExtractor,
+    StreamStats,
+    stream_message,
+)
+
+
+def chunk(payload):
+    """Wrap a payload as a response stream event."""
+    return {"chunk": {"bytes": json.dumps(payload).encode("utf-8")}}
+
+
+def text(delta):
+    """Event carrying a text delta."""
+    return chunk(
+        {
+            "type": "content_block_delta",
+            "delta": {"type": "text_delta", "text": delta},
+        }
+    )
+
+
+class CodeBlockExtractorTest(unittest.TestCase):
+    """Tests for CodeBlockExtractor."""
+
+    def feed(self, chunks):
+        """Feed chunks, returning what each feed and the finish returned."""
+        extractor = CodeBlockExtractor()
+        return [extractor.feed(part) for part in chunks] + [extractor.finish()]
+
+    def test_fenced_block(self):
+        """Blocks come with the chunk closing them, even with split fences."""
+        results = self.feed(
+            [
+                "Here:\n``",
+                "`python\nx = 1\n",
+                "y = 2\n`",
+                "``\nMore prose\n",
+                "```\n",
+            ]
+        )
+        self.assertEqual(
+            results, [None, None, None, "x = 1\ny = 2\n", None, None]
+        )
+
+    def test_no_fence(self):
+        """Without a fence the whole reply is the code."""
+        self.assertEqual(
+            self.feed(["import os\n", "print(os.sep)"])[-1],
+            "import os\nprint(os.sep)\n",
+        )
+
+    def test_unclosed_fence(self):
+        """Unclosed blocks end with the stream or a last unclosed fence."""
+        self.assertEqual(self.feed(["```\nx = 1\n"])[-1], "x = 1\n")
+        self.assertEqual(self.feed(["```\nx = 1\n```"])[-1], "x = 1\n")
+        self.assertEqual(self.feed(["```\nx = 1\n", "y"])[-1], "x = 1\ny\n")
+
+
+class StreamMessageTest(unittest.TestCase):
+    """Tests for stream_message, with a fake bedrock-runtime client."""
+
+    def client(self, events):
+        """Client streaming the given events."""
+        client = mock.Mock()
+        client.invoke_model_with_response_stream.return_value = {
+            "body": iter(events)
+        }
+        return client
+
+    def test_stream(self):
+        """Text, code and usage are collected as the events arrive."""
+        events = [
+            chunk(
+                {
+                    "type": "message_start",
+                    "message": {
+                        "usage": {
+                            "input_tokens": 100,
+                            "cache_read_input_tokens": 80,
+                        }
+                    },
+                }
+            ),
+            chunk({"type": "content_block_start"}),
+            text("```python\nx = 1\n"),
+            text("```\nDone"),
+            chunk(
+                {
+                    "type": "content_block_delta",
+                    "delta": {"type": "input_json_delta"},
+                }
+            ),
+            chunk({"type": "message_delta", "usage": {"output_tokens": 12}}),
+        ]
+        on_code, on_first_token = mock.Mock(), mock.Mock()
+        client = self.client(events)
+        reply, code, stats = stream_message(
+            client,
+            "model",
+            {"messages": []},
+            on_code=on_code,
+            on_first_token=on_first_token,
+        )
+        self.assertEqual(
+            (reply, code), ("```python\nx = 1\n```\nDone", "x = 1\n")
+        )
+        on_code.assert_called_once_with("x = 1\n")
+        on_first_token.assert_called_once_with(stats)
+        self.assertEqual(
+            (stats.input_tokens, stats.cache_read_tokens, stats.output_tokens),
+            (100, 80, 12),
+        )
+        self.assertGreater(stats.bytes_received, 0)
+        self.assertIn("12 output tokens", stats.summary())
+        self.assertEqual(
+            client.invoke_model_with_response_stream.call_args.kwargs[
+                "modelId"
+            ],
+            "model",
+        )
+
+    def test_without_callbacks(self):
+        """Callbacks are optional and a reply without fences is all code."""
+        _, code, stats = stream_message(
+            self.client([text("x = 1")]), "model", {}
+        )
+        self.assertEqual(code, "x = 1\n")
+        self.assertIsNotNone(stats.time_to_first_token)
+
+    def test_error_event(self):
+        """Error events fail the stream."""
+        with self.assertRaisesRegex(RuntimeError, "throttlingException"):
+            stream_message(
+                self.client(
+                    [{"throttlingException": {"message": "slow down"}}]
+                ),
+                "model",
+                {},
+            )
+
+
+class StreamStatsTest(unittest.TestCase):
+    """Tests for StreamStats."""
+
+    def test_rates(self):
+        """Rates are only reported once there is a duration to divide by."""
+        stats = StreamStats(started=0.0)
+        self.assertIsNone(stats.time_to_first_token)
+        self.assertIn("ttft -", stats.summary())
+        stats.first_token, stats.finished, stats.output_tokens = 1.0, 3.0, 10
+        self.assertEqual(stats.tokens_per_second, 5.0)
+        self.assertIn("at 5.0 tok/s", stats.summary())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+"""Tests for the cold-start budget check."""
+
+import io
+import subprocess
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+from aind_scicomp_nautilex import cold_start
+
+
+class MeasureImportTest(unittest.TestCase):
+    """Tests for measure_import, with a fake interpreter."""
+
+    def setUp(self):
+        """Answer every run with a measured time."""
+        patcher = mock.patch.object(
+            cold_start.subprocess,
+            "run",
+            return_value=mock.Mock(stdout="warning\n0.25\n"),
+        )
+        self.run = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_module(self):
+        """Modules are imported by name from the installed package."""
+        self.assertEqual(
+            cold_start.measure_import("aind_scicomp_nautilex.get_context"),
+            0.25,
+        )
+        script = self.run.call_args.args[0][-1]
+        self.assertIn("import aind_scicomp_nautilex.get_context;", script)
+        self.assertIn("sys.path.insert(0, '')", script)
+
+    def test_lambda(self):
+        """Lambdas are imported as lambda_function from their folder."""
+        cold_start.measure_import(
+            "lambdas/aind-docdb-connector", lambdas_dir="/lambdas"
+        )
+        script = self.run.call_args.args[0][-1]
+        self.assertIn("import lambda_function;", script)
+        self.assertIn("'/lambdas/aind-docdb-connector'", script)
+
+
+class BudgetTest(unittest.TestCase):
+    """Tests for check_budgets and the report."""
+
+    def measure(self, entry_point):
+        """Fake measurement, failing for entry points named "broken"."""
+        if entry_point == "broken":
+            raise subprocess.CalledProcessError(
+                1, "python", stderr="Traceback\nImportError: boom\n"
+            )
+        return {"fast": 0.1, "slow": 2.0}[entry_point]
+
+    def setUp(self):
+        """Measure with the fake."""
+        patcher = mock.patch.object(
+            cold_start, "measure_import", side_effect=self.measure
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def report(self, argv):
+        """Run main, returning its exit code and output."""
+        output = io.StringIO()
+        with redirect_stdout(output), self.assertRaises(SystemExit) as exit_:
+            cold_start.main(argv)
+        return exit_.exception.code, output.getvalue()
+
+    def test_check_budgets(self):
+        """Failed imports are reported with no measurement."""
+        with redirect_stdout(io.StringIO()) as output:
+            results = cold_start.check_budgets({"fast": 1.0, "broken": 1.0})
+        self.assertEqual(results, {"fast": (0.1, 1.0), "broken": (None, 1.0)})
+        self.assertIn(
+            "Failed to import broken: ImportError: boom", output.getvalue()
+        )
+
+    def test_within_budget(self):
+        """Main exits cleanly when every entry point is within budget."""
+        code, output = self.report(["fast"])
+        self.assertEqual(code, 0)
+        self.assertIn("0.100s / 1.0s  OK", output)
+
+    def test_over_budget(self):
+        """Slow or failed imports fail the check."""
+        code, output = self.report(["slow", "broken"])
+        self.assertEqual(code, 1)
+        self.assertIn("2.000s / 1.0s  OVER", output)
+        self.assertIn("failed / 1.0s  OVER", output)
+
+    def test_default_budgets(self):
+        """Every entry point is checked by default."""
+        with mock.patch.object(
+            cold_start, "COLD_START_BUDGETS", {"fast": 0.5}
+        ):
+            code, output = self.report([])
+        self.assertEqual(code, 0)
+        self.assertIn("0.5s  OK", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
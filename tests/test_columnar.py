@@ -0,0 +1,128 @@
+"""Tests for columnar evaluation of MongoDB filters."""
+
+import re
+import unittest
+from datetime import date
+
+from aind_scicomp_nautilex.columnar import (
+    ColumnarBatch,
+    compile_filter,
+    count_matches,
+    explode,
+    filter_records,
+)
+from aind_scicomp_nautilex.mongo_filter import matches, resolve_path
+
+RECORDS = [
+    {
+        "_id": str(i),
+        "name": f"ecephys_{i}",
+        "count": i,
+        "ratio": i / 2,
+        "flag": bool(i % 2),
+        "subject": {
+            "subject_id": str(i % 3),
+            "sex": "Male" if i % 2 else "Female",
+        },
+        "tiles": [
+            {"channel": {"channel_name": str(488 + i)}, "index": j}
+            for j in range(i % 3)
+        ],
+        "tags": ["a", "b"] if i % 2 else ["a"],
+        "doc": {"x": i % 2},
+    }
+    for i in range(10)
+] + [{"_id": "bare", "count": None, "tags": [], "when": date(2024, 1, 1)}]
+
+QUERIES = [
+    {},
+    None,
+    {"subject.subject_id": "1"},
+    {"count": 3.0},
+    {"flag": True},
+    {"flag": 1},
+    {"count": None},
+    {"missing": None},
+    {"tags": "b"},
+    {"tags": ["a", "b"]},
+    {"doc": {"x": 1}},
+    {"name": re.compile("_1$")},
+    {"count": {"$eq": 4}},
+    {"count": {"$ne": 4}},
+    {"subject.sex": {"$in": ["Male", "x"]}},
+    {"subject.sex": {"$nin": ["Male"]}},
+    {"count": {"$gt": 2, "$lte": 6}},
+    {"ratio": {"$gte": 1.5, "$lt": 4}},
+    {"name": {"$gt": "ecephys_5"}},
+    {"count": {"$gt": None}},
+    {"doc": {"$gt": {"x": 0}}},
+    {"count": {"$lt": "9"}},
+    {"when": {"$gte": date(2023, 1, 1)}},
+    {"tiles": {"$exists": True}},
+    {"subject": {"$exists": False}},
+    {"name": {"$regex": "^ECEPHYS_[12]$", "$options": "i"}},
+    {"name": {"$regex": re.compile("_3")}},
+    {"subject.sex": {"$not": "^F"}},
+    {"count": {"$not": {"$gt": 4}}},
+    {"tiles.channel.channel_name": {"$regex": "^49"}},
+    {"tiles.1.index": 1},
+    {"tiles": {"$elemMatch": {"index": 1}}},
+    {"tags": {"$size": 2}},
+    {"tags": {"$all": ["a", "b"]}},
+    {"$and": [{"flag": True}, {"count": {"$gt": 4}}]},
+    {"$or": [{"count": 1}, {"subject.subject_id": "2"}]},
+    {"$nor": [{"count": 1}, {"flag": False}]},
+    {"flag": False, "count": {"$gt": 100}, "name": "ecephys_2"},
+]
+
+
+class CompileFilterTest(unittest.TestCase):
+    """Columnar results agree with mongo_filter.matches."""
+
+    def test_same_results(self):
+        """Every query selects the records mongo_filter matches."""
+        batch = ColumnarBatch(RECORDS)
+        for query in QUERIES:
+            expected = [record for record in RECORDS if matches(record, query)]
+            self.assertEqual(filter_records(query, batch), expected, query)
+            self.assertEqual(
+                count_matches(query, RECORDS), len(expected), query
+            )
+
+    def test_explode(self):
+        """Exploded paths give the values resolve_path does."""
+        for path in (
+            "tiles.channel.channel_name",
+            "tiles.0.index",
+            "subject.sex",
+            "name.first",
+        ):
+            positions, values = explode(RECORDS, path)
+            for position, record in enumerate(RECORDS):
+                found = [
+                    value
+                    for at, value in zip(positions, values)
+                    if at == position
+                ]
+                self.assertEqual(found, resolve_path(record, path), path)
+
+    def test_columns_are_shared(self):
+        """Columns are built once per path and batch."""
+        batch = ColumnarBatch(RECORDS)
+        self.assertIs(batch.column("count"), batch.column("count"))
+        self.assertEqual(batch.positions(0b1010), [1, 3])
+        self.assertEqual(batch.count(batch.all), len(RECORDS))
+
+    def test_unsupported(self):
+        """Unsupported operators and malformed arguments are rejected."""
+        for query in (
+            {"$where": "1"},
+            {"count": {"$mod": [2, 1]}},
+            {"count": {"$in": 3}},
+        ):
+            with self.assertRaises(ValueError):
+                compile_filter(query)
+
+
+if __name__ == "__main__":
+    unittest.main()
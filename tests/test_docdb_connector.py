@@ -0,0 +1,340 @@
+"""Tests for the DocDB connector lambda's paging and response helpers."""
+
+import importlib.util
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from aind_scicomp_nautilex import lc_tools
+from aind_scicomp_nautilex.snapshot import (
+    Snapshot,
+    SnapshotClient,
+    write_snapshot,
+)
+
+LAMBDA_PATH = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "lambdas",
+    "aind-docdb-connector",
+    "lambda_function.py",
+)
+
+
+def load_lambda():
+    """Import the lambda module, whose folder name isn't importable."""
+    spec = importlib.util.spec_from_file_location(
+        "docdb_connector", LAMBDA_PATH
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+connector = load_lambda()
+RECORDS = [{"_id": f"id-{i:03d}", "name": f"record {i}"} for i in range(25)]
+
+
+class FakeClient:
+    """DocDB client answering _get_records from RECORDS."""
+
+    def __init__(self):
+        """Start without any calls."""
+        self.calls = []
+
+    def _get_records(self, filter_query, projection, sort, limit, skip):
+        """Apply the $gt _id bound, _id sort, skip and limit."""
+        self.calls.append(
+            {"filter_query": filter_query, "sort": sort, "skip": skip}
+        )
+        after = None
+        for clause in filter_query.get("$and", []):
+            after = clause.get("_id", {}).get("$gt", after)
+        records = [r for r in RECORDS if after is None or r["_id"] > after]
+        records = [
+            {k: v for k, v in r.items() if projection.get(k, 1)}
+            for r in records
+        ]
+        return records[skip:][:limit]
+
+    def aggregate_docdb_records(self, pipeline):
+        """Apply the trailing $skip and $limit stages to RECORDS."""
+        self.calls.append({"pipeline": pipeline})
+        skip = pipeline[-2]["$skip"]
+        limit = pipeline[-1]["$limit"]
+        return RECORDS[skip:][:limit]
+
+
+class CursorTest(unittest.TestCase):
+    """Tests for filter_documents paging."""
+
+    def setUp(self):
+        """Replace the DocDB client."""
+        self.client = FakeClient()
+        patcher = mock.patch.object(
+            connector, "get_docdb_api_client", return_value=self.client
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def page(self, **event):
+        """Run the filter action and decode its body."""
+        return json.loads(
+            connector.filter_documents({"limit": 10, **event}, None)
+        )
+
+    def test_cursor_round_trip(self):
+        """Cursors decode to the position they encode."""
+        for position in ({"after": "id-009"}, {"skip": 20}):
+            self.assertEqual(
+                connector.decode_cursor(connector.encode_cursor(position)),
+                position,
+            )
+        self.assertEqual(connector.decode_cursor(None), {"skip": 0})
+        with self.assertRaises(connector.BadRequest):
+            connector.decode_cursor("not a cursor")
+
+    def test_keyset_paging(self):
+        """Without a sort, pages continue after the last _id in _id order."""
+        ids = []
+        cursor = None
+        while True:
+            body = self.page(cursor=cursor)
+            ids.extend(record["_id"] for record in body["records"])
+            cursor = body["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(ids, [record["_id"] for record in RECORDS])
+        self.assertEqual(
+            self.client.calls[1]["filter_query"],
+            {"$and": [{}, {"_id": {"$gt": "id-009"}}]},
+        )
+        self.assertTrue(
+            all(
+                call["sort"] == {"_id": 1} and call["skip"] == 0
+                for call in self.client.calls
+            )
+        )
+
+    def test_sorted_paging(self):
+        """An explicit sort pages by offset with _id breaking ties."""
+        body = self.page(sort={"name": 1})
+        self.assertEqual(
+            connector.decode_cursor(body["next_cursor"]), {"skip": 10}
+        )
+        self.page(sort={"name": 1}, cursor=body["next_cursor"])
+        self.assertEqual(self.client.calls[-1]["sort"], {"name": 1, "_id": 1})
+        self.assertEqual(self.client.calls[-1]["skip"], 10)
+        with self.assertRaises(connector.BadRequest):
+            self.page(
+                sort={"name": 1},
+                cursor=connector.encode_cursor({"after": "id-001"}),
+            )
+
+    def test_projection_without_id(self):
+        """Records without an _id are paged by offset."""
+        body = self.page(projection={"_id": 0, "name": 1})
+        self.assertEqual(
+            connector.decode_cursor(body["next_cursor"]), {"skip": 10}
+        )
+        body = self.page(
+            projection={"_id": 0, "name": 1}, cursor=body["next_cursor"]
+        )
+        self.assertEqual(body["records"][0], {"name": "record 10"})
+
+    def test_truncated_page_continues(self):
+        """Records cut by the byte budget are picked up by the next cursor."""
+        body = self.page(max_bytes=connector.ENVELOPE_BYTES + 100)
+        self.assertTrue(body["truncated"])
+        last = body["records"][-1]["_id"]
+        self.assertEqual(
+            connector.decode_cursor(body["next_cursor"]), {"after": last}
+        )
+
+    def test_bad_parameters(self):
+        """Invalid parameters are rejected."""
+        for event in ({"filter": []}, {"sort": "name"}, {"limit": 0}):
+            with self.assertRaises(connector.BadRequest):
+                self.page(**event)
+
+
+class BoundedBodyTest(unittest.TestCase):
+    """Tests for bounded_body and aggregation paging."""
+
+    def test_fits(self):
+        """Items under the budget are all encoded."""
+        body = json.loads(connector.bounded_body("records", RECORDS[:3], {}))
+        self.assertEqual(
+            body, {"records": RECORDS[:3], "truncated": False, "spill": None}
+        )
+
+    def test_budget(self):
+        """Items past the budget are left out and flagged."""
+        event = {"max_bytes": connector.ENVELOPE_BYTES + 100}
+        body = json.loads(
+            connector.bounded_body(
+                "records", RECORDS, event, lambda n: {"consumed": n}
+            )
+        )
+        self.assertTrue(body["truncated"])
+        self.assertEqual(body["consumed"], len(body["records"]))
+        self.assertLess(len(body["records"]), len(RECORDS))
+        with self.assertRaises(connector.BadRequest):
+            connector.bounded_body("records", RECORDS, {"max_bytes": 10})
+
+    def test_oversized_item(self):
+        """A single item over the budget is replaced by a stub."""
+        event = {"max_bytes": connector.ENVELOPE_BYTES + 10}
+        body = json.loads(
+            connector.bounded_body(
+                "records", [{"_id": "a", "name": "x" * 100}], event
+            )
+        )
+        self.assertEqual(body["records"][0]["_id"], "a")
+        self.assertGreater(body["records"][0]["omitted_bytes"], 100)
+        body = json.loads(
+            connector.bounded_body("results", ["x" * 100], event)
+        )
+        self.assertEqual(list(body["results"][0]), ["omitted_bytes"])
+
+    def test_spill_needs_bucket(self):
+        """Spilling is refused without a bucket rather than written locally."""
+        event = {"max_bytes": connector.ENVELOPE_BYTES + 100, "spill": True}
+        with mock.patch.object(connector, "SPILL_BUCKET", None):
+            with self.assertRaisesRegex(connector.BadRequest, "SPILL_BUCKET"):
+                connector.bounded_body("records", RECORDS, event)
+
+    def test_spill_to_s3(self):
+        """With a bucket, the rest of the items are written to S3."""
+        event = {"max_bytes": connector.ENVELOPE_BYTES + 100, "spill": True}
+        s3 = mock.Mock()
+        with (
+            mock.patch.object(connector, "SPILL_BUCKET", "bucket"),
+            mock.patch("boto3.client", return_value=s3),
+        ):
+            body = json.loads(
+                connector.bounded_body("records", RECORDS, event)
+            )
+        self.assertEqual(
+            body["spill"]["records"] + len(body["records"]), len(RECORDS)
+        )
+        self.assertTrue(body["spill"]["uri"].startswith("s3://bucket/"))
+        self.assertEqual(s3.put_object.call_args.kwargs["Bucket"], "bucket")
+
+    def test_aggregation_pages(self):
+        """Aggregations are paged with $skip/$limit stages."""
+        client = FakeClient()
+        pipeline = [{"$sort": {"_id": 1}}]
+        with mock.patch.object(
+            connector, "get_docdb_api_client", return_value=client
+        ):
+            body = json.loads(
+                connector.aggregate_documents(
+                    {"pipeline": pipeline, "limit": 20}, None
+                )
+            )
+            self.assertEqual(len(body["results"]), 20)
+            self.assertEqual(
+                client.calls[0]["pipeline"],
+                pipeline + [{"$skip": 0}, {"$limit": 21}],
+            )
+            body = json.loads(
+                connector.aggregate_documents(
+                    {
+                        "pipeline": pipeline,
+                        "limit": 20,
+                        "cursor": body["next_cursor"],
+                    },
+                    None,
+                )
+            )
+            self.assertEqual(
+                [r["_id"] for r in body["results"]],
+                [r["_id"] for r in RECORDS[20:]],
+            )
+            self.assertIsNone(body["next_cursor"])
+            for event in (
+                {"pipeline": []},
+                {"pipeline": [{"$out": "x"}]},
+                {"pipeline": pipeline, "limit": 0},
+                {
+                    "pipeline": pipeline,
+                    "cursor": connector.encode_cursor({"after": "a"}),
+                },
+            ):
+                with self.assertRaises(connector.BadRequest):
+                    connector.aggregate_documents(event, None)
+
+
+class FootprintParityTest(unittest.TestCase):
+    """The lambda's footprint action must match lc_tools.docdb_footprint."""
+
+    def setUp(self):
+        """Answer both from the same snapshot, recording the pipelines sent."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        write_snapshot(
+            directory.name,
+            [
+                {
+                    "_id": f"id-{i:03d}",
+                    "project": f"p{i % 4}",
+                    "subject": {"subject_id": str(i % 7)},
+                }
+                for i in range(60)
+            ],
+        )
+        client = SnapshotClient(Snapshot(directory.name))
+        self.pipelines = []
+        aggregate = client.aggregate_docdb_records
+        client.aggregate_docdb_records = (
+            lambda pipeline: self.pipelines.append(pipeline)
+            or aggregate(pipeline)
+        )
+        for patcher in (
+            mock.patch.object(
+                connector, "get_docdb_api_client", return_value=client
+            ),
+            mock.patch.object(lc_tools, "get_docdb_client", lambda: client),
+            mock.patch.object(lc_tools, "DOCDB_CACHE", False),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_constants(self):
+        """Both copies use the same limits."""
+        for name in (
+            "FOOTPRINT_TOP_VALUES",
+            "FOOTPRINT_SAMPLE_SIZE",
+            "FOOTPRINT_SAMPLE_SCAN",
+        ):
+            self.assertEqual(
+                getattr(connector, name), getattr(lc_tools, name), name
+            )
+
+    def test_same_pipeline_and_footprint(self):
+        """The same filter and fields give the same pipeline and footprint."""
+        for filter_query, fields in (
+            ({}, []),
+            ({"project": {"$ne": "p0"}}, ["project"]),
+            ({}, ["subject.subject_id", "project"]),
+        ):
+            with mock.patch("builtins.print"):
+                footprint = connector.footprint_documents(
+                    {"filter": filter_query, "fields": fields}, None
+                )
+            self.assertEqual(
+                footprint, lc_tools.docdb_footprint(filter_query, fields)
+            )
+            lambda_pipeline, tools_pipeline = self.pipelines[-2:]
+            self.assertEqual(lambda_pipeline, tools_pipeline)
+            self.assertEqual(
+                tools_pipeline,
+                lc_tools.build_footprint_pipeline(filter_query, fields),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
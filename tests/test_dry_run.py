@@ -0,0 +1,339 @@
+"""Tests for dry runs of generated migration scripts."""
+
+import os
+import socket
+import sys
+import unittest
+from unittest import mock
+
+from aind_scicomp_nautilex import dry_run
+from aind_scicomp_nautilex.dry_run import (
+    DryRunReport,
+    MigrationScript,
+    RecordResult,
+    diff_records,
+    dry_run_source,
+    inspect_script,
+)
+
+SCRIPT = '''
+from aind_data_migration_utils.migrate import Migrator
+
+QUERY = {"subject.sex": "M"}
+
+
+def fix_sex(record):
+    """Spell out the sex."""
+    if record["_id"] == "bad":
+        raise KeyError("subject")
+    if record["_id"] == "list":
+        return []
+    if record["_id"] == "renamed":
+        return {**record, "_id": "other"}
+    if record["_id"] == "outside":
+        return {**record, "name": "renamed"}
+    if record["subject"]["sex"] == "M":
+        record["subject"]["sex"] = "Male"
+    return record
+
+
+Migrator(query=QUERY, migration_callback=fix_sex, files=["subject"]).run()
+'''
+
+SWALLOWING_SCRIPT = '''
+import time
+
+
+def migration_callback(record):
+    """Retry forever, swallowing every error."""
+    while True:
+        try:
+            time.sleep(0.01)
+        except Exception:
+            pass
+'''
+
+RECORDS = [
+    {"_id": "a", "subject": {"sex": "M"}},
+    {"_id": "b", "subject": {"sex": "Male"}},
+    {"_id": "bad", "subject": {}},
+    {"_id": "list"},
+    {"_id": "renamed"},
+    {"_id": "outside", "name": "x"},
+]
+
+
+class InspectScriptTest(unittest.TestCase):
+    """Tests for inspect_script."""
+
+    def test_migrator_call(self):
+        """The callback, query and files come from the Migrator call."""
+        script = inspect_script(SCRIPT)
+        self.assertEqual(script.callback_name, "fix_sex")
+        self.assertEqual(script.query, {"subject.sex": "M"})
+        self.assertEqual(script.files, ["subject"])
+
+    def test_fallbacks(self):
+        """With no Migrator call, the named or only function is used."""
+        self.assertEqual(
+            inspect_script(
+                "def migration_callback(r):\n    return r\n\n"
+                "def other(r):\n    return r\n"
+            ).callback_name,
+            "migration_callback",
+        )
+        self.assertEqual(
+            inspect_script("def repair(r):\n    return r\n").callback_name,
+            "repair",
+        )
+        script = inspect_script(
+            "def a(r):\n    pass\n\ndef b(r):\n    pass\n"
+            "run(query=make_query(), migration_callback=b)\n"
+        )
+        self.assertEqual(script.callback_name, "b")
+        self.assertIsNone(script.query)
+        self.assertIsNone(inspect_script("x = 1\n").callback_name)
+
+    def test_syntax_error(self):
+        """Scripts that don't parse are reported."""
+        script = inspect_script("def broken(:\n")
+        self.assertIn("line 1", script.syntax_error)
+
+
+class ReportTest(unittest.TestCase):
+    """Tests for DryRunReport and diff_records."""
+
+    def test_diff_records(self):
+        """Differences are listed by path."""
+        before = {"a": 1, "b": [1, 2], "c": {"d": "x" * 100}, "e": [1], "f": 1}
+        after = {
+            "a": 1,
+            "b": [1, 3],
+            "c": {"d": "y"},
+            "e": [1, 2],
+            "g": 2,
+            "f": 1.0,
+        }
+        diff = dict(diff_records(before, after))
+        self.assertEqual(diff["b[1]"], "2 -> 3")
+        self.assertTrue(
+            diff["c.d"].startswith("'xxx") and "..." in diff["c.d"]
+        )
+        self.assertEqual(diff["e"], "[1] -> [1, 2]")
+        self.assertEqual(diff["f"], "1 -> 1.0")
+        self.assertEqual(diff["g"], "added 2")
+        self.assertNotIn("a", diff)
+        self.assertEqual(dict(diff_records({"a": 1}, {}))["a"], "removed")
+
+    def test_no_records_is_a_warning(self):
+        """A dry run that exercised no records passes with a warning."""
+        script = MigrationScript(source="", callback_name="f")
+        report = DryRunReport(script=script)
+        self.assertTrue(report.ok)
+        self.assertEqual(report.noop_rate, 0.0)
+        self.assertIn(
+            "Warnings:\n  No records were exercised", report.summary()
+        )
+        offline = DryRunReport(
+            script, [RecordResult("a", "network", "offline")]
+        )
+        self.assertTrue(offline.ok)
+        self.assertIn("1 records needed the network", offline.summary())
+
+    def test_ok(self):
+        """Only reports with changes and no failures pass."""
+        script = MigrationScript(source="", callback_name="f")
+        changed = RecordResult(
+            "a", "changed", diff=[("subject.sex", "'M' -> 'Male'")]
+        )
+        self.assertTrue(DryRunReport(script, [changed]).ok)
+        unchanged = DryRunReport(script, [RecordResult("a", "unchanged")])
+        self.assertFalse(unchanged.ok)
+        self.assertIn("did not change any record", unchanged.summary())
+        self.assertFalse(
+            DryRunReport(
+                script, [changed, RecordResult("b", "timeout", "slow")]
+            ).ok
+        )
+        self.assertFalse(
+            DryRunReport(MigrationScript(source="", syntax_error="bad")).ok
+        )
+        self.assertIn(
+            "does not parse",
+            DryRunReport(
+                MigrationScript(source="", syntax_error="bad")
+            ).summary(),
+        )
+        self.assertIn(
+            "No migration_callback",
+            DryRunReport(MigrationScript(source="")).summary(),
+        )
+
+
+class DryRunTest(unittest.TestCase):
+    """Tests for dry runs across worker processes."""
+
+    def test_dry_run(self):
+        """Each record gets its own outcome."""
+        report = dry_run_source(SCRIPT, records=RECORDS, max_workers=2)
+        statuses = {
+            result.record_id: result.status for result in report.results
+        }
+        self.assertEqual(
+            statuses,
+            {
+                "a": "changed",
+                "b": "unchanged",
+                "bad": "error",
+                "list": "error",
+                "renamed": "error",
+                "outside": "error",
+            },
+        )
+        self.assertEqual(report.changed_paths(), {"subject.sex": 1, "name": 1})
+        # The Migrator import and run were served by the stub
+        self.assertEqual(report.warnings, [])
+        summary = report.summary()
+        self.assertIn("KeyError: 'subject'", summary)
+        self.assertIn("not in the Migrator files", summary)
+        self.assertEqual(RECORDS[0]["subject"]["sex"], "M")
+
+    def test_swallowed_timeout(self):
+        """A callback catching Exception still times out."""
+        report = dry_run_source(
+            SWALLOWING_SCRIPT, records=RECORDS[:1], timeout=0.2, max_workers=1
+        )
+        self.assertEqual(report.results[0].status, "timeout")
+
+    def test_nothing_to_run(self):
+        """Scripts without a callback or records aren't run."""
+        self.assertEqual(dry_run_source("x = 1\n").results, [])
+        report = dry_run_source("def f(r):\n    return r\n", records=[])
+        self.assertEqual(
+            report.warnings, ["No records to run the callback on"]
+        )
+
+    def test_query_records(self):
+        """Records are pulled with the script's literal query."""
+        with mock.patch(
+            "aind_scicomp_nautilex.lc_tools.iter_docdb_records",
+            return_value=iter(RECORDS[:2]),
+        ) as records:
+            report = dry_run_source(SCRIPT, max_workers=1, limit=5)
+        records.assert_called_once_with({"subject.sex": "M"}, limit=5)
+        self.assertTrue(report.ok)
+        report = dry_run_source(
+            "def f(r):\n    return r\n\nrun(query=q(), migration_callback=f)\n"
+        )
+        self.assertTrue(report.ok)
+        self.assertIn("isn't a literal", report.warnings[0])
+        self.assertIn(
+            "Warnings:\n  The Migrator query isn't a literal", report.summary()
+        )
+
+
+class WorkerTest(unittest.TestCase):
+    """Tests for the worker functions, run in this process."""
+
+    def setUp(self):
+        """Keep stubs, the denied network and worker state out of others."""
+        for patcher in (
+            mock.patch.dict(sys.modules),
+            mock.patch.dict(os.environ),
+            *(
+                mock.patch.object(
+                    socket.socket, name, getattr(socket.socket, name)
+                )
+                for name in ("connect", "connect_ex")
+            ),
+            *(
+                mock.patch.object(socket, name, getattr(socket, name))
+                for name in ("create_connection", "getaddrinfo")
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(dry_run._worker.clear)
+
+    def test_top_level_migrator_is_stubbed(self):
+        """A top-level Migrator(...).run() runs against the stub."""
+        source = SCRIPT + (
+            "\nimport aind_data_migration_utils.migrate as m\n"
+            "MIGRATOR = m.Migrator\n"
+        )
+        dry_run._load_worker(inspect_script(source), None)
+        self.assertEqual(dry_run._worker_warnings(), [])
+        self.assertIs(
+            sys.modules[dry_run.MIGRATOR_MODULE].Migrator,
+            dry_run._StubMigrator,
+        )
+        statuses = [
+            dry_run._apply_callback(dict(record)).status for record in RECORDS
+        ]
+        self.assertEqual(
+            statuses,
+            ["changed", "unchanged", "error", "error", "error", "error"],
+        )
+
+    def test_real_package_is_kept(self):
+        """An installed Migrator package keeps its other modules."""
+        package = mock.Mock()
+        with mock.patch("builtins.__import__", return_value=package):
+            dry_run._stub_migrator()
+        self.assertIs(package.migrate.Migrator, dry_run._StubMigrator)
+
+    def test_failing_statements(self):
+        """Failing and slow top-level statements become warnings."""
+        source = (
+            "import missing_module\n"
+            "while True:\n    pass\n"
+            "def f(r):\n    while True:\n        pass\n"
+        )
+        dry_run._load_worker(inspect_script(source), 0.1)
+        warnings = dry_run._worker_warnings()
+        self.assertIn("ModuleNotFoundError", warnings[0])
+        self.assertIn("timed out", warnings[1])
+        self.assertEqual(
+            dry_run._apply_callback({"_id": "a"}).status, "timeout"
+        )
+
+    def test_network_is_denied(self):
+        """Scripts can't reach the network or use real AWS credentials."""
+        source = (
+            "import boto3\n"
+            "import urllib.request\n"
+            "s3 = boto3.client('s3')\n"
+            "urllib.request.urlopen('http://example.com')\n"
+            "def f(r):\n"
+            "    s3.get_object(Bucket='bucket', Key=r['_id'])\n"
+            "    return r\n"
+        )
+        os.environ["AWS_SESSION_TOKEN"] = "real"
+        dry_run._load_worker(inspect_script(source), None)
+        self.assertEqual(len(dry_run._worker_warnings()), 1)
+        self.assertIn(
+            "Line 4 needs the network", dry_run._worker_warnings()[0]
+        )
+        self.assertEqual(
+            dry_run._apply_callback({"_id": "a"}).status, "network"
+        )
+        self.assertNotIn("AWS_SESSION_TOKEN", os.environ)
+        self.assertEqual(os.environ["AWS_ACCESS_KEY_ID"], "dry-run")
+
+    def test_missing_callback(self):
+        """A callback that isn't defined fails every record."""
+        dry_run._load_worker(
+            MigrationScript(source="x = 1\n", callback_name="f"), None
+        )
+        self.assertEqual(
+            dry_run._apply_callback({"_id": "a"}).error,
+            "The migration callback is not defined",
+        )
+
+    def test_without_timer(self):
+        """Calls run without a timer when there is no timeout."""
+        self.assertEqual(dry_run._call_with_timeout(len, None, "abc"), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,216 @@
+"""Tests for building the schema context files."""
+
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+from aind_scicomp_nautilex import get_context
+
+MODEL = '''
+from pydantic import BaseModel
+
+
+class {name}(BaseModel):
+    """A model"""
+
+    value: int
+'''
+
+SCHEMA = '''
+from pydantic import BaseModel, Field
+
+
+class Base(BaseModel):
+    """The base model"""
+
+    describedBy: str = "url"
+    schema_version: str = Field(default="1.0")
+    name: str = Field(..., title="Name")
+    notes: str = Field()
+
+
+class Child(Base):
+    """A derived model"""
+
+    count: int = 0
+
+
+class _Private(BaseModel):
+    """Not part of the public schema"""
+
+    secret: str
+
+
+class Empty(BaseModel):
+    """A model with no fields"""
+
+
+class Plain:
+    """A class with no base"""
+
+    value: int
+'''
+
+
+class GetContextTest(unittest.TestCase):
+    """Tests for build_context and its cache."""
+
+    def setUp(self):
+        """Create a source folder with two model files."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.src = os.path.join(self.directory.name, "src")
+        os.makedirs(self.src)
+        for name in ("First", "Second"):
+            self.write_model(name)
+        self.cache_path = os.path.join(self.directory.name, "cache.json")
+
+    def write_model(self, name):
+        """Write a file declaring one model."""
+        path = os.path.join(self.src, f"{name.lower()}.py")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(MODEL.format(name=name))
+        return path
+
+    def build(self):
+        """Build the models context, returning its text."""
+        (path,) = get_context.build_context(
+            None,
+            self.src,
+            output_dir=self.directory.name,
+            cache_path=self.cache_path,
+            max_workers=1,
+        )
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+    def cached_files(self):
+        """Source files with an entry in the saved cache."""
+        with open(self.cache_path, encoding="utf-8") as f:
+            files = json.load(f)["files"]
+        return sorted(os.path.basename(key.split(":", 1)[1]) for key in files)
+
+    def test_deleted_files_are_pruned(self):
+        """Entries of deleted source files are dropped when saving."""
+        self.assertIn("Model: Second", self.build())
+        self.assertEqual(self.cached_files(), ["first.py", "second.py"])
+        os.remove(os.path.join(self.src, "second.py"))
+        self.assertNotIn("Model: Second", self.build())
+        self.assertEqual(self.cached_files(), ["first.py"])
+
+    def test_cache_is_reused(self):
+        """Unchanged files are served from the cache."""
+        first = self.build()
+        cache = get_context.load_cache(self.cache_path)
+        models = get_context.collect_models(self.src, False, cache=cache)
+        self.assertEqual([model[0] for model in models], ["First", "Second"])
+        self.assertEqual(self.build(), first)
+
+    def test_changed_mtime_same_content(self):
+        """Files touched without changing are matched by their hash."""
+        cache = {}
+        get_context.collect_models(self.src, False, cache=cache)
+        path = self.write_model("First")
+        os.utime(path, ns=(1, 1))
+        self.assertEqual(
+            len(get_context.collect_models(self.src, False, cache=cache)), 2
+        )
+        self.assertEqual(cache[f"top:{os.path.abspath(path)}"]["mtime_ns"], 1)
+
+    def test_parallel_parse(self):
+        """Enough changed files are parsed in a process pool."""
+        with mock.patch.object(get_context, "MIN_PARALLEL_FILES", 2):
+            models = get_context.collect_models(self.src, False, max_workers=2)
+        self.assertEqual([model[0] for model in models], ["First", "Second"])
+
+    def test_unusable_cache(self):
+        """Missing, unreadable and outdated caches start empty."""
+        self.assertEqual(get_context.load_cache(None), {})
+        self.assertEqual(get_context.load_cache(self.cache_path), {})
+        for content in (
+            "not json",
+            json.dumps({"version": 0, "files": {"a": 1}}),
+        ):
+            with open(self.cache_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            self.assertEqual(get_context.load_cache(self.cache_path), {})
+
+
+class ExtractModelsTest(unittest.TestCase):
+    """Tests for the model extraction of a schema file."""
+
+    def setUp(self):
+        """Write the schema file."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "schema.py")
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(SCHEMA)
+
+    def test_all_models(self):
+        """Models with fields keep their parent, minus versioning fields."""
+        models = get_context.extract_pydantic_models_from_file(self.path)
+        self.assertEqual(
+            [(name, parent) for name, parent, _ in models],
+            [
+                ("Base", "BaseModel"),
+                ("Child", "Base"),
+                ("_Private", "BaseModel"),
+                ("Plain", None),
+            ],
+        )
+        self.assertEqual(
+            models[0][2],
+            ["name: str (default=..., title='Name')", "notes: str"],
+        )
+
+    def test_top_level_models(self):
+        """Only public models deriving from BaseModel or nothing are kept."""
+        models = get_context.extract_top_level_pydantic_models_from_file(
+            self.path
+        )
+        self.assertEqual([name for name, _, _ in models], ["Base", "Plain"])
+
+
+class MainTest(unittest.TestCase):
+    """Tests for the command line entry point."""
+
+    def test_main(self):
+        """The context files are written to the output folder."""
+        with tempfile.TemporaryDirectory() as directory:
+            with open(
+                os.path.join(directory, "schema.py"), "w", encoding="utf-8"
+            ) as f:
+                f.write(SCHEMA)
+            output = io.StringIO()
+            with redirect_stdout(output):
+                get_context.main(
+                    [
+                        "--schema-src",
+                        directory,
+                        "--output-dir",
+                        directory,
+                        "--no-cache",
+                    ]
+                )
+            self.assertTrue(
+                os.path.exists(os.path.join(directory, "schema_context.txt"))
+            )
+        self.assertIn("Built context in", output.getvalue())
+
+    def test_source_required(self):
+        """At least one source folder is required."""
+        with (
+            redirect_stdout(io.StringIO()),
+            mock.patch("sys.stderr", io.StringIO()),
+            self.assertRaises(SystemExit),
+        ):
+            get_context.main([])
+
+
+if __name__ == "__main__":
+    unittest.main()
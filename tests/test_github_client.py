@@ -0,0 +1,290 @@
+"""Tests for the GitHub REST client."""
+
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+from aind_scicomp_nautilex import github_client
+from aind_scicomp_nautilex.github_client import GitHubClient, ResponseCache
+
+
+def make_response(status, body=None, headers=None, links=None):
+    """Build a requests.Response with a JSON body."""
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(body).encode() if body is not None else b""
+    response.headers.update(headers or {})
+    if links:
+        response.headers["Link"] = ", ".join(
+            f'<{url}>; rel="{rel}"' for rel, url in links.items()
+        )
+    response.request = requests.Request("GET", "https://example.com").prepare()
+    return response
+
+
+class GitHubClientTest(unittest.TestCase):
+    """Tests for GitHubClient.request and its retry policy."""
+
+    def setUp(self):
+        """Create a client whose session returns queued responses."""
+        self.client = GitHubClient(
+            "token", base_url="https://api.test/", max_retries=2
+        )
+        self.session = mock.patch.object(
+            self.client.session, "request"
+        ).start()
+        self.sleep = mock.patch.object(github_client.time, "sleep").start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_url(self):
+        """API paths are joined to the base URL, full URLs passed through."""
+        self.assertEqual(
+            self.client.url("/repos/a"), "https://api.test/repos/a"
+        )
+        self.assertEqual(self.client.url("http://other/x"), "http://other/x")
+
+    def test_default_timeout(self):
+        """Requests get the client's timeout unless they set one."""
+        self.session.return_value = make_response(200, {})
+        self.client.get("repos")
+        self.assertEqual(
+            self.session.call_args.kwargs["timeout"],
+            github_client.DEFAULT_TIMEOUT,
+        )
+        self.client.get("repos", timeout=5)
+        self.assertEqual(self.session.call_args.kwargs["timeout"], 5)
+
+    def test_get_retries_server_errors(self):
+        """Idempotent requests are retried on 5xx and connection errors."""
+        self.session.side_effect = [
+            make_response(502),
+            requests.ConnectionError(),
+            make_response(200, {"ok": True}),
+        ]
+        self.assertEqual(self.client.get("repos").json(), {"ok": True})
+        self.assertEqual(self.session.call_count, 3)
+
+    def test_get_gives_up(self):
+        """Retries stop after max_retries."""
+        self.session.side_effect = requests.Timeout()
+        with self.assertRaises(requests.Timeout):
+            self.client.get("repos")
+        self.assertEqual(self.session.call_count, 3)
+        self.session.side_effect = None
+        self.session.return_value = make_response(500)
+        with self.assertRaisesRegex(Exception, "failed: 500"):
+            self.client.get("repos")
+
+    def test_client_errors_are_not_retried(self):
+        """A 404 fails at once."""
+        self.session.return_value = make_response(404)
+        with self.assertRaisesRegex(Exception, "failed: 404"):
+            self.client.get("repos")
+        self.assertEqual(self.session.call_count, 1)
+
+    def test_post_is_not_retried_on_server_errors(self):
+        """A POST may have taken effect, so 5xx and errors aren't retried."""
+        self.session.return_value = make_response(502)
+        with self.assertRaisesRegex(Exception, "failed: 502"):
+            self.client.post("comments", json={})
+        self.assertEqual(self.session.call_count, 1)
+        self.session.side_effect = requests.ConnectionError()
+        with self.assertRaises(requests.ConnectionError):
+            self.client.post("comments", json={})
+        self.assertEqual(self.session.call_count, 2)
+
+    def test_post_is_retried_on_rate_limits(self):
+        """A POST is resent after a 429 or a 403 carrying Retry-After."""
+        self.session.side_effect = [
+            make_response(429),
+            make_response(403, headers={"Retry-After": "3"}),
+            make_response(201, {}),
+        ]
+        self.client.post("comments", json={})
+        self.assertEqual(self.session.call_count, 3)
+        self.assertEqual(self.sleep.call_args_list[-1], mock.call(3.0))
+        self.session.side_effect = [
+            make_response(403, headers={"X-RateLimit-Remaining": "0"})
+        ]
+        with self.assertRaisesRegex(Exception, "failed: 403"):
+            self.client.post("comments", json={})
+
+    def test_rate_limit_waits(self):
+        """Primary and secondary rate limits are waited out."""
+        self.session.side_effect = [
+            make_response(
+                403,
+                headers={
+                    "X-RateLimit-Remaining": "0",
+                    "X-RateLimit-Reset": "0",
+                },
+            ),
+            make_response(
+                403, {"message": "You have exceeded a secondary rate limit"}
+            ),
+            make_response(200, {}),
+        ]
+        self.client.put("repos/a")
+        self.assertEqual(
+            self.sleep.call_args_list,
+            [
+                mock.call(1.0),
+                mock.call(github_client.SECONDARY_RATE_LIMIT_WAIT),
+            ],
+        )
+        self.assertIsNone(self.client._rate_limit_wait(make_response(403), 0))
+
+    def test_blocked_until_reset(self):
+        """Requests wait for an exhausted primary limit to reset."""
+        self.client._blocked_until = github_client.time.time() + 5
+        self.session.return_value = make_response(200, {})
+        self.client.get("repos")
+        self.assertGreater(self.sleep.call_args.args[0], 5)
+
+
+class CachedRequestsTest(unittest.TestCase):
+    """Tests for conditional requests and pagination."""
+
+    def setUp(self):
+        """Create a client with a response cache in a temporary folder."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = ResponseCache(directory.name)
+        self.client = GitHubClient(
+            "token", base_url="https://api.test", cache=self.cache
+        )
+        self.session = mock.patch.object(
+            self.client.session, "request"
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_conditional_get(self):
+        """A 304 is served from the cache."""
+        self.session.return_value = make_response(
+            200, [1], headers={"ETag": "x", "Last-Modified": "y"}
+        )
+        self.assertEqual(
+            self.client.get_json("issues", params={"page": 1}), [1]
+        )
+        self.session.return_value = make_response(304)
+        self.assertEqual(
+            self.client.get_json("issues", params={"page": 1}), [1]
+        )
+        headers = self.session.call_args.kwargs["headers"]
+        self.assertEqual(
+            headers, {"If-None-Match": "x", "If-Modified-Since": "y"}
+        )
+        self.session.return_value = make_response(200, [2])
+        self.assertEqual(
+            self.client.get_json(
+                "issues", params={"page": 1}, use_cache=False
+            ),
+            [2],
+        )
+
+    def test_cache_load(self):
+        """Missing or mismatched entries aren't used."""
+        self.assertIsNone(self.cache.load("https://api.test/missing"))
+        self.cache.store("https://api.test/a", {}, [])
+        with mock.patch.object(
+            self.cache,
+            "_path",
+            return_value=self.cache._path("https://api.test/a"),
+        ):
+            self.assertIsNone(self.cache.load("https://api.test/b"))
+
+    def test_iter_paginated_last(self):
+        """Pages up to the last one are fetched concurrently, in order."""
+
+        def respond(method, url, **kwargs):
+            """Answer a page request."""
+            page = int(url.split("page=")[1].split("&")[0])
+            links = (
+                {"last": "https://api.test/issues?page=3"}
+                if page == 1
+                else None
+            )
+            return make_response(200, [page], links=links)
+
+        self.session.side_effect = respond
+        self.assertEqual(list(self.client.iter_paginated("issues")), [1, 2, 3])
+
+    def test_iter_paginated_next(self):
+        """Listings only advertising the next page are followed serially."""
+        self.session.side_effect = [
+            make_response(
+                200, [1], links={"next": "https://api.test/issues?x=1"}
+            ),
+            make_response(200, [2]),
+        ]
+        self.assertEqual(
+            list(self.client.iter_paginated("issues", use_cache=False)), [1, 2]
+        )
+        self.assertIsNone(
+            github_client._page_number("https://api.test/issues")
+        )
+
+
+class IssueFunctionsTest(unittest.TestCase):
+    """Tests for the module-level helpers."""
+
+    def setUp(self):
+        """Replace the shared client."""
+        self.client = mock.Mock()
+        mock.patch.object(
+            github_client, "get_github_client", return_value=self.client
+        ).start()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        mock.patch.object(
+            github_client,
+            "cache_path",
+            lambda *parts: "/".join((directory.name,) + parts),
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_get_changed_issues(self):
+        """Only issues updated since the last poll are returned."""
+        issues = [
+            {"number": 1, "updated_at": "a"},
+            {"number": 2, "updated_at": "b"},
+        ]
+        self.client.iter_paginated.return_value = iter(issues)
+        self.assertEqual(github_client.get_changed_issues(), issues)
+        issues[1] = {"number": 2, "updated_at": "c"}
+        self.client.iter_paginated.return_value = iter(issues)
+        self.assertEqual(github_client.get_changed_issues(), [issues[1]])
+        self.client.iter_paginated.return_value = iter(issues)
+        self.assertEqual(
+            github_client.get_changed_issues(since="2024"), issues
+        )
+
+    def test_issue_and_comment(self):
+        """Single issues and comments go through the shared client."""
+        github_client.get_github_issue(3)
+        self.client.get_json.assert_called_once()
+        github_client.post_github_comment(3, "hi")
+        self.assertEqual(
+            self.client.post.call_args.kwargs["json"], {"body": "hi"}
+        )
+
+    def test_get_github_client(self):
+        """The shared client needs a token."""
+        mock.patch.stopall()
+        github_client.get_github_client.reset()
+        self.addCleanup(github_client.get_github_client.reset)
+        with mock.patch.dict("os.environ", {"GITHUB_ACCESS_TOKEN": ""}):
+            with self.assertRaises(ValueError):
+                github_client.get_github_client()
+        with mock.patch.dict(
+            "os.environ",
+            {"GITHUB_ACCESS_TOKEN": "t", "GITHUB_RESPONSE_CACHE": "1"},
+        ):
+            self.assertIsNotNone(github_client.get_github_client().cache)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+"""Tests for the GitHub connector lambda's cached and paginated requests."""
+
+import importlib.util
+import json
+import os
+import unittest
+from unittest import mock
+
+LAMBDA_PATH = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "lambdas",
+    "aind-github-connector",
+    "lambda_function.py",
+)
+
+
+def load_lambda():
+    """Import the lambda module, whose folder name isn't importable."""
+    spec = importlib.util.spec_from_file_location(
+        "github_connector", LAMBDA_PATH
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+connector = load_lambda()
+
+
+def response(body, status=200, links=None, etag=None):
+    """Fake requests response."""
+    content = json.dumps(body).encode()
+    return mock.Mock(
+        status_code=status,
+        json=mock.Mock(return_value=body),
+        content=content,
+        headers={"ETag": etag} if etag else {},
+        links={rel: {"url": url} for rel, url in (links or {}).items()},
+    )
+
+
+class ResponseCacheTest(unittest.TestCase):
+    """Tests for the lambda's response cache."""
+
+    def test_bounded_lru(self):
+        """Least recently used entries are dropped to stay under max_bytes."""
+        cache = connector.ResponseCache(max_bytes=10)
+        cache.put("a", "A", 4)
+        cache.put("b", "B", 4)
+        self.assertEqual(cache.get("a"), "A")
+        cache.put("c", "C", 4)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(
+            (cache.get("a"), cache.get("c"), cache.bytes), ("A", "C", 8)
+        )
+        cache.put("a", "A2", 2)
+        self.assertEqual((cache.get("a"), cache.bytes), ("A2", 6))
+        cache.put("huge", "H", 11)
+        self.assertIsNone(cache.get("huge"))
+
+
+class ConditionalGetTest(unittest.TestCase):
+    """Tests for conditional_get and paginated_get, with a fake session."""
+
+    def setUp(self):
+        """Use a fresh cache and a fake session answering from self.pages."""
+        self.pages = {}
+        self.session = mock.Mock()
+        self.session.get.side_effect = (
+            lambda url, params, headers, timeout: self.pages[
+                (params or {}).get("page")
+            ]
+        )
+        for patcher in (
+            mock.patch.object(
+                connector, "response_cache", connector.ResponseCache()
+            ),
+            mock.patch.object(
+                connector, "get_session", return_value=self.session
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_not_modified(self):
+        """Cached responses are revalidated and served again on a 304."""
+        self.pages[None] = response({"number": 1}, etag='"v1"')
+        self.assertEqual(
+            connector.conditional_get("repos/x/issues/1"), ({"number": 1}, {})
+        )
+        self.pages[None] = response(None, status=304)
+        self.assertEqual(
+            connector.conditional_get("repos/x/issues/1"), ({"number": 1}, {})
+        )
+        self.assertEqual(
+            self.session.get.call_args.kwargs["headers"],
+            {"If-None-Match": '"v1"'},
+        )
+
+    def test_last_link(self):
+        """Pages after the first are fetched up to the last link."""
+        last = "https://api.github.com/repos/x/issues?page=3"
+        self.pages.update(
+            {
+                1: response([1, 2], links={"next": "next", "last": last}),
+                2: response([3, 4]),
+                3: response([5]),
+            }
+        )
+        self.assertEqual(
+            connector.paginated_get("repos/x/issues"), [1, 2, 3, 4, 5]
+        )
+
+    def test_next_link(self):
+        """Listings without a last link are followed by their next links."""
+        self.pages.update(
+            {
+                1: response([1], links={"next": "page2"}),
+                2: response([2], links={"next": "page3"}),
+                3: response([3]),
+            }
+        )
+        self.assertEqual(
+            connector.paginated_get("repos/x/branches"), [1, 2, 3]
+        )
+
+
+class HandlerTest(unittest.TestCase):
+    """Tests for the lambda handler's routing."""
+
+    def event(self, method, path):
+        """Bedrock agent event."""
+        return {
+            "actionGroup": "github",
+            "apiPath": path,
+            "httpMethod": method,
+            "messageVersion": "1.0",
+            "parameters": [{"value": "7"}],
+        }
+
+    def test_routes(self):
+        """Paths are routed to their action, unknown ones are rejected."""
+        self.assertEqual(
+            connector.get_action("GET", "/issue/7"),
+            connector.Actions.GET_ONE_ISSUE,
+        )
+        self.assertIsNone(connector.get_action("GET", "/unknown"))
+        with mock.patch("builtins.print"):
+            self.assertEqual(
+                connector.lambda_handler(self.event("PUT", "/issues"), None)[
+                    "statusCode"
+                ],
+                400,
+            )
+            self.assertEqual(
+                connector.lambda_handler(self.event("GET", "/unknown"), None)[
+                    "statusCode"
+                ],
+                400,
+            )
+
+    def test_get_issues(self):
+        """Responses are wrapped in the Bedrock agent format."""
+        with (
+            mock.patch.object(
+                connector, "paginated_get", return_value=[{"number": 7}]
+            ) as get,
+            mock.patch("builtins.print"),
+        ):
+            result = connector.lambda_handler(
+                self.event("GET", "/issues"), None
+            )
+        get.assert_called_once_with(
+            f"repos/{connector.REPO_NAME}/issues", params={"state": "open"}
+        )
+        body = result["response"]["responseBody"]["application/json"]["body"]
+        self.assertEqual(json.loads(body), [{"number": 7}])
+        self.assertEqual(result["response"]["httpStatusCode"], 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+"""Tests for the issue explorer stages."""
+
+import unittest
+from unittest import mock
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from aind_scicomp_nautilex import issue_explorer
+from aind_scicomp_nautilex.query_validation import QueryCheck
+from aind_scicomp_nautilex.tracing import Tracer
+
+ISSUE = {"number": 1, "title": "Wrong sex", "body": "Some records say M"}
+
+
+class FakeValidator:
+    """Validator rejecting queries on the field "bad"."""
+
+    def validate(self, query):
+        """Check a query."""
+        return QueryCheck(
+            query=query,
+            errors=["bad field"] if "bad" in query else [],
+            warnings=["slow"] if "slow" in query else [],
+        )
+
+
+def estimate(check):
+    """Count 3 matches for queries on "name", none otherwise."""
+    check.count, check.total = (3 if "name" in check.query else 0), 10
+    return check
+
+
+class ExploreIssuesTest(unittest.TestCase):
+    """Tests for explore_issues_with_bedrock, with fake Bedrock and DocDB."""
+
+    def setUp(self):
+        """Patch the model, DocDB and GitHub."""
+        self.model = FakeListChatModel(responses=[])
+        patches = {
+            "ChatBedrock": mock.Mock(return_value=self.model),
+            "get_bedrock_client": mock.Mock(),
+            "get_schema_index": mock.Mock(),
+            "QueryValidator": mock.Mock(return_value=FakeValidator()),
+            "get_schema_block": mock.Mock(return_value="schema"),
+            "pruned_schema_block": mock.Mock(return_value="pruned"),
+            "estimate_selectivity": estimate,
+            "count_clauses": mock.Mock(),
+            "sample_records": mock.Mock(return_value=[{"_id": "a"}]),
+            "post_github_comment": mock.Mock(),
+            # Traces aren't written
+            "Tracer": lambda name: Tracer(name, path=""),
+        }
+        for name, value in patches.items():
+            patcher = mock.patch.object(issue_explorer, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.post = patches["post_github_comment"]
+
+    def explore(self, responses, **kwargs):
+        """Explore ISSUE with the given model replies."""
+        self.model.responses = responses
+        with mock.patch("builtins.print"):
+            return issue_explorer.explore_issues_with_bedrock(
+                [ISSUE], "prompt", use_cache=False, **kwargs
+            )
+
+    def test_refined_query(self):
+        """Invalid and empty queries are refined, then analysis is posted."""
+        results = self.explore(
+            [
+                '{"query": {"bad": 1}}',
+                '{"query": {"slow": 1}}',
+                "{\"query\": \"{'name': 'x'}\"}",
+                "The analysis",
+            ],
+            prune_schema=True,
+        )
+        self.assertEqual(results, ["The analysis"])
+        self.post.assert_called_once_with(1, "The analysis")
+        issue_explorer.count_clauses.assert_called_once()
+        issue_explorer.sample_records.assert_called_once_with({"name": "x"})
+
+    def test_no_matching_query(self):
+        """The issue fails once every attempt matched nothing."""
+        self.assertEqual(
+            self.explore(
+                ['{"query": {"bad": 1}}'] * issue_explorer.MAX_QUERY_ATTEMPTS
+            ),
+            [None],
+        )
+        self.post.assert_not_called()
+
+    def test_cached_analysis(self):
+        """A cached analysis is replayed instead of generated."""
+        explorer = issue_explorer.IssueExplorer("prompt", use_cache=False)
+        state = {
+            "schema_block": "schema",
+            "query_len": 3,
+            "query_results": [],
+            "issue_content": "",
+        }
+        with (
+            mock.patch.object(
+                issue_explorer, "lookup", return_value=(True, "cached")
+            ),
+            mock.patch("builtins.print"),
+        ):
+            self.assertEqual(explorer.analyze(ISSUE, state), "cached")
+        self.assertEqual(
+            [name for name, _ in explorer.stages()],
+            ["query_generation", "db_execution", "analysis", "post"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+"""Tests for the issue solver stages."""
+
+import time
+import unittest
+from unittest import mock
+
+from aind_scicomp_nautilex import issue_solver
+from aind_scicomp_nautilex.bedrock_stream import StreamStats
+from aind_scicomp_nautilex.dry_run import (
+    DryRunReport,
+    MigrationScript,
+    RecordResult,
+)
+from aind_scicomp_nautilex.tracing import Tracer
+
+ISSUE = {"number": 1, "title": "Wrong sex", "body": "Some records say M"}
+SCRIPT = MigrationScript(source="", callback_name="fix")
+PASSING = DryRunReport(
+    SCRIPT,
+    [RecordResult("a", "changed", diff=[("subject.sex", "'M' -> 'Male'")])],
+)
+FAILING = DryRunReport(SCRIPT, [RecordResult("a", "error", "KeyError")])
+
+
+def stream(bedrock, model_id, body, on_code, on_first_token):
+    """Stream a script numbered after the conversation's length."""
+    stats = StreamStats(started=time.monotonic())
+    stats.first_token = stats.started
+    on_first_token(stats)
+    script = f"# attempt {len(body['messages'])}\n"
+    on_code(script)
+    return f"```python\n{script}```", script, stats
+
+
+class AnalyzeIssuesTest(unittest.TestCase):
+    """Tests for analyze_issues_with_bedrock, with fakes and dry runs."""
+
+    def setUp(self):
+        """Patch Bedrock, the dry runs and GitHub."""
+        self.dry_run = mock.Mock(return_value=PASSING)
+        self.create_pr = mock.Mock()
+        patches = {
+            "get_bedrock_client": mock.Mock(),
+            "get_rate_limiter": mock.Mock(),
+            "build_system_blocks": mock.Mock(
+                return_value=[{"text": "schema"}, {"text": "prompt"}]
+            ),
+            "pruned_schema_block": mock.Mock(return_value="pruned"),
+            "PullRequestBuilder": mock.Mock(),
+            "stream_message": stream,
+            "dry_run_source": self.dry_run,
+            "create_pr_with_script": self.create_pr,
+            # Traces aren't written
+            "Tracer": lambda name: Tracer(name, path=""),
+        }
+        for name, value in patches.items():
+            patcher = mock.patch.object(issue_solver, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def solve(self, **kwargs):
+        """Solve ISSUE."""
+        with mock.patch("builtins.print"):
+            return issue_solver.analyze_issues_with_bedrock(
+                [ISSUE], "prompt", use_cache=False, **kwargs
+            )
+
+    def test_passing_script(self):
+        """A script passing its dry run gets a PR."""
+        self.assertEqual(self.solve(prune_schema=True), ["# attempt 1\n"])
+        self.assertIn(
+            "1 changed", self.create_pr.call_args.kwargs["dry_run_summary"]
+        )
+
+    def test_regenerated_script(self):
+        """Failing scripts are regenerated with the dry run's problems."""
+        self.dry_run.side_effect = [FAILING, PASSING]
+        self.assertEqual(self.solve(), ["# attempt 3\n"])
+        self.assertEqual(self.dry_run.call_count, 2)
+
+    def test_failing_script(self):
+        """No PR is opened when every attempt fails its dry run."""
+        self.dry_run.return_value = FAILING
+        self.assertEqual(self.solve(), [None])
+        self.assertEqual(
+            self.dry_run.call_count, issue_solver.MAX_SCRIPT_ATTEMPTS
+        )
+        self.create_pr.assert_not_called()
+
+    def test_cached_script(self):
+        """A cached script is dry run again instead of regenerated."""
+        with mock.patch.object(
+            issue_solver, "lookup", return_value=(True, "# cached\n")
+        ):
+            self.assertEqual(self.solve(), ["# cached\n"])
+        self.dry_run.assert_called_once_with("# cached\n")
+
+
+class CreatePrTest(unittest.TestCase):
+    """Tests for create_pr_with_script."""
+
+    def test_files_and_body(self):
+        """The script goes in a timestamped folder."""
+        builder = mock.Mock()
+        issue_solver.create_pr_with_script(
+            "# run\n", 7, builder=builder, dry_run_summary="1 changed"
+        )
+        spec = builder.create.call_args.args[0]
+        (path,) = spec.files
+        self.assertRegex(path, r"^scripts/[^/]+/run\.py$")
+        self.assertTrue(spec.branch_name.startswith("fix/issue-7-"))
+        self.assertIn("Resolves #7", spec.body)
+        self.assertIn("## Dry run", spec.body)
+        with mock.patch.object(issue_solver, "PullRequestBuilder") as default:
+            issue_solver.create_pr_with_script("# run\n", 7)
+        self.assertEqual(
+            default.return_value.create.call_args.args[0].body, "Resolves #7"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,224 @@
+"""Tests for the DocDB tools."""
+
+import tempfile
+import unittest
+from unittest import mock
+
+from aind_scicomp_nautilex import lc_tools
+from aind_scicomp_nautilex.snapshot import (
+    Snapshot,
+    SnapshotClient,
+    write_snapshot,
+)
+from aind_scicomp_nautilex.tracing import Tracer
+
+RECORDS = [
+    {
+        "_id": str(i),
+        "name": f"record_{i}",
+        "subject": {"subject_id": str(i % 3)},
+    }
+    for i in range(50)
+]
+
+
+class LcToolsTest(unittest.TestCase):
+    """Tests for the tools, run against a local snapshot."""
+
+    def setUp(self):
+        """Point the tools at a snapshot of RECORDS, without caching."""
+        self.directory = tempfile.TemporaryDirectory()
+        write_snapshot(self.directory.name, RECORDS)
+        client = SnapshotClient(Snapshot(self.directory.name))
+        for patcher in (
+            mock.patch.object(lc_tools, "get_docdb_client", lambda: client),
+            mock.patch.object(lc_tools, "DOCDB_CACHE", False),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+
+    def test_query_docdb_is_bounded(self):
+        """The tool returns the total but only the first few records."""
+        result = lc_tools.query_docdb.invoke(input={"query": {}})
+        self.assertEqual(result["total"], 50)
+        self.assertEqual(len(result["records"]), lc_tools.QUERY_TOOL_LIMIT)
+
+    def test_query_docdb_filters(self):
+        """The total counts every match, not just the returned ones."""
+        result = lc_tools.query_docdb.invoke(
+            input={"query": {"subject.subject_id": "1"}}
+        )
+        self.assertEqual(result["total"], 17)
+        self.assertEqual(len(result["records"]), 17)
+
+    def test_iter_docdb_records_pages(self):
+        """Records are streamed page by page in _id order up to the limit."""
+        records = list(lc_tools.iter_docdb_records({}, batch_size=7, limit=30))
+        self.assertEqual(
+            [r["_id"] for r in records], sorted(r["_id"] for r in RECORDS)[:30]
+        )
+        self.assertEqual(len(list(lc_tools.iter_docdb_records({}))), 50)
+        with self.assertRaises(ValueError):
+            next(lc_tools.iter_docdb_records({}, batch_size=0))
+
+    def test_iter_docdb_records_short_pages(self):
+        """Pages cut short by the gateway don't end the iteration."""
+        client = lc_tools.get_docdb_client()
+        get_records = client._get_records
+        short = mock.Mock(
+            side_effect=lambda **kwargs: get_records(**{**kwargs, "limit": 3})
+        )
+        with mock.patch.object(client, "_get_records", short):
+            records = list(
+                lc_tools.iter_docdb_records(
+                    {"subject.subject_id": "1"}, batch_size=10
+                )
+            )
+        self.assertEqual(len({r["_id"] for r in records}), 17)
+        self.assertEqual(
+            short.call_args.kwargs["filter_query"]["$and"][1],
+            {"_id": {"$gt": records[-1]["_id"]}},
+        )
+
+    def test_iter_docdb_records_without_id(self):
+        """Records are paged by _id even when the projection leaves it out."""
+        records = list(
+            lc_tools.iter_docdb_records(
+                {}, projection={"_id": 0, "name": 1}, batch_size=20
+            )
+        )
+        self.assertEqual(len(records), 50)
+        self.assertEqual(records[0], {"name": "record_0"})
+
+    def test_footprint(self):
+        """The footprint counts, histograms and samples the matches."""
+        footprint = lc_tools.docdb_footprint(
+            {}, ["subject.subject_id"], sample_size=4
+        )
+        self.assertEqual(footprint["count"], 50)
+        self.assertEqual(
+            footprint["histograms"]["subject.subject_id"],
+            [
+                {"value": "0", "count": 17},
+                {"value": "1", "count": 17},
+                {"value": "2", "count": 16},
+            ],
+        )
+        # taken round-robin across the values of the field
+        self.assertEqual(footprint["sample_ids"], ["0", "1", "2", "3"])
+        self.assertEqual(
+            len(lc_tools.docdb_footprint({}, sample_size=3)["sample_ids"]), 3
+        )
+
+    def test_footprint_sample_is_bounded(self):
+        """Only the first matches are grouped into the sample."""
+        pipeline = lc_tools.build_footprint_pipeline({}, ["a"])
+        sample = pipeline[1]["$facet"]["sample"]
+        self.assertEqual(sample[0], {"$limit": lc_tools.FOOTPRINT_SAMPLE_SCAN})
+        with mock.patch.object(lc_tools, "FOOTPRINT_SAMPLE_SCAN", 3):
+            footprint = lc_tools.docdb_footprint({}, ["subject.subject_id"])
+        self.assertEqual(footprint["sample_ids"], ["0", "1", "2"])
+        self.assertEqual(footprint["count"], 50)
+
+    def test_fetched_estimates_size(self):
+        """Traced pages are measured from their first record."""
+        tracer = Tracer("test", path="")
+        with tracer.span("db_execution") as span:
+            lc_tools._fetched(RECORDS[:10])
+            lc_tools._fetched([])
+            lc_tools._fetched({"count": 3})
+        self.assertGreater(span.counters["bytes"], 10 * len("record_0"))
+        self.assertEqual(lc_tools._fetched([1]), [1])
+
+    def test_retrieve_and_count(self):
+        """Queries sent as text are parsed before they run."""
+        records = lc_tools.retrieve_docdb_records(
+            '{"subject.subject_id": "2"}', {"name": 1}
+        )
+        self.assertEqual(len(records), 16)
+        self.assertEqual(
+            lc_tools.count_docdb.invoke(
+                input={"query": {"subject.subject_id": "2"}}
+            ),
+            16,
+        )
+        footprint = lc_tools.footprint_docdb.invoke(
+            input={"query": {}, "fields": ["subject.subject_id"]}
+        )
+        self.assertEqual(footprint["count"], 50)
+
+    def test_query_docdb_is_cached(self):
+        """Repeated and equivalent tool calls are served by the query cache."""
+        client = lc_tools.get_docdb_client()
+        lc_tools.get_query_cache.reset()
+        self.addCleanup(lc_tools.get_query_cache.reset)
+        with (
+            mock.patch.object(lc_tools, "DOCDB_CACHE", True),
+            mock.patch.object(
+                client, "_get_records", wraps=client._get_records
+            ) as get_records,
+            mock.patch.object(
+                client, "_count_records", wraps=client._count_records
+            ) as count_records,
+        ):
+            first = lc_tools.query_docdb.invoke(
+                input={
+                    "query": {"subject.subject_id": "1", "name": {"$ne": "x"}}
+                }
+            )
+            second = lc_tools.query_docdb.invoke(
+                input={
+                    "query": {"name": {"$ne": "x"}, "subject.subject_id": "1"}
+                }
+            )
+        self.assertEqual(first, second)
+        # the first call reads the 17 matches and the empty page after them
+        self.assertEqual(
+            (get_records.call_count, count_records.call_count), (2, 1)
+        )
+
+
+class ClientTest(unittest.TestCase):
+    """Tests for the lazily created client and cache."""
+
+    def setUp(self):
+        """Create fresh resources in every test."""
+        for getter in (lc_tools.get_docdb_client, lc_tools.get_query_cache):
+            getter.reset()
+            self.addCleanup(getter.reset)
+
+    def test_docdb_client(self):
+        """The API client is created once and served as ``lc_tools.client``."""
+        with mock.patch.object(lc_tools, "MetadataDbClient") as client:
+            self.assertIs(lc_tools.client, client.return_value)
+            self.assertIs(lc_tools.get_docdb_client(), client.return_value)
+        client.assert_called_once_with(
+            host=lc_tools.API_GATEWAY_HOST,
+            database=lc_tools.DATABASE,
+            collection=lc_tools.COLLECTION,
+        )
+        with self.assertRaises(AttributeError):
+            lc_tools.missing
+
+    def test_snapshot_client(self):
+        """A configured snapshot is queried instead of DocDB."""
+        with tempfile.TemporaryDirectory() as directory:
+            write_snapshot(directory, RECORDS)
+            with mock.patch.object(lc_tools, "DOCDB_SNAPSHOT", directory):
+                self.assertIsInstance(
+                    lc_tools.get_docdb_client(), SnapshotClient
+                )
+
+    def test_cached_query(self):
+        """Equivalent calls are only computed once."""
+        compute = mock.Mock(return_value=[1])
+        for _ in range(2):
+            self.assertEqual(
+                lc_tools.cached_query("records", compute, {"a": 1}), [1]
+            )
+        compute.assert_called_once_with()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""Tests for the cache of Bedrock generations."""
+
+import tempfile
+import unittest
+from unittest import mock
+
+from aind_scicomp_nautilex import llm_cache
+from aind_scicomp_nautilex.llm_cache import generation_key, lookup, store
+
+ISSUE = {
+    "number": 1,
+    "title": "Wrong sex",
+    "body": "Some records say M",
+    "labels": [],
+}
+
+
+class LlmCacheTest(unittest.TestCase):
+    """Tests for generation keys, lookups and stores."""
+
+    def setUp(self):
+        """Persist the cache in a temporary folder."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(
+            llm_cache, "cache_path", lambda name: f"{directory.name}/{name}"
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        llm_cache.get_llm_cache.reset()
+        self.addCleanup(llm_cache.get_llm_cache.reset)
+
+    def key(self, **changes):
+        """Key of a query generation for ISSUE."""
+        return generation_key(
+            "query_generation",
+            "model",
+            1,
+            "instructions",
+            "schema",
+            {**ISSUE, **changes},
+            [],
+        )
+
+    def test_generation_key(self):
+        """Keys change with the prompt but not with labels or comments."""
+        self.assertEqual(self.key(), self.key(labels=["bug"], comments=3))
+        self.assertNotEqual(self.key(), self.key(body="edited"))
+        self.assertNotEqual(
+            self.key(),
+            generation_key(
+                "analysis", "model", 1, "instructions", "schema", ISSUE, []
+            ),
+        )
+
+    def test_store_and_lookup(self):
+        """Stored generations are found again, unless the cache is bypassed."""
+        key = self.key()
+        self.assertEqual(lookup(key, use_cache=True), (False, None))
+        store(key, {"query": {}}, use_cache=False)
+        store(None, "ignored", use_cache=True)
+        self.assertEqual(lookup(key, use_cache=True), (False, None))
+        store(key, {"query": {}}, use_cache=True)
+        self.assertEqual(lookup(key, use_cache=True), (True, {"query": {}}))
+        self.assertEqual(lookup(key, use_cache=False), (False, None))
+        # Persisted across sessions
+        llm_cache.get_llm_cache.reset()
+        self.assertEqual(lookup(key, use_cache=True), (True, {"query": {}}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+"""Tests for local evaluation of MongoDB filters."""
+
+import re
+import unittest
+
+from aind_scicomp_nautilex.mongo_filter import (
+    compile_regex,
+    matches,
+    project,
+    resolve_path,
+    sort_key,
+)
+
+RECORD = {
+    "_id": "abc",
+    "name": "ecephys_731015_2024-01-01",
+    "flag": True,
+    "count": 3,
+    "subject": {"subject_id": "731015", "sex": "Male"},
+    "data_description": {
+        "modality": [{"abbreviation": "ecephys"}, {"abbreviation": "behavior"}]
+    },
+    "acquisition": {
+        "tiles": [
+            {"channel": {"channel_name": "488"}, "index": 0},
+            {"channel": {"channel_name": "561.0"}, "index": 1},
+        ],
+    },
+    "tags": ["a", "b"],
+    "matrix": [[1, 2], [3]],
+}
+
+
+class ResolvePathTest(unittest.TestCase):
+    """Tests for resolve_path."""
+
+    def test_nested(self):
+        """Paths go through documents and into every array element."""
+        self.assertEqual(
+            resolve_path(RECORD, "subject.subject_id"), ["731015"]
+        )
+        self.assertEqual(
+            resolve_path(RECORD, "acquisition.tiles.channel.channel_name"),
+            ["488", "561.0"],
+        )
+        self.assertEqual(
+            resolve_path(RECORD, "acquisition.tiles.1.index"), [1]
+        )
+        self.assertEqual(resolve_path(RECORD, "subject.missing"), [])
+        self.assertEqual(resolve_path(RECORD, "name.first"), [])
+
+
+class MatchesTest(unittest.TestCase):
+    """Tests for matches, one operator at a time."""
+
+    def assertMatches(self, query, expected=True):
+        """Check a query against RECORD."""
+        self.assertEqual(matches(RECORD, query), expected, query)
+
+    def test_equality(self):
+        """Literal values match equal values and array elements."""
+        self.assertMatches({})
+        self.assertMatches(None)
+        self.assertMatches({"subject.subject_id": "731015"})
+        self.assertMatches({"tags": "a"})
+        self.assertMatches({"tags": ["a", "b"]})
+        self.assertMatches({"subject.missing": None})
+        self.assertMatches(
+            {"subject": {"subject_id": "731015", "sex": "Male"}}
+        )
+        self.assertMatches({"flag": 1}, False)
+        self.assertMatches({"count": True}, False)
+        self.assertMatches({"name": re.compile("^ecephys")})
+
+    def test_comparisons(self):
+        """Comparisons only hold between comparable types."""
+        self.assertMatches({"count": {"$gt": 2, "$lte": 3}})
+        self.assertMatches({"count": {"$gte": 4}}, False)
+        self.assertMatches({"count": {"$lt": "4"}}, False)
+        self.assertMatches({"flag": {"$gt": False}})
+        self.assertMatches({"flag": {"$gt": 0}}, False)
+        self.assertMatches({"subject.sex": {"$gt": "A"}})
+        self.assertMatches({"subject": {"$gt": 1}}, False)
+        self.assertMatches({"missing": {"$gt": None}}, False)
+
+    def test_sets(self):
+        """$eq, $ne, $in, $nin and $all."""
+        self.assertMatches({"count": {"$eq": 3}})
+        self.assertMatches({"count": {"$ne": 3}}, False)
+        self.assertMatches(
+            {
+                "data_description.modality.abbreviation": {
+                    "$in": ["ecephys", "x"]
+                }
+            }
+        )
+        self.assertMatches({"tags": {"$nin": ["c"]}})
+        self.assertMatches({"tags": {"$all": ["a", "b"]}})
+        self.assertMatches({"tags": {"$all": ["a", "c"]}}, False)
+
+    def test_regex(self):
+        """$regex with $options, and $not."""
+        self.assertMatches(
+            {"acquisition.tiles.channel.channel_name": {"$regex": r"^\d+\.0$"}}
+        )
+        self.assertMatches(
+            {"subject.sex": {"$regex": "^male", "$options": "i"}}
+        )
+        self.assertMatches({"subject.sex": {"$regex": re.compile("^Ma")}})
+        self.assertMatches({"subject.sex": {"$not": "^F"}})
+        self.assertMatches({"subject.sex": {"$not": {"$in": ["Male"]}}}, False)
+        self.assertEqual(
+            compile_regex("a", "imsx").flags & re.IGNORECASE, re.IGNORECASE
+        )
+
+    def test_arrays(self):
+        """$elemMatch, $size and $exists."""
+        self.assertMatches(
+            {
+                "acquisition.tiles": {
+                    "$elemMatch": {"channel.channel_name": "488", "index": 0}
+                }
+            }
+        )
+        self.assertMatches(
+            {
+                "acquisition.tiles": {
+                    "$elemMatch": {"channel.channel_name": "488", "index": 1}
+                }
+            },
+            False,
+        )
+        self.assertMatches({"matrix": {"$elemMatch": {"$size": 1}}})
+        self.assertMatches(
+            {"tags": {"$elemMatch": {"$or": [{"x": 1}]}}}, False
+        )
+        self.assertMatches({"tags": {"$size": 2}})
+        self.assertMatches({"subject.sex": {"$exists": True}})
+        self.assertMatches({"subject.age": {"$exists": 0}})
+
+    def test_logical(self):
+        """$and, $or and $nor."""
+        self.assertMatches({"$and": [{"count": 3}, {"flag": True}]})
+        self.assertMatches({"$or": [{"count": 4}, {"flag": True}]})
+        self.assertMatches({"$nor": [{"count": 4}, {"flag": False}]})
+        self.assertMatches({"$and": [{"count": 4}]}, False)
+
+    def test_unsupported(self):
+        """Unknown operators are rejected."""
+        with self.assertRaises(ValueError):
+            matches(RECORD, {"$where": "1"})
+        with self.assertRaises(ValueError):
+            matches(RECORD, {"count": {"$mod": [2, 1]}})
+
+
+class ProjectTest(unittest.TestCase):
+    """Tests for project and sort_key."""
+
+    def test_inclusion(self):
+        """Inclusion projections copy the paths, through arrays."""
+        self.assertEqual(
+            project(
+                RECORD,
+                {
+                    "subject.sex": 1,
+                    "acquisition.tiles.index": 1,
+                    "missing.x": 1,
+                },
+            ),
+            {
+                "_id": "abc",
+                "subject": {"sex": "Male"},
+                "acquisition": {"tiles": [{"index": 0}, {"index": 1}]},
+            },
+        )
+        self.assertEqual(project(RECORD, {"count": 1, "_id": 0}), {"count": 3})
+        self.assertEqual(project(RECORD, {"count.x": 1}), {"_id": "abc"})
+        self.assertEqual(project(RECORD, None), RECORD)
+
+    def test_exclusion(self):
+        """Exclusion projections drop the paths."""
+        projected = project(
+            RECORD, {"acquisition.tiles.channel": 0, "matrix": 0, "_id": 0}
+        )
+        self.assertEqual(
+            projected["acquisition"], {"tiles": [{"index": 0}, {"index": 1}]}
+        )
+        self.assertNotIn("matrix", projected)
+        self.assertNotIn("_id", projected)
+        self.assertEqual(
+            project(RECORD, {"_id": 0}).keys(), RECORD.keys() - {"_id"}
+        )
+        self.assertEqual(project(RECORD, {"tags.x": 0})["tags"], ["a", "b"])
+
+    def test_sort_key(self):
+        """Mixed types sort by type first."""
+        records = [
+            {"v": "b"},
+            {"v": 2},
+            {},
+            {"v": {"x": 1}},
+            {"v": True},
+            {"v": 1.5},
+        ]
+        ordered = sorted(records, key=lambda record: sort_key(record, "v"))
+        self.assertEqual(
+            [record.get("v") for record in ordered],
+            [None, 1.5, 2, "b", {"x": 1}, True],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
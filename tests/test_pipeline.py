@@ -0,0 +1,98 @@
+"""Tests for the bounded-concurrency issue pipeline."""
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from aind_scicomp_nautilex.pipeline import run_pipeline
+
+ISSUES = [{"number": i, "title": f"Issue {i}", "body": ""} for i in range(6)]
+
+
+class RunPipelineTest(unittest.TestCase):
+    """Tests for run_pipeline."""
+
+    def test_stages_in_order(self):
+        """Stages get the previous result, outcomes keep the issue order."""
+        outcomes = run_pipeline(
+            ISSUES,
+            [
+                ("double", lambda issue, _: issue["number"] * 2),
+                ("add", lambda issue, doubled: doubled + 1),
+            ],
+            max_in_flight=3,
+        )
+        self.assertEqual(
+            [outcome.result for outcome in outcomes], [1, 3, 5, 7, 9, 11]
+        )
+        self.assertTrue(all(outcome.ok for outcome in outcomes))
+
+    def test_failures_are_isolated(self):
+        """A failing issue stops at its stage, the others carry on."""
+
+        def fail_odd(issue, _):
+            """Fail odd issues."""
+            if issue["number"] % 2:
+                raise RuntimeError("odd")
+            return issue["number"]
+
+        later = mock.Mock(side_effect=lambda issue, result: result)
+        with mock.patch("builtins.print"), mock.patch("traceback.print_exc"):
+            outcomes = run_pipeline(
+                ISSUES, [("check", fail_odd), ("later", later)]
+            )
+        self.assertEqual(
+            [outcome.failed_stage for outcome in outcomes], [None, "check"] * 3
+        )
+        self.assertIsInstance(outcomes[1].error, RuntimeError)
+        self.assertIsNone(outcomes[1].result)
+        self.assertEqual(later.call_count, 3)
+
+    def test_stage_limits(self):
+        """A stage limit caps how many issues run that stage at once."""
+        running, peak = [0], [0]
+        lock = threading.Lock()
+
+        def post(issue, _):
+            """Track concurrent calls."""
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+
+        run_pipeline(
+            ISSUES, [("post", post)], max_in_flight=6, stage_limits={"post": 1}
+        )
+        self.assertEqual(peak[0], 1)
+        with self.assertRaises(ValueError):
+            run_pipeline(ISSUES, [("post", post)], max_in_flight=0)
+
+    def test_checkpoint_and_tracer(self):
+        """Completed issues are skipped and every stage run is traced."""
+        checkpoint = mock.Mock()
+        checkpoint.resume.side_effect = lambda issue, stages: (
+            (1, "done") if issue["number"] == 0 else (0, None)
+        )
+        tracer = mock.MagicMock()
+        with mock.patch("builtins.print"):
+            outcomes = run_pipeline(
+                ISSUES[:2],
+                [("only", lambda issue, _: "new")],
+                checkpoint=checkpoint,
+                tracer=tracer,
+            )
+        self.assertEqual(
+            [(outcome.result, outcome.skipped) for outcome in outcomes],
+            [("done", True), ("new", False)],
+        )
+        checkpoint.record.assert_called_once_with(
+            ISSUES[1], "only", None, "new"
+        )
+        tracer.span.assert_called_once_with("only", issue=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+"""Tests for the shared schema context of the system prompts."""
+
+import unittest
+from unittest import mock
+
+from aind_scicomp_nautilex import prompts
+from aind_scicomp_nautilex.prompts import (
+    build_system_blocks,
+    load_schema_context,
+    prompt_caching,
+    pruned_schema_block,
+)
+
+SCHEMA_CONTEXT = """Model: Subject
+  - subject_id: str
+  - genotype: Optional[str]
+
+Model: Procedures
+  - subject_procedures: List[Surgery]
+
+Model: Surgery
+  - start_date: date"""
+
+
+class PromptsTest(unittest.TestCase):
+    """Tests for the schema blocks, built from a small context."""
+
+    def setUp(self):
+        """Load SCHEMA_CONTEXT instead of the packaged context files."""
+        contexts = {
+            "schema_context.txt": SCHEMA_CONTEXT,
+            "models_context.txt": "",
+        }
+        patcher = mock.patch.object(
+            prompts, "load_schema_context", side_effect=contexts.get
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for getter in (
+            prompts.get_schema_context,
+            prompts.get_models_context,
+            prompts.get_schema_block,
+            prompts.get_schema_index,
+        ):
+            getter.reset()
+            self.addCleanup(getter.reset)
+
+    def test_system_blocks(self):
+        """The schema block comes first and is the cache breakpoint."""
+        schema, task = build_system_blocks("Find the records", cache=True)
+        self.assertEqual(schema["cache_control"], {"type": "ephemeral"})
+        self.assertIn("Model: Subject", schema["text"])
+        self.assertEqual(task, {"type": "text", "text": "Find the records"})
+        self.assertNotIn(
+            "cache_control", build_system_blocks("x", cache=False)[0]
+        )
+        self.assertEqual(
+            build_system_blocks("x", schema_block="pruned")[0]["text"],
+            "pruned",
+        )
+        self.assertNotIn("cache_control", build_system_blocks("x")[0])
+
+    def test_prompt_caching(self):
+        """Only models Bedrock can cache prompts for get cache breakpoints."""
+        self.assertFalse(
+            prompt_caching("anthropic.claude-3-sonnet-20240229-v1:0")
+        )
+        self.assertTrue(
+            prompt_caching("anthropic.claude-3-7-sonnet-20250219-v1:0")
+        )
+        self.assertTrue(
+            prompt_caching("us.anthropic.claude-sonnet-4-20250514-v1:0")
+        )
+        with mock.patch.object(prompts, "PROMPT_CACHING", False):
+            self.assertFalse(
+                prompt_caching("anthropic.claude-3-7-sonnet-20250219-v1:0")
+            )
+
+    def test_schema_block_is_shared(self):
+        """The full block is built once, so it stays byte-for-byte equal."""
+        self.assertIs(prompts.get_schema_block(), prompts.get_schema_block())
+        self.assertEqual(prompts.SCHEMA_BLOCK, prompts.get_schema_block())
+        self.assertEqual(prompts.schema_context, SCHEMA_CONTEXT)
+        self.assertEqual(prompts.models_context, "")
+        with self.assertRaises(AttributeError):
+            prompts.missing
+
+    def test_pruned_schema_block(self):
+        """Only the models an issue touches are sent, or all if none match."""
+        block = pruned_schema_block(
+            "Some procedures.subject_procedures.start_date values are wrong"
+        )
+        self.assertIn("Model: Surgery", block)
+        self.assertNotIn("Model: Subject\n", block)
+        self.assertEqual(
+            pruned_schema_block("Nothing about the schema"),
+            prompts.get_schema_block(),
+        )
+
+    def test_packaged_context(self):
+        """The context files ship with the package."""
+        self.assertIn("Model:", load_schema_context("schema_context.txt"))
+
+
+if __name__ == "__main__":
+    unittest.main()
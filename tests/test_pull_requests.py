@@ -0,0 +1,95 @@
+"""Tests for single-commit pull request creation."""
+
+import unittest
+from unittest import mock
+
+from aind_scicomp_nautilex import pull_requests
+from aind_scicomp_nautilex.pull_requests import (
+    PullRequestBuilder,
+    PullRequestSpec,
+)
+
+
+def fake_client():
+    """GitHub client answering the Git Data API calls of one PR."""
+    client = mock.Mock()
+    client.get.side_effect = lambda path: mock.Mock(
+        json=mock.Mock(
+            return_value=(
+                {"default_branch": "main"}
+                if path.endswith("repo")
+                else {
+                    "commit": {
+                        "sha": "head",
+                        "commit": {"tree": {"sha": "tree"}},
+                    }
+                }
+            )
+        )
+    )
+    client.post.side_effect = lambda path, json: mock.Mock(
+        json=mock.Mock(
+            return_value={
+                "sha": path.rsplit("/", 1)[1],
+                "number": json.get("head"),
+            }
+        )
+    )
+    return client
+
+
+def spec(name):
+    """Spec adding two files on a branch."""
+    return PullRequestSpec(
+        files={
+            f"scripts/{name}/run.py": "x = 1\n",
+            f"scripts/{name}/ids.csv": "a\n",
+        },
+        branch_name=name,
+        title=f"Fix {name}",
+        body="Resolves #1",
+        commit_message="Add script",
+    )
+
+
+class PullRequestBuilderTest(unittest.TestCase):
+    """Tests for PullRequestBuilder."""
+
+    def test_create(self):
+        """Every file goes in one tree and one commit on the default branch."""
+        client = fake_client()
+        builder = PullRequestBuilder("owner", "repo", client=client)
+        self.assertEqual(builder.create(spec("fix-1"))["number"], "fix-1")
+        paths = [call.args[0] for call in client.post.call_args_list]
+        self.assertEqual(
+            paths,
+            [
+                f"repos/owner/repo/git/{kind}"
+                for kind in ("trees", "commits", "refs")
+            ]
+            + ["repos/owner/repo/pulls"],
+        )
+        tree, commit, ref, pull = (
+            call.kwargs["json"] for call in client.post.call_args_list
+        )
+        self.assertEqual((tree["base_tree"], len(tree["tree"])), ("tree", 2))
+        self.assertEqual(commit["parents"], ["head"])
+        self.assertEqual(ref, {"ref": "refs/heads/fix-1", "sha": "commits"})
+        self.assertEqual(pull["base"], "main")
+
+    def test_create_many(self):
+        """The default branch is looked up once for every PR."""
+        client = fake_client()
+        builder = PullRequestBuilder("owner", "repo", client=client)
+        created = builder.create_many([spec("a"), spec("b"), spec("c")])
+        self.assertEqual([pull["number"] for pull in created], ["a", "b", "c"])
+        self.assertEqual(client.get.call_count, 2)
+
+    def test_shared_client(self):
+        """The shared GitHub client is used by default."""
+        with mock.patch.object(pull_requests, "get_github_client") as shared:
+            self.assertIs(PullRequestBuilder().client, shared.return_value)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+"""Tests for the DocDB query result cache."""
+
+import json
+import os
+import re
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from aind_scicomp_nautilex import query_cache
+from aind_scicomp_nautilex.query_cache import (
+    QueryCache,
+    cache_key,
+    canonical_pipeline,
+    canonical_query,
+    canonicalize,
+    parse_query,
+)
+
+
+class CanonicalTest(unittest.TestCase):
+    """Tests for parse_query and the canonical forms."""
+
+    def test_parse_query(self):
+        """Queries sent as JSON or Python text are parsed."""
+        self.assertEqual(parse_query('{"a": true}'), {"a": True})
+        self.assertEqual(parse_query("{'a': True}"), {"a": True})
+        self.assertEqual(parse_query({"a": 1}), {"a": 1})
+
+    def test_canonicalize_keeps_key_order(self):
+        """Values are normalized but documents keep their order."""
+        self.assertEqual(
+            canonicalize({"b": (1.0, 2.5), "a": re.compile("x", re.I | re.M)}),
+            {"b": [1, 2.5], "a": {"$options": "im", "$regex": "x"}},
+        )
+        self.assertEqual(list(canonicalize({"b": 1, "a": 2})), ["b", "a"])
+        self.assertNotEqual(
+            cache_key({"$sort": {"b": 1, "a": -1}}),
+            cache_key({"$sort": {"a": -1, "b": 1}}),
+        )
+
+    def test_canonical_query(self):
+        """Fields and operators are sorted, literal documents aren't."""
+        self.assertEqual(
+            cache_key(
+                canonical_query(
+                    {
+                        "b": {"$lt": 5, "$gt": 1},
+                        "a": re.compile("^x"),
+                        "$or": [{"d": 1, "c": 2}],
+                    }
+                )
+            ),
+            cache_key(
+                canonical_query(
+                    {
+                        "$or": [{"c": 2, "d": 1.0}],
+                        "a": {"$regex": "^x", "$options": ""},
+                        "b": {"$gt": 1, "$lt": 5},
+                    }
+                )
+            ),
+        )
+        self.assertNotEqual(
+            cache_key(canonical_query({"s": {"a": 1, "b": 2}})),
+            cache_key(canonical_query({"s": {"b": 2, "a": 1}})),
+        )
+        self.assertEqual(
+            list(
+                canonical_query(
+                    {"t": {"$elemMatch": {"y": 1, "x": {"$lt": 2, "$gt": 0}}}}
+                )["t"]["$elemMatch"]["x"]
+            ),
+            ["$gt", "$lt"],
+        )
+        self.assertEqual(
+            list(
+                canonical_query({"t": {"$elemMatch": {"$lt": 2, "$gt": 0}}})[
+                    "t"
+                ]["$elemMatch"]
+            ),
+            ["$gt", "$lt"],
+        )
+        self.assertEqual(
+            list(
+                canonical_query({"t": {"$not": {"$lt": 2, "$gt": 0}}})["t"][
+                    "$not"
+                ]
+            ),
+            ["$gt", "$lt"],
+        )
+        self.assertEqual(
+            canonical_query({"$expr": {"b": 1, "a": 2}}),
+            {"$expr": {"b": 1, "a": 2}},
+        )
+        self.assertEqual(canonical_query("{}"), "{}")
+
+    def test_canonical_pipeline(self):
+        """Only $match filters are sorted in a pipeline."""
+        pipeline = canonical_pipeline(
+            [{"$match": {"b": 1, "a": 2}}, {"$sort": {"b": 1, "a": 1}}]
+        )
+        self.assertEqual(
+            [list(stage.values())[0] for stage in pipeline],
+            [{"a": 2, "b": 1}, {"b": 1, "a": 1}],
+        )
+        self.assertEqual(list(pipeline[1]["$sort"]), ["b", "a"])
+        self.assertIsNone(canonical_pipeline(None))
+
+
+class QueryCacheTest(unittest.TestCase):
+    """Tests for QueryCache."""
+
+    def test_hits_and_copies(self):
+        """Hits hand back fresh copies and are counted."""
+        cache = QueryCache()
+        compute = mock.Mock(return_value=[{"a": 1}])
+        first = cache.get_or_compute("k", compute)
+        first[0]["a"] = 2
+        self.assertEqual(cache.get_or_compute("k", compute), [{"a": 1}])
+        compute.assert_called_once()
+        self.assertEqual(cache.report()["hit_rate"], 0.5)
+        cache.clear()
+        self.assertEqual(cache.get("k"), (False, None))
+        self.assertEqual(query_cache.CacheStats().hit_rate, 0.0)
+
+    def test_eviction_and_expiry(self):
+        """Entries are evicted beyond max_bytes and expire after the TTL."""
+        cache = QueryCache(max_bytes=10)
+        cache.put("a", "1234")
+        cache.put("b", "1234")
+        cache.put("too big", "x" * 20)
+        self.assertEqual(cache.get("a"), (False, None))
+        self.assertEqual(cache.get("b"), (True, "1234"))
+        self.assertEqual(cache.stats.evictions, 1)
+        expired = QueryCache(ttl=-1)
+        expired.put("a", 1)
+        self.assertEqual(expired.get("a"), (False, None))
+        self.assertEqual(expired.stats.expired, 1)
+
+    def test_persisted(self):
+        """Persisted entries survive a new cache, pruned to max_bytes."""
+        with tempfile.TemporaryDirectory() as directory:
+            cache = QueryCache(directory=directory)
+            cache.put("a", [1, 2])
+            cache.put("b", [3])
+            self.assertEqual(
+                QueryCache(directory=directory).get("a"), (True, [1, 2])
+            )
+            reloaded = QueryCache(directory=directory)
+            self.assertEqual(reloaded.get("b"), (True, [3]))
+            self.assertEqual(reloaded.get("b"), (True, [3]))
+            self.assertEqual(reloaded.stats.disk_hits, 1)
+            self.assertEqual(reloaded.get("missing"), (False, None))
+            with open(os.path.join(directory, "c.json"), "w") as f:
+                json.dump({"expires": 0, "text": "1"}, f)
+            self.assertEqual(reloaded.get("c"), (False, None))
+            self.assertFalse(os.path.exists(os.path.join(directory, "c.json")))
+            os.mkdir(os.path.join(directory, "sub.json"))
+            with mock.patch("os.unlink", side_effect=OSError):
+                QueryCache(max_bytes=0, directory=directory)
+                reloaded._discard("a")
+            pruned = QueryCache(max_bytes=0, directory=directory)
+            self.assertEqual(pruned.stats.evictions, 2)
+        QueryCache(directory=os.path.join(directory, "missing"))
+
+    def test_concurrent_puts(self):
+        """The file on disk holds the result cached last."""
+        with tempfile.TemporaryDirectory() as directory:
+            cache = QueryCache(directory=directory)
+            written = []
+            write_atomic = query_cache.write_atomic
+
+            def record(path, text):
+                """Check the lock is held while writing."""
+                written.append(cache._lock.locked())
+                write_atomic(path, text)
+
+            with mock.patch.object(query_cache, "write_atomic", record):
+                threads = [
+                    threading.Thread(target=cache.put, args=("k", i))
+                    for i in range(8)
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            self.assertTrue(all(written))
+            self.assertEqual(
+                QueryCache(directory=directory).get("k"), cache.get("k")
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+"""Tests for the manual query script."""
+
+import importlib
+import io
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+from aind_scicomp_nautilex import lc_tools
+from aind_scicomp_nautilex.snapshot import (
+    Snapshot,
+    SnapshotClient,
+    write_snapshot,
+)
+
+
+class QueryTesterTest(unittest.TestCase):
+    """Tests for query_tester, run against a local snapshot."""
+
+    def test_prints_response(self):
+        """The bounded tool response is printed."""
+        with tempfile.TemporaryDirectory() as directory:
+            write_snapshot(
+                directory,
+                [{"_id": "1", "data_description": {"project_name": "Other"}}],
+            )
+            client = SnapshotClient(Snapshot(directory))
+            output = io.StringIO()
+            with (
+                mock.patch.object(
+                    lc_tools, "get_docdb_client", lambda: client
+                ),
+                mock.patch.object(lc_tools, "DOCDB_CACHE", False),
+                mock.patch.dict(sys.modules),
+                redirect_stdout(output),
+            ):
+                sys.modules.pop("aind_scicomp_nautilex.query_tester", None)
+                importlib.import_module("aind_scicomp_nautilex.query_tester")
+        self.assertEqual(
+            output.getvalue().strip(), str({"total": 0, "records": []})
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,220 @@
+"""Tests for checking generated DocDB queries against the schema."""
+
+import unittest
+from unittest import mock
+
+from aind_scicomp_nautilex import query_validation
+from aind_scicomp_nautilex.query_validation import (
+    QueryCheck,
+    QueryValidator,
+    check_path,
+    check_query,
+    count_clauses,
+    split_clauses,
+)
+from aind_scicomp_nautilex.schema_index import SchemaIndex
+
+CONTEXT = """Model: Metadata
+  - name: str
+  - location: str
+
+Model: Acquisition
+  - tiles: List[Tile]
+  - session_start_time: datetime
+  - extra: Dict[str, Any]
+
+Model: Tile
+  - channel: Channel
+  - file_name: Optional[str] (default=None)
+
+Model: Channel
+  - channel_name: str
+
+Model: Subject
+  - subject_id: str"""
+
+
+class CheckPathTest(unittest.TestCase):
+    """Tests for check_path."""
+
+    def setUp(self):
+        """Index CONTEXT."""
+        self.index = SchemaIndex.from_context(CONTEXT)
+
+    def test_valid_paths(self):
+        """Known paths pass, and array fields are noticed."""
+        self.assertEqual(
+            check_path(self.index, "acquisition.tiles.channel.channel_name"),
+            (None, True),
+        )
+        self.assertEqual(
+            check_path(self.index, "acquisition.tiles.0.file_name"),
+            (None, True),
+        )
+        self.assertEqual(
+            check_path(self.index, "subject.subject_id"), (None, False)
+        )
+        self.assertEqual(
+            check_path(self.index, "subject.schema_version"), (None, False)
+        )
+        self.assertEqual(
+            check_path(self.index, "acquisition.extra.anything"), (None, False)
+        )
+        self.assertEqual(check_path(self.index, "name"), (None, False))
+        self.assertEqual(check_path(self.index, "rig.cameras"), (None, False))
+
+    def test_invalid_paths(self):
+        """Unknown fields are reported with a suggestion."""
+        error, _ = check_path(self.index, "metadata.name")
+        self.assertIn("use 'name'", error)
+        error, _ = check_path(self.index, "subjct.subject_id")
+        self.assertIn("did you mean 'subject'", error)
+        error, _ = check_path(self.index, "subject.subjectid")
+        self.assertIn("did you mean 'subject_id'", error)
+        error, through_array = check_path(
+            self.index, "acquisition.tiles.channel.channel_name.x"
+        )
+        self.assertIn("is a str and has no field 'x'", error)
+        self.assertTrue(through_array)
+
+
+class QueryValidatorTest(unittest.TestCase):
+    """Tests for QueryValidator."""
+
+    def setUp(self):
+        """Validate against CONTEXT."""
+        self.validator = QueryValidator(SchemaIndex.from_context(CONTEXT))
+
+    def errors(self, query):
+        """Errors found in a query."""
+        return self.validator.validate(query).errors
+
+    def test_valid(self):
+        """Well-formed queries have no errors."""
+        query = {
+            "subject.subject_id": {"$in": ["1", "2"]},
+            "$or": [
+                {"name": {"$regex": "^ecephys", "$options": "i"}},
+                {"location": {"$exists": 1}},
+            ],
+            "acquisition.tiles": {
+                "$elemMatch": {"channel.channel_name": "488"},
+                "$size": 2,
+            },
+            "acquisition.session_start_time": {
+                "$not": {"$gt": "2024"},
+                "$exists": 0.0,
+            },
+            "acquisition.tiles.file_name": {
+                "$not": "^x",
+                "$elemMatch": {"$ne": None},
+            },
+            "acquisition.extra": {"a": 1},
+        }
+        self.assertEqual(self.errors(query), [])
+
+    def test_exists(self):
+        """$exists takes booleans and numbers, like MongoDB."""
+        for argument in (True, False, 0, 1, 1.0):
+            self.assertEqual(self.errors({"name": {"$exists": argument}}), [])
+        for argument in ("true", None, [1]):
+            self.assertIn(
+                "needs true, false or a number",
+                self.errors({"name": {"$exists": argument}})[0],
+            )
+
+    def test_malformed(self):
+        """Misspelled operators and malformed arguments are errors."""
+        self.assertIn("must be a JSON object", self.errors([])[0])
+        cases = [
+            ({"$and": []}, "needs a non-empty list"),
+            ({"$or": ["x"]}, "must be a filter object"),
+            ({"$where": "1"}, "Unsupported operator $where"),
+            ({"name": {"$regx": "a"}}, "did you mean '$regex'"),
+            ({"name": {"$in": "a"}}, "$in on 'name' needs a list"),
+            ({"name": {"$all": 1}}, "$all on 'name' needs a list"),
+            ({"name": {"$size": True}}, "needs an integer"),
+            ({"name": {"$regex": 1}}, "needs a string pattern"),
+            ({"name": {"$regex": "("}}, "not a valid pattern"),
+            (
+                {"name": {"$regex": "a", "$options": "q"}},
+                "must only use the letters",
+            ),
+            ({"name": {"$options": "i"}}, "only valid next to $regex"),
+            ({"name": {"$elemMatch": {}}}, "needs a filter object"),
+            ({"name": {"$not": 1}}, "needs an operator object or a regex"),
+            ({"name": {"$eq": 1, "x": 1}}, "mixes operators and field names"),
+            ({"subject.nam": 1}, "has no such field"),
+        ]
+        for query, error in cases:
+            self.assertIn(error, self.errors(query)[0], query)
+
+    def test_unanchored_regex_over_array(self):
+        """Unanchored regexes over arrays are a warning."""
+        check = self.validator.validate(
+            {"acquisition.tiles.channel.channel_name": {"$regex": "488"}}
+        )
+        self.assertEqual(check.errors, [])
+        self.assertIn("not anchored", check.warnings[0])
+
+
+class SelectivityTest(unittest.TestCase):
+    """Tests for counting queries and their clauses."""
+
+    def setUp(self):
+        """Count with a fake DocDB."""
+        counts = {
+            "{}": 100,
+            '{"name": "a"}': 5,
+            '{"subject.subject_id": "1"}': 0,
+        }
+
+        def count(query):
+            """Look up the count of a query."""
+            return counts.get(str(query).replace("'", '"'), 0)
+
+        patcher = mock.patch.object(
+            query_validation, "count_docdb_records", side_effect=count
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.index = SchemaIndex.from_context(CONTEXT)
+
+    def test_check_query(self):
+        """Valid queries are counted, invalid ones aren't."""
+        check = check_query({"name": "a"}, self.index)
+        self.assertEqual(
+            (check.count, check.total, check.selectivity), (5, 100, 0.05)
+        )
+        self.assertIn("matches 5 records", check.feedback())
+        self.assertIsNone(check_query({"nam": "a"}, self.index).count)
+        self.assertIsNone(
+            check_query({"name": "a"}, self.index, estimate=False).selectivity
+        )
+
+    def test_clauses(self):
+        """Clauses are split on $and and counted on their own."""
+        query = {"name": "a", "$and": [{"subject.subject_id": "1"}, "x"]}
+        self.assertEqual(
+            split_clauses(query), [{"name": "a"}, {"subject.subject_id": "1"}]
+        )
+        check = count_clauses(QueryCheck(query=query))
+        self.assertEqual([count for _, count in check.clauses], [5, 0])
+        self.assertIn("wrong path or value", check.feedback())
+        check.clauses = [({"name": "a"}, 5), ({"name": "b"}, 5)]
+        self.assertIn("too strict together", check.feedback())
+        self.assertEqual(
+            count_clauses(QueryCheck(query={"name": "a"})).clauses, []
+        )
+
+    def test_feedback(self):
+        """Errors and warnings are listed for the model."""
+        check = QueryCheck(query={}, errors=["bad"], warnings=["slow"])
+        self.assertFalse(check.ok)
+        self.assertEqual(
+            check.feedback(), "The query is invalid:\n- bad\nWarnings:\n- slow"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
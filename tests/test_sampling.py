@@ -0,0 +1,117 @@
+"""Tests for projection-aware sampling of query results."""
+
+import json
+import unittest
+from unittest import mock
+
+from aind_scicomp_nautilex import sampling
+from aind_scicomp_nautilex.sampling import (
+    build_projection,
+    estimate_size,
+    extract_filter_paths,
+    sample_records,
+)
+
+RECORDS = [
+    {
+        "_id": str(i),
+        "name": f"record_{i}",
+        "subject": {"subject_id": "x" * 100},
+    }
+    for i in range(20)
+]
+
+
+class ProjectionTest(unittest.TestCase):
+    """Tests for extract_filter_paths and build_projection."""
+
+    def test_extract_filter_paths(self):
+        """Paths are found through logical operators, $elemMatch and $not."""
+        query = {
+            "$or": [{"subject.sex": "M"}, {"name": {"$regex": "^x"}}],
+            "$comment": "ignored",
+            "acquisition.tiles": {
+                "$elemMatch": {"channel.channel_name": "488"}
+            },
+            "processing.steps": {
+                "$not": {"$elemMatch": {"name": "x"}},
+                "$size": 2,
+            },
+        }
+        self.assertEqual(
+            extract_filter_paths(query),
+            {
+                "subject.sex",
+                "name",
+                "acquisition.tiles",
+                "acquisition.tiles.channel.channel_name",
+                "processing.steps",
+                "processing.steps.name",
+            },
+        )
+
+    def test_build_projection(self):
+        """Indexes are dropped and nested paths collapse into their parents."""
+        projection = build_projection(
+            [
+                "acquisition.tiles.0.channel",
+                "acquisition.tiles",
+                "subject.sex",
+                "$bad",
+                "subject.sex.$",
+            ]
+        )
+        self.assertEqual(
+            projection,
+            {
+                "_id": 1,
+                "name": 1,
+                "location": 1,
+                "subject.sex": 1,
+                "acquisition.tiles": 1,
+            },
+        )
+
+
+class SampleTest(unittest.TestCase):
+    """Tests for estimate_size and sample_records."""
+
+    def test_estimate_size(self):
+        """Estimates are close to the JSON size and stop past the limit."""
+        record = {"a": [1, "two", (3.5, None)], "b": {"c": True}}
+        self.assertAlmostEqual(
+            estimate_size(record), len(json.dumps(record)), delta=10
+        )
+        self.assertLess(
+            estimate_size(RECORDS, limit=50), estimate_size(RECORDS)
+        )
+        self.assertGreater(estimate_size(RECORDS, limit=50), 50)
+
+    def test_sample_records(self):
+        """Records are added until the budget is full, always at least one."""
+        with mock.patch.object(
+            sampling,
+            "iter_docdb_records",
+            side_effect=lambda *a, **k: iter(RECORDS),
+        ) as records:
+            sample = sample_records(
+                {"subject.subject_id": {"$exists": True}}, budget_bytes=500
+            )
+            self.assertEqual(len(sample), 3)
+            self.assertEqual(
+                records.call_args.kwargs["projection"],
+                {"_id": 1, "name": 1, "location": 1, "subject.subject_id": 1},
+            )
+            self.assertEqual(
+                len(
+                    sample_records({}, budget_bytes=1, projection={"name": 1})
+                ),
+                1,
+            )
+            self.assertEqual(
+                len(sample_records({}, budget_bytes=10**6)), len(RECORDS)
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+"""Tests for the model-dependency index."""
+
+import unittest
+
+from aind_scicomp_nautilex.schema_index import SchemaIndex, parse_context
+
+CONTEXT = """Model: Acquisition
+  - tiles: List[Tile]
+  - session_start_time: datetime
+
+Model: Tile
+  - channel: Channel
+  - file_name: Optional[str] (default=None)
+
+Model: Channel
+  - channel_name: str
+  - laser_wavelength: int
+
+Model: Subject
+  - subject_id: str
+  - genotype: Optional[str]
+
+Model: MouseSubject(Subject)
+  - strain: Strain
+
+Model: Strain
+  - name: str
+
+not a model block"""
+
+
+class SchemaIndexTest(unittest.TestCase):
+    """Tests for SchemaIndex."""
+
+    def setUp(self):
+        """Index CONTEXT."""
+        self.index = SchemaIndex.from_context(CONTEXT)
+
+    def test_parse_context(self):
+        """Model blocks are parsed, anything else is skipped."""
+        models = parse_context(CONTEXT)
+        self.assertEqual(len(models), 6)
+        self.assertEqual(
+            models[4], ("MouseSubject", "Subject", ["strain: Strain"])
+        )
+
+    def test_references(self):
+        """Field types and parent classes are references."""
+        self.assertEqual(self.index.references["Acquisition"], {"Tile"})
+        self.assertEqual(
+            self.index.references["MouseSubject"], {"Subject", "Strain"}
+        )
+
+    def test_field_annotation(self):
+        """Annotations are found on parent classes too."""
+        self.assertEqual(
+            self.index.field_annotation("MouseSubject", "genotype"),
+            "Optional[str]",
+        )
+        self.assertEqual(
+            self.index.field_annotation("Tile", "file_name"), "Optional[str]"
+        )
+        self.assertIsNone(self.index.field_annotation("Tile", "missing"))
+        self.assertEqual(
+            self.index.field_names("MouseSubject"),
+            {"strain", "subject_id", "genotype"},
+        )
+
+    def test_diamond_inheritance(self):
+        """Shared parent classes are searched once."""
+        index = SchemaIndex(
+            [
+                ("Child", "Left", []),
+                ("Child", "Right", []),
+                ("Left", "Base", []),
+                ("Right", "Base", []),
+                ("Base", None, ["value: Child"]),
+            ]
+        )
+        self.assertEqual(index._field_type("Child", "missing"), set())
+        self.assertEqual(index.field_annotation("Child", "value"), "Child")
+
+    def test_resolve_path(self):
+        """Dotted paths are resolved field by field, skipping indexes."""
+        self.assertEqual(
+            self.index.resolve_path(
+                "acquisition.tiles.0.channel.channel_name"
+            ),
+            ["Acquisition", "Tile", "Channel"],
+        )
+        self.assertEqual(
+            self.index.resolve_path("acquisition.missing"), ["Acquisition"]
+        )
+        self.assertEqual(self.index.resolve_path("rig.cameras"), [])
+
+    def test_relevant_models_from_path(self):
+        """A dotted path selects the models along it and their references."""
+        self.assertEqual(
+            self.index.relevant_models(
+                "Fix acquisition.tiles.channel.channel_name values"
+            ),
+            ["Acquisition", "Channel", "Tile"],
+        )
+
+    def test_relevant_models_from_names(self):
+        """Model names, core files and distinctive fields are matched."""
+        self.assertEqual(
+            self.index.relevant_models("The strain of each subject"),
+            ["Strain", "Subject"],
+        )
+        self.assertEqual(
+            self.index.relevant_models("Wrong laser_wavelength"),
+            ["Acquisition", "Channel", "Tile"],
+        )
+        self.assertEqual(
+            self.index.relevant_models("mousesubject"),
+            ["MouseSubject", "Strain", "Subject"],
+        )
+        self.assertEqual(
+            self.index.relevant_models("rig.cameras nothing here"), []
+        )
+
+    def test_prune(self):
+        """The pruned context only contains the relevant models."""
+        pruned = self.index.prune("subject genotype")
+        self.assertEqual(
+            pruned,
+            "Model: Subject\n  - subject_id: str\n  - genotype: Optional[str]",
+        )
+        self.assertIn(
+            "Model: MouseSubject(Subject)", self.index.format(["MouseSubject"])
+        )
+        self.assertIsNone(self.index.prune("nothing relevant"))
+
+
+if __name__ == "__main__":
+    unittest.main()
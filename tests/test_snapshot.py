@@ -0,0 +1,296 @@
+"""Tests for local DocDB snapshots."""
+
+import os
+import stat
+import tempfile
+import unittest
+from unittest import mock
+
+from aind_scicomp_nautilex import snapshot as snapshot_module
+from aind_scicomp_nautilex.snapshot import (
+    Snapshot,
+    SnapshotClient,
+    create_snapshot,
+    write_snapshot,
+)
+from aind_scicomp_nautilex.storage import file_mode
+
+RECORDS = [
+    {
+        "_id": f"id-{i}",
+        "name": f"record_{i}",
+        "subject": {"subject_id": str(i % 3), "age": i},
+        "data_description": {
+            "project_name": "Thalamus" if i % 2 else "Cortex",
+            "modality": [{"abbreviation": "ecephys"}],
+        },
+        "tags": [{"k": i}],
+    }
+    for i in range(12)
+] + [{"_id": "bare", "name": "bare"}]
+
+
+class SnapshotTest(unittest.TestCase):
+    """Tests for querying a snapshot."""
+
+    def setUp(self):
+        """Write RECORDS as a snapshot."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        write_snapshot(self.directory.name, RECORDS, meta={"query": {}})
+        self.snapshot = Snapshot(self.directory.name)
+
+    def ids(self, records):
+        """The _ids of some records."""
+        return [record["_id"] for record in records]
+
+    def test_write(self):
+        """Records and metadata are written with the usual file permissions."""
+        self.assertEqual(self.snapshot.meta["records"], len(RECORDS))
+        path = os.path.join(self.directory.name, snapshot_module.RECORDS_FILE)
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), file_mode(path))
+        self.assertEqual(
+            os.listdir(self.directory.name).count(
+                snapshot_module.RECORDS_FILE
+            ),
+            1,
+        )
+
+    def test_failed_write(self):
+        """A failed write leaves the previous snapshot in place."""
+
+        def records():
+            """Fail halfway through."""
+            yield RECORDS[0]
+            raise RuntimeError("interrupted")
+
+        with self.assertRaises(RuntimeError):
+            write_snapshot(self.directory.name, records())
+        self.assertEqual(
+            len(Snapshot(self.directory.name).records), len(RECORDS)
+        )
+        self.assertFalse(
+            [
+                name
+                for name in os.listdir(self.directory.name)
+                if name.startswith(".tmp-")
+            ]
+        )
+
+    def test_indexed_find(self):
+        """Indexed equality and $in clauses narrow the records."""
+        found = self.snapshot.find(
+            {
+                "subject.subject_id": {"$in": ["1", "2"]},
+                "subject.age": {"$gt": 6},
+            }
+        )
+        self.assertEqual(self.ids(found), ["id-7", "id-8", "id-10", "id-11"])
+        found = self.snapshot.find(
+            {"$and": [{"name": {"$eq": "record_3"}}, {"subject.age": 3}]}
+        )
+        self.assertEqual(self.ids(found), ["id-3"])
+        self.assertEqual(
+            self.ids(self.snapshot.find({"subject.subject_id": None})),
+            ["bare"],
+        )
+        self.assertEqual(self.snapshot.count({"subject.subject_id": "0"}), 4)
+        self.assertIn(None, self.snapshot.index("subject.subject_id"))
+
+    def test_unindexed_find(self):
+        """Other filters are evaluated over the columnar batch."""
+        found = self.snapshot.find(
+            {"data_description.project_name": {"$regex": "^Thal"}},
+            projection={"name": 1},
+            sort={"subject.age": -1},
+            skip=1,
+            limit=2,
+        )
+        self.assertEqual(
+            found,
+            [
+                {"_id": "id-9", "name": "record_9"},
+                {"_id": "id-7", "name": "record_7"},
+            ],
+        )
+        self.assertEqual(self.snapshot.count({"subject.age": {"$gte": 10}}), 2)
+        self.assertEqual(self.snapshot.count(), len(RECORDS))
+        # Conditions that can't use the index fall back to the full filter
+        self.assertEqual(
+            len(self.snapshot.find({"name": {"$in": [{"a": 1}]}})), 0
+        )
+        self.assertEqual(
+            len(self.snapshot.find({"name": {"$ne": "bare"}})), 12
+        )
+        self.assertEqual(len(self.snapshot.find({"name": ["record_1"]})), 0)
+
+    def test_aggregate(self):
+        """Aggregations cover the stages the footprint pipeline uses."""
+        results = self.snapshot.aggregate(
+            [
+                {"$match": {"subject.age": {"$exists": True}}},
+                {
+                    "$group": {
+                        "_id": "$data_description.project_name",
+                        "count": {"$sum": 1},
+                        "ages": {"$push": "$subject.age"},
+                        "subjects": {"$addToSet": "$subject.subject_id"},
+                        "first": {"$first": "$name"},
+                        "youngest": {"$min": "$subject.age"},
+                        "oldest": {"$max": "$subject.age"},
+                        "mean": {"$avg": "$subject.age"},
+                        "none": {"$avg": "$missing"},
+                    }
+                },
+                {"$sort": {"_id": 1}},
+                {
+                    "$project": {
+                        "count": 1,
+                        "subjects": 1,
+                        "first": 1,
+                        "youngest": 1,
+                        "oldest": 1,
+                        "mean": 1,
+                        "none": 1,
+                        "few": {"$slice": ["$ages", 2]},
+                        "last": {"$slice": ["$ages", -1]},
+                    }
+                },
+            ]
+        )
+        self.assertEqual(
+            results[0],
+            {
+                "_id": "Cortex",
+                "count": 6,
+                "subjects": ["0", "2", "1"],
+                "first": "record_0",
+                "youngest": 0,
+                "oldest": 10,
+                "mean": 5.0,
+                "none": None,
+                "few": [0, 2],
+                "last": [10],
+            },
+        )
+        self.assertEqual(results[1]["_id"], "Thalamus")
+
+    def test_aggregate_stages(self):
+        """$facet, $count, $skip, $limit and computed projections."""
+        (result,) = self.snapshot.aggregate(
+            [
+                {
+                    "$facet": {
+                        "count": [{"$count": "n"}],
+                        "empty": [
+                            {"$match": {"name": "missing"}},
+                            {"$count": "n"},
+                        ],
+                        "page": [
+                            {"$skip": 2},
+                            {"$limit": 1},
+                            {
+                                "$project": {
+                                    "_id": 0,
+                                    "sub": {"id": "$subject.subject_id"},
+                                    "k": "$tags.k",
+                                    "n": {"$slice": ["$name", 1]},
+                                    "deep": "$name.first",
+                                }
+                            },
+                        ],
+                    }
+                },
+            ]
+        )
+        self.assertEqual(
+            result,
+            {
+                "count": [{"n": 13}],
+                "empty": [],
+                "page": [
+                    {"sub": {"id": "2"}, "k": [2], "n": None, "deep": None}
+                ],
+            },
+        )
+        self.assertEqual(len(self.snapshot.aggregate([])), len(RECORDS))
+        self.assertEqual(
+            self.snapshot.aggregate(
+                [{"$match": {"name": "bare"}}, {"$match": {}}]
+            )[0]["_id"],
+            "bare",
+        )
+
+    def test_unsupported_aggregations(self):
+        """Unknown stages, accumulators and expressions are rejected."""
+        for pipeline in (
+            [{"$unwind": "$tags"}],
+            [{"$group": {"_id": None, "x": {"$stdDevPop": "$subject.age"}}}],
+            [{"$project": {"x": {"$add": [1, 2]}}}],
+        ):
+            with self.assertRaises(ValueError):
+                self.snapshot.aggregate(pipeline)
+
+    def test_client(self):
+        """The client stand-in answers the calls the tools make."""
+        client = SnapshotClient(self.snapshot)
+        self.assertEqual(
+            len(
+                client._get_records(
+                    {"subject.subject_id": "1"}, limit=2, skip=1
+                )
+            ),
+            2,
+        )
+        self.assertEqual(
+            client._count_records({"subject.subject_id": "1"}),
+            {"total_record_count": 13, "filtered_record_count": 4},
+        )
+        self.assertEqual(
+            len(client.retrieve_docdb_records({}, limit=5, paginate=False)), 5
+        )
+        self.assertEqual(
+            client.aggregate_docdb_records([{"$count": "n"}]), [{"n": 13}]
+        )
+
+
+class CreateSnapshotTest(unittest.TestCase):
+    """Tests for dumping DocDB into a snapshot."""
+
+    def test_main(self):
+        """The command line dumps the projected records of a query."""
+        with (
+            tempfile.TemporaryDirectory() as directory,
+            mock.patch(
+                "aind_scicomp_nautilex.lc_tools.iter_docdb_records",
+                return_value=iter(RECORDS[:3]),
+            ) as records,
+            mock.patch("builtins.print") as printed,
+        ):
+            snapshot_module.main(
+                [
+                    directory,
+                    "--query",
+                    '{"name": "x"}',
+                    "--files",
+                    "subject",
+                    "--limit",
+                    "3",
+                ]
+            )
+            self.assertEqual(Snapshot(directory).meta["files"], ["subject"])
+        self.assertEqual(records.call_args.kwargs["projection"]["subject"], 1)
+        self.assertEqual(records.call_args.kwargs["limit"], 3)
+        self.assertIn("Saved 3 records", printed.call_args.args[0])
+        with (
+            tempfile.TemporaryDirectory() as directory,
+            mock.patch(
+                "aind_scicomp_nautilex.lc_tools.iter_docdb_records",
+                return_value=iter([]),
+            ),
+        ):
+            self.assertEqual(create_snapshot(directory).meta["query"], {})
+
+
+if __name__ == "__main__":
+    unittest.main()
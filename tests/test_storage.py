@@ -0,0 +1,55 @@
+"""Tests for the atomic file writes."""
+
+import os
+import stat
+import tempfile
+import unittest
+from unittest import mock
+
+from aind_scicomp_nautilex import storage
+
+
+class WriteAtomicTest(unittest.TestCase):
+    """Tests for write_atomic."""
+
+    def setUp(self):
+        """Work in a temporary folder."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "sub", "file.txt")
+
+    def mode(self):
+        """Permission bits of the written file."""
+        return stat.S_IMODE(os.stat(self.path).st_mode)
+
+    def test_new_file_mode(self):
+        """New files get 0o644 less the umask, not mkstemp's 0o600."""
+        storage.write_atomic(self.path, "one")
+        with open(self.path, encoding="utf-8") as f:
+            self.assertEqual(f.read(), "one")
+        self.assertEqual(self.mode(), 0o644 & ~storage._UMASK)
+
+    def test_keeps_existing_mode(self):
+        """Replacing a file keeps its permissions."""
+        storage.write_atomic(self.path, "one")
+        os.chmod(self.path, 0o640)
+        storage.write_atomic(self.path, "two")
+        self.assertEqual(self.mode(), 0o640)
+
+    def test_failed_write_leaves_no_temporary_file(self):
+        """The temporary file is removed if the write fails."""
+        with mock.patch.object(storage.os, "replace", side_effect=OSError):
+            with self.assertRaises(OSError):
+                storage.write_atomic(self.path, "one")
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), [])
+
+    def test_cache_path(self):
+        """Cache paths live under the cache directory."""
+        self.assertEqual(
+            storage.cache_path("a", "b"),
+            os.path.join(storage.CACHE_DIR, "a", "b"),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
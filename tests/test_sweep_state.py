@@ -0,0 +1,136 @@
+"""Tests for the sweep journal."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from aind_scicomp_nautilex import sweep_state
+from aind_scicomp_nautilex.pipeline import run_pipeline
+from aind_scicomp_nautilex.sweep_state import SweepState, issue_fingerprint
+
+ISSUE = {
+    "number": 7,
+    "title": "Wrong sex",
+    "body": "Some records say M",
+    "updated_at": "2024-01-01",
+}
+
+
+class SweepStateTest(unittest.TestCase):
+    """Tests for SweepState."""
+
+    def setUp(self):
+        """Journal in memory."""
+        self.state = SweepState("explore", path=":memory:")
+        self.addCleanup(self.state.close)
+
+    def test_fingerprint(self):
+        """Only edits of the title or body change the fingerprint."""
+        self.assertEqual(
+            issue_fingerprint(ISSUE),
+            issue_fingerprint({**ISSUE, "updated_at": "2025-01-01"}),
+        )
+        self.assertNotEqual(
+            issue_fingerprint(ISSUE),
+            issue_fingerprint({**ISSUE, "body": "edited"}),
+        )
+
+    def test_record_and_lookup(self):
+        """Stages are found for the version of the issue they completed for."""
+        self.assertEqual(self.state.lookup(ISSUE, "post"), (False, None))
+        self.state.record(ISSUE, "post", {"query": {}}, "posted")
+        self.assertEqual(self.state.lookup(ISSUE, "post"), (True, "posted"))
+        self.assertEqual(
+            self.state.lookup({**ISSUE, "title": "edited"}, "post"),
+            (False, None),
+        )
+        self.assertEqual(
+            SweepState("solve", path=":memory:").lookup(ISSUE, "post"),
+            (False, None),
+        )
+
+    def test_large_outputs_are_digested(self):
+        """Outputs over MAX_OUTPUT_CHARS are journaled as a digest."""
+        with mock.patch.object(sweep_state, "MAX_OUTPUT_CHARS", 10):
+            self.state.record(ISSUE, "analysis", None, "x" * 20)
+        (entry,) = self.state.history(7)
+        self.assertEqual(entry["output"]["chars"], 22)
+        self.assertIn("digest", entry["output"])
+        self.state.record(ISSUE, "solve", None, {"dry_run": object()})
+        self.assertEqual(
+            self.state.lookup(ISSUE, "solve")[1].keys(), {"digest", "chars"}
+        )
+
+    def test_resume(self):
+        """Issues restart after their last stage with a journaled output."""
+        stages = ["query_generation", "db_execution", "analysis", "post"]
+        self.assertEqual(self.state.resume(ISSUE, stages), (0, None))
+        self.state.record(ISSUE, "query_generation", None, {"query": {}})
+        self.state.record(
+            ISSUE, "db_execution", {"query": {}}, {"records": object()}
+        )
+        self.assertEqual(self.state.resume(ISSUE, stages), (1, {"query": {}}))
+        self.state.record(ISSUE, "analysis", None, "analysis")
+        self.assertEqual(self.state.resume(ISSUE, stages), (3, "analysis"))
+        self.state.record(ISSUE, "post", "analysis", "posted")
+        self.assertEqual(self.state.resume(ISSUE, stages), (4, "posted"))
+        self.assertEqual(
+            self.state.resume({**ISSUE, "body": "edited"}, stages), (0, None)
+        )
+
+    def test_history_and_forget(self):
+        """History lists the stages in order until they are forgotten."""
+        self.state.record(ISSUE, "query_generation", None, {"query": {}})
+        self.state.record(ISSUE, "post", {"query": {}}, "posted")
+        self.state.record({**ISSUE, "number": 8}, "post", None, "posted")
+        self.assertEqual(
+            [entry["stage"] for entry in self.state.history(7)],
+            ["query_generation", "post"],
+        )
+        self.state.forget(7)
+        self.assertEqual(self.state.history(7), [])
+        self.assertEqual(len(self.state.history(8)), 1)
+        self.state.forget()
+        self.assertEqual(self.state.history(8), [])
+
+    def test_resumed_sweep(self):
+        """A rerun sweep skips issues completed for their current version."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "state", "sweeps.sqlite")
+            stage = mock.Mock(return_value="posted")
+            with mock.patch("builtins.print"):
+                run_pipeline(
+                    [ISSUE],
+                    [("post", stage)],
+                    checkpoint=SweepState("explore", path=path),
+                )
+                outcomes = run_pipeline(
+                    [ISSUE, {**ISSUE, "number": 8}],
+                    [("post", stage)],
+                    checkpoint=SweepState("explore", path=path),
+                )
+            self.assertEqual(stage.call_count, 2)
+            self.assertEqual(
+                [outcome.skipped for outcome in outcomes], [True, False]
+            )
+
+    def test_interrupted_issue_resumes(self):
+        """An issue that failed at its last stage only reruns that stage."""
+        analyze = mock.Mock(return_value="analysis")
+        post = mock.Mock(
+            side_effect=[RuntimeError("GitHub is down"), "posted"]
+        )
+        stages = [("analysis", analyze), ("post", post)]
+        with mock.patch("builtins.print"), mock.patch("traceback.print_exc"):
+            self.assertFalse(
+                run_pipeline([ISSUE], stages, checkpoint=self.state)[0].ok
+            )
+            (outcome,) = run_pipeline([ISSUE], stages, checkpoint=self.state)
+        self.assertEqual((outcome.result, outcome.skipped), ("posted", False))
+        self.assertEqual(analyze.call_count, 1)
+        post.assert_called_with(ISSUE, "analysis")
+
+
+if __name__ == "__main__":
+    unittest.main()
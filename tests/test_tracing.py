@@ -0,0 +1,88 @@
+"""Tests for tracing sweeps."""
+
+import json
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from aind_scicomp_nautilex import tracing
+from aind_scicomp_nautilex.tracing import (
+    Tracer,
+    current_span,
+    propagate,
+    record,
+    traced,
+)
+
+
+class TracerTest(unittest.TestCase):
+    """Tests for Tracer and the span helpers."""
+
+    def test_nested_spans(self):
+        """Child spans inherit the issue, counters go to the current span."""
+        tracer = Tracer("explore", path="")
+        with tracer.span("db_execution", issue=3) as parent:
+            record(records=10)
+            with traced("truncation") as child:
+                record(bytes=100, records=None)
+            self.assertIs(current_span(), parent)
+        self.assertIsNone(current_span())
+        self.assertEqual((child.issue, child.parent_id), (3, parent.span_id))
+        self.assertEqual(
+            (parent.counters["records"], child.counters["bytes"]), (10, 100)
+        )
+        self.assertEqual(child.counters["records"], 0)
+        summary = tracer.summary()
+        self.assertIn("Sweep explore (not written)", summary)
+        self.assertIn("truncation", summary)
+
+    def test_outside_a_sweep(self):
+        """Helpers do nothing without a current span."""
+        record(bytes=1)
+        with traced("anything") as span:
+            self.assertIsNone(span)
+        self.assertIs(propagate(len), len)
+
+    def test_errors_and_file(self):
+        """Failed spans are marked and every span is appended to the file."""
+        with (
+            tempfile.TemporaryDirectory() as directory,
+            mock.patch.object(
+                tracing, "TRACE_DIR", os.path.join(directory, "traces")
+            ),
+        ):
+            tracer = Tracer("solve")
+            with self.assertRaises(ValueError):
+                with tracer.span("dry_run", issue=1):
+                    raise ValueError("bad script")
+            with tracer.span("pr_create", issue=1):
+                pass
+            with open(tracer.path) as f:
+                spans = [json.loads(line) for line in f]
+        self.assertEqual(
+            [span["name"] for span in spans], ["dry_run", "pr_create"]
+        )
+        self.assertEqual(
+            spans[0]["status"],
+            {"code": "ERROR", "message": "ValueError: bad script"},
+        )
+        self.assertEqual(spans[1]["attributes"]["sweep"], "solve")
+        self.assertIn(" 1 ", tracer.summary().splitlines()[3])
+
+    def test_propagate(self):
+        """Work handed to other threads records into the handing span."""
+        tracer = Tracer("explore", path="")
+        with (
+            tracer.span("query_generation") as span,
+            ThreadPoolExecutor(max_workers=2) as executor,
+        ):
+            list(
+                executor.map(propagate(lambda n: record(records=n)), [1, 2, 3])
+            )
+        self.assertEqual(span.counters["records"], 6)
+
+
+if __name__ == "__main__":
+    unittest.main()